@@ -1,26 +1,60 @@
 import os
 import logging
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Callable, Iterator, Tuple
 import re
 import time
+import json
+import hashlib
+import sqlite3
+import threading
+import contextvars
+import zlib
+import random
+import importlib.util
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
-# Импорт для GitHub Models API через Azure AI Inference
-try:
+import metrics
+import extractive
+
+# SDK серверов моделей импортируются при первом использовании: их загрузка занимает
+# сотни миллисекунд, а процессу может понадобиться только один из них или ни одного.
+# При импорте модуля проверяется лишь наличие пакетов.
+def _module_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
+
+# GitHub Models API через Azure AI Inference
+GITHUB_MODELS_AVAILABLE = _module_available("azure.ai.inference") and _module_available("azure.core")
+GROQ_AVAILABLE = _module_available("groq") and _module_available("httpx")
+
+# Типы клиентов для аннотаций; сами библиотеки загружаются при первом обращении
+if TYPE_CHECKING:
+    from groq import Groq
     from azure.ai.inference import ChatCompletionsClient
-    from azure.ai.inference.models import SystemMessage, UserMessage
-    from azure.core.credentials import AzureKeyCredential
-    GITHUB_MODELS_AVAILABLE = True
-except ImportError:
-    GITHUB_MODELS_AVAILABLE = False
 
-try:
+
+@lru_cache(maxsize=None)
+def _groq_sdk() -> SimpleNamespace:
     from groq import Groq
     import httpx
-    GROQ_AVAILABLE = True
-except ImportError as e:
-    GROQ_AVAILABLE = False
-    
+    return SimpleNamespace(Groq=Groq, httpx=httpx)
+
+
+@lru_cache(maxsize=None)
+def _azure_sdk() -> SimpleNamespace:
+    from azure.ai.inference import ChatCompletionsClient
+    from azure.ai.inference.models import SystemMessage, UserMessage
+    from azure.core.credentials import AzureKeyCredential
+    return SimpleNamespace(ChatCompletionsClient=ChatCompletionsClient, SystemMessage=SystemMessage,
+                           UserMessage=UserMessage, AzureKeyCredential=AzureKeyCredential)
+
+
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
@@ -28,6 +62,878 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('ReviewAnalyzer')
 
+# Среднее число символов на токен для токенизатора модели: (кириллица, прочие символы)
+CHARS_PER_TOKEN = {
+    "meta-llama/llama-4-scout-17b-16e-instruct": (2.6, 3.8),
+    "DeepSeek-V3-0324": (2.3, 3.6),
+}
+_DEFAULT_CHARS_PER_TOKEN = (2.3, 3.6)
+
+# Токены на префикс "Отзыв N: " и перевод строки
+_REVIEW_PREFIX_TOKENS = 5
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+# Пометка числа похожих отзывов, которую добавляет _collapse_near_duplicates
+_CLUSTER_SUFFIX_RE = re.compile(r" \(×(\d+)\)$")
+
+# Параметры поиска почти одинаковых отзывов (MinHash + LSH по основам слов)
+MINHASH_BANDS = 8
+MINHASH_ROWS = 2
+NEAR_DUPLICATE_THRESHOLD = 0.6
+# Короткие отзывы (до NEAR_DUPLICATE_SHORT_WORDS основ) объединяются только при большем сходстве:
+# в них одно лишнее слово меняет смысл
+NEAR_DUPLICATE_SHORT_WORDS = 4
+NEAR_DUPLICATE_SHORT_THRESHOLD = 0.75
+# Длинные отзывы сравниваются только на точное совпадение
+NEAR_DUPLICATE_MAX_WORDS = 30
+# Длина основы слова и слова-метки, которые не учитываются при сравнении
+_STEM_LENGTH = 5
+# Сколько групп одной LSH-корзины проверяется для нового отзыва
+_MAX_BUCKET_LEADERS = 32
+_LABEL_STEMS = {"плюсы", "минус", "досто", "недос", "комме"}
+# Частицы, которые присоединяются к следующему слову: "не подошел" и "подошел" - разные признаки
+_NEGATIONS = {"не", "нет"}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MINHASH_SEEDS = [
+    ((i * 0x9E3779B1 + 0x7F4A7C15) % _MERSENNE_PRIME | 1, (i * 0x85EBCA6B + 0xC2B2AE35) % _MERSENNE_PRIME)
+    for i in range(1, MINHASH_BANDS * MINHASH_ROWS + 1)
+]
+
+
+def _review_features(review: str) -> frozenset:
+    """
+    Множество основ слов отзыва (нормализация регистра, ё и пунктуации).
+    Отрицание присоединяется к следующему слову, как в extractive._tokens
+    """
+    features = set()
+    negation = ""
+    for word in _NON_WORD_RE.sub(" ", review.lower().replace("ё", "е")).split():
+        if word in _NEGATIONS:
+            negation = word + " "
+            continue
+        stem = word[:_STEM_LENGTH]
+        if len(word) < 2 or stem in _LABEL_STEMS:
+            continue
+        features.add(negation + stem)
+        negation = ""
+    if negation:
+        # Отрицание в конце отзыва ("Минусов нет") - отдельный признак
+        features.add(negation.strip())
+    return frozenset(features)
+
+
+def _differ_by_negation(first: frozenset, second: frozenset) -> bool:
+    """Отзывы отличаются только отрицанием ("подошел" и "не подошел") - у них противоположный смысл"""
+    return first != second and {f.split(" ", 1)[-1] for f in first} == {f.split(" ", 1)[-1] for f in second}
+
+
+def _near_duplicate_threshold(first: frozenset, second: frozenset) -> float:
+    """Минимальный коэффициент Жаккара для объединения двух отзывов"""
+    if min(len(first), len(second)) <= NEAR_DUPLICATE_SHORT_WORDS:
+        return NEAR_DUPLICATE_SHORT_THRESHOLD
+    return NEAR_DUPLICATE_THRESHOLD
+
+
+def _minhash_signature(features: frozenset) -> tuple:
+    """Детерминированная MinHash-сигнатура множества"""
+    hashes = [zlib.crc32(feature.encode("utf-8")) for feature in features]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _MINHASH_SEEDS)
+
+
+@lru_cache(maxsize=65536)
+def _estimate_tokens(text: str, model: str) -> int:
+    """Быстрая оценка числа токенов текста для модели (без загрузки токенизатора)"""
+    cyrillic_ratio, other_ratio = CHARS_PER_TOKEN.get(model, _DEFAULT_CHARS_PER_TOKEN)
+    # Не-ASCII символы в отзывах - практически всегда кириллица
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    other_chars = len(text) - ascii_chars
+    return int(other_chars / cyrillic_ratio + ascii_chars / other_ratio) + 1
+
+
+def _truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Обрезает текст примерно до max_tokens токенов"""
+    tokens = _estimate_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    max_chars = int(len(text) * (max_tokens - 1) / tokens)
+    return text[:max_chars].rstrip() + "..."
+
+
+class SqliteStore:
+    """
+    Базовый класс хранилищ в SQLite: отдельное соединение на поток, режим WAL
+    и ожидание блокировки, чтобы базу могли одновременно использовать несколько процессов.
+    """
+    
+    # Запросы создания таблиц, выполняются при первом обращении
+    SCHEMA: List[str] = []
+    # Добавление столбцов в таблицы, созданные прежними версиями; уже добавленные столбцы пропускаются
+    MIGRATIONS: List[str] = []
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение с базой для текущего потока"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    with connection:
+                        for statement in self.SCHEMA:
+                            connection.execute(statement)
+                        for statement in self.MIGRATIONS:
+                            try:
+                                connection.execute(statement)
+                            except sqlite3.OperationalError as e:
+                                if "duplicate column" not in str(e):
+                                    raise
+                    self._initialized = True
+        return connection
+
+
+class AnalysisCache(SqliteStore):
+    """
+    Постоянный кэш результатов анализа в SQLite.
+    Ключ - хэш отзывов, названия товара, версии промпта и модели, поэтому повторный
+    анализ товара с неизменившимися отзывами не требует запроса к модели.
+    """
+    
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS analyses ("
+        "key TEXT PRIMARY KEY, analysis TEXT NOT NULL, created_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses(created_at)",
+    ]
+    
+    def __init__(self, path: str, max_age: float, max_entries: int):
+        super().__init__(path)
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age > 0 and self.max_entries > 0
+
+    @staticmethod
+    def make_key(reviews: List[str], product_name: str, prompt_version: int, model: str) -> str:
+        """Стабильный отпечаток набора отзывов и параметров анализа"""
+        payload = json.dumps([prompt_version, model, product_name, reviews], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный анализ, если он есть и не устарел"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT analysis FROM analyses WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.max_age),
+            ).fetchone()
+            metrics.ANALYSIS_CACHE_REQUESTS.inc(result="hit" if row else "miss")
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка чтения кэша анализов: {str(e)}")
+            return None
+
+    def put(self, key: str, analysis: str) -> None:
+        """Сохраняет анализ и удаляет устаревшие и лишние записи"""
+        if not self.enabled:
+            return
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO analyses (key, analysis, created_at) VALUES (?, ?, ?)",
+                    (key, analysis, time.time()),
+                )
+                connection.execute("DELETE FROM analyses WHERE created_at < ?", (time.time() - self.max_age,))
+                connection.execute(
+                    "DELETE FROM analyses WHERE key IN ("
+                    "SELECT key FROM analyses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи в кэш анализов: {str(e)}")
+
+
+class ReviewHistoryStore(SqliteStore):
+    """
+    История анализов отслеживаемых товаров для инкрементального режима:
+    идентификаторы уже обработанных отзывов, дата самого нового отзыва на момент
+    анализа (watermark) и последний анализ по каждому товару.
+    """
+    
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS review_history ("
+        "product_key TEXT PRIMARY KEY, seen_ids TEXT NOT NULL, analysis TEXT NOT NULL, updated_at REAL NOT NULL, "
+        "watermark TEXT)",
+    ]
+    MIGRATIONS = ["ALTER TABLE review_history ADD COLUMN watermark TEXT"]
+
+    def get(self, product_key: str) -> Optional[Dict[str, Any]]:
+        """Возвращает {'seen_ids': set, 'analysis': str, 'updated_at': float, 'watermark': str} или None"""
+        try:
+            row = self._connection().execute(
+                "SELECT seen_ids, analysis, updated_at, watermark FROM review_history WHERE product_key = ?",
+                (product_key,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка чтения истории отзывов: {str(e)}")
+            return None
+        if not row:
+            return None
+        return {"seen_ids": set(json.loads(row[0])), "analysis": row[1], "updated_at": row[2], "watermark": row[3] or ""}
+
+    def save(self, product_key: str, seen_ids: set, analysis: str, watermark: str = "") -> None:
+        """Сохраняет обработанные отзывы, дату самого нового отзыва и актуальный анализ товара"""
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO review_history (product_key, seen_ids, analysis, updated_at, watermark) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (product_key, json.dumps(sorted(seen_ids)), analysis, time.time(), watermark),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи истории отзывов: {str(e)}")
+
+
+# Серверы моделей, между которыми распределяются запросы
+GROQ_BACKEND = "groq"
+GITHUB_BACKEND = "github"
+
+# Вид серверов моделей: remote - Groq и GitHub Models, stub - локальные заглушки
+LLM_BACKEND_KIND = os.environ.get("LLM_BACKEND", "remote")
+
+# Каталог баз SQLite по умолчанию (кэш анализов, история отзывов, задачи). Он находится вне
+# каталога приложения, чтобы базы не оказались среди файлов, доступных по HTTP
+DATA_DIR = os.environ.get("WB_ANALYZER_DATA_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "wb-analyzer"
+)
+
+# Анализы заглушек хранятся отдельно, чтобы не смешиваться с ответами настоящих моделей
+_DEFAULT_ANALYSIS_CACHE_PATH = os.path.join(
+    DATA_DIR, "analysis_cache.stub.sqlite3" if LLM_BACKEND_KIND == "stub" else "analysis_cache.sqlite3"
+)
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def _parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Разбирает длительность из заголовков лимитов ("7.66s", "2m59.56s", "120ms", "30") в секунды"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    multipliers = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * multipliers[unit] for number, unit in parts)
+
+
+def _take_from_buckets(state: Dict[str, List[float]], amounts: Dict[str, float],
+                       limits: Dict[str, float], now: float, take: bool) -> float:
+    """
+    Пополняет корзины токенов в state ({вид: [остаток, время обновления]}) и,
+    если take и всего хватает, списывает amounts.
+    Возвращает 0, если запрос помещается в лимиты, иначе - сколько секунд нужно подождать.
+    Лимиты заданы в единицах в минуту; лимит 0 означает отсутствие ограничения.
+    """
+    wait = 0.0
+    for kind, amount in amounts.items():
+        capacity = limits.get(kind, 0)
+        if capacity <= 0:
+            continue
+        available, updated_at = state.setdefault(kind, [capacity, now])
+        available = min(capacity, available + (now - updated_at) * capacity / 60)
+        state[kind] = [available, now]
+        needed = min(amount, capacity)
+        if available < needed:
+            wait = max(wait, (needed - available) * 60 / capacity)
+    if take and wait == 0:
+        for kind, amount in amounts.items():
+            if limits.get(kind, 0) > 0:
+                state[kind][0] -= amount
+    return wait
+
+
+class MemoryRateStore:
+    """Состояние лимитов в памяти процесса"""
+
+    def __init__(self):
+        self._state: Dict[str, Dict[str, List[float]]] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def try_take(self, backend: str, amounts: Dict[str, float], limits: Dict[str, float], take: bool = True) -> float:
+        now = time.time()
+        with self._lock:
+            blocked_until = self._blocked_until.get(backend, 0)
+            if blocked_until > now:
+                return blocked_until - now
+            return _take_from_buckets(self._state.setdefault(backend, {}), amounts, limits, now, take)
+
+    def adjust(self, backend: str, kind: str, delta: float, remaining: Optional[float] = None) -> None:
+        """Возвращает в корзину delta единиц и ограничивает остаток значением remaining от сервера"""
+        with self._lock:
+            bucket = self._state.setdefault(backend, {}).get(kind)
+            if bucket is None:
+                return
+            bucket[0] += delta
+            if remaining is not None:
+                bucket[0] = min(bucket[0], remaining)
+
+    def block(self, backend: str, until: float) -> None:
+        with self._lock:
+            self._blocked_until[backend] = max(self._blocked_until.get(backend, 0), until)
+
+
+class SqliteRateStore(SqliteStore):
+    """
+    Состояние лимитов в SQLite, общее для всех процессов, использующих один файл:
+    списание из корзин выполняется в транзакции BEGIN IMMEDIATE
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS llm_rate_state ("
+        "backend TEXT NOT NULL, kind TEXT NOT NULL, value REAL NOT NULL, updated_at REAL NOT NULL, "
+        "PRIMARY KEY (backend, kind))",
+    ]
+
+    def _load(self, connection: sqlite3.Connection, backend: str) -> Dict[str, List[float]]:
+        rows = connection.execute(
+            "SELECT kind, value, updated_at FROM llm_rate_state WHERE backend = ?", (backend,)
+        ).fetchall()
+        return {kind: [value, updated_at] for kind, value, updated_at in rows}
+
+    def _save(self, connection: sqlite3.Connection, backend: str, state: Dict[str, List[float]]) -> None:
+        connection.executemany(
+            "INSERT OR REPLACE INTO llm_rate_state (backend, kind, value, updated_at) VALUES (?, ?, ?, ?)",
+            [(backend, kind, value, updated_at) for kind, (value, updated_at) in state.items()],
+        )
+
+    def try_take(self, backend: str, amounts: Dict[str, float], limits: Dict[str, float], take: bool = True) -> float:
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._load(connection, backend)
+            blocked_until = state.pop("blocked_until", [0, 0])[0]
+            if blocked_until > now:
+                connection.rollback()
+                return blocked_until - now
+            wait = _take_from_buckets(state, amounts, limits, now, take)
+            self._save(connection, backend, state)
+            connection.commit()
+            return wait
+        except Exception:
+            connection.rollback()
+            raise
+
+    def adjust(self, backend: str, kind: str, delta: float, remaining: Optional[float] = None) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "UPDATE llm_rate_state SET value = value + ? WHERE backend = ? AND kind = ?",
+                (delta, backend, kind),
+            )
+            if remaining is not None:
+                connection.execute(
+                    "UPDATE llm_rate_state SET value = MIN(value, ?) WHERE backend = ? AND kind = ?",
+                    (remaining, backend, kind),
+                )
+
+    def block(self, backend: str, until: float) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO llm_rate_state (backend, kind, value, updated_at) VALUES (?, 'blocked_until', ?, ?) "
+                "ON CONFLICT(backend, kind) DO UPDATE SET value = MAX(value, excluded.value), updated_at = excluded.updated_at",
+                (backend, until, time.time()),
+            )
+
+
+class LlmScheduler:
+    """
+    Планировщик запросов к моделям. Для каждого сервера ведет корзины токенов
+    по числу запросов и токенов в минуту, учитывает заголовки x-ratelimit-* и retry-after
+    и направляет запрос туда, где он будет выполнен быстрее всего с учетом
+    оставшейся квоты и наблюдаемого времени ответа.
+    """
+
+    # Вес нового замера в скользящем среднем времени ответа
+    LATENCY_EWMA_ALPHA = 0.3
+
+    def __init__(self, store, backends: Dict[str, Dict[str, float]], max_wait: float, default_block: float):
+        """
+        Args:
+            store: MemoryRateStore или SqliteRateStore
+            backends: Параметры серверов в порядке предпочтения: лимиты "requests" и "tokens"
+                      в минуту, "max_request_tokens" (размер промпта) и "penalty" (надбавка
+                      в секундах к оценке, отражающая качество модели)
+            max_wait: Сколько секунд запрос может ждать освобождения квоты
+            default_block: На сколько секунд блокировать сервер после 429 без retry-after
+        """
+        self.store = store
+        self.backends = backends
+        self.max_wait = max_wait
+        self.default_block = default_block
+        self._latency: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _amounts(self, prompt_tokens: int, max_output_tokens: int) -> Dict[str, float]:
+        return {"requests": 1, "tokens": prompt_tokens + max_output_tokens}
+
+    def choose(self, prompt_tokens: int, max_output_tokens: int = 1500, usable: Optional[List[str]] = None) -> str:
+        """
+        Выбирает сервер с наименьшей ожидаемой задержкой (квота не списывается).
+        Если задан usable, рассматриваются только эти серверы (например, те, для которых задан ключ)
+        """
+        amounts = self._amounts(prompt_tokens, max_output_tokens)
+        best_backend, best_cost = None, None
+        for backend, config in self.backends.items():
+            if usable is not None and backend not in usable:
+                continue
+            if prompt_tokens + max_output_tokens > config.get("max_request_tokens", float("inf")):
+                continue
+            wait = self.store.try_take(backend, amounts, config, take=False)
+            with self._lock:
+                latency = self._latency.get(backend, 0.0)
+            cost = wait + latency + config.get("penalty", 0.0)
+            if best_cost is None or cost < best_cost:
+                best_backend, best_cost = backend, cost
+        # Промпт не помещается ни в один доступный сервер или доступных серверов нет - используем основной
+        return best_backend or next(iter(self.backends))
+
+    def acquire(self, backend: str, prompt_tokens: int, max_output_tokens: int = 1500) -> None:
+        """Списывает квоту сервера, при необходимости дожидаясь ее пополнения (не дольше max_wait)"""
+        amounts = self._amounts(prompt_tokens, max_output_tokens)
+        config = self.backends[backend]
+        deadline = time.time() + self.max_wait
+        while True:
+            wait = self.store.try_take(backend, amounts, config)
+            if wait == 0:
+                return
+            if time.time() + wait > deadline:
+                logger.warning(f"Квота {backend} не освободится за {self.max_wait:.0f} с, отправляем запрос без ожидания")
+                return
+            logger.info(f"Ожидаем освобождения квоты {backend}: {wait:.1f} с")
+            time.sleep(min(wait, 1.0))
+
+    def record(self, backend: str, latency: Optional[float] = None, headers: Optional[Dict[str, str]] = None,
+               used_tokens: Optional[int] = None, reserved_tokens: Optional[int] = None,
+               rate_limited: bool = False) -> None:
+        """
+        Учитывает результат запроса: время ответа, фактический расход токенов,
+        остаток квоты из заголовков ответа и ошибку 429
+        """
+        if latency is not None and not rate_limited:
+            with self._lock:
+                previous = self._latency.get(backend)
+                self._latency[backend] = latency if previous is None else previous + self.LATENCY_EWMA_ALPHA * (latency - previous)
+        
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if used_tokens is not None and reserved_tokens is not None:
+            self.store.adjust(backend, "tokens", reserved_tokens - used_tokens,
+                              float(remaining_tokens) if remaining_tokens else None)
+        elif remaining_tokens:
+            self.store.adjust(backend, "tokens", 0, float(remaining_tokens))
+        if remaining_requests:
+            self.store.adjust(backend, "requests", 0, float(remaining_requests))
+        
+        if rate_limited:
+            block_for = (_parse_reset_duration(headers.get("retry-after"))
+                         or _parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+                         or _parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+                         or self.default_block)
+            self.store.block(backend, time.time() + block_for)
+            logger.warning(f"Сервер {backend} ограничил запросы (429), не используем его {block_for:.1f} секунд")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Оценка ожидания и среднее время ответа каждого сервера"""
+        result = {}
+        for backend, config in self.backends.items():
+            wait = self.store.try_take(backend, self._amounts(0, 0), config, take=False)
+            with self._lock:
+                latency = self._latency.get(backend)
+            result[backend] = {
+                "wait_seconds": round(wait, 2),
+                "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            }
+        return result
+
+
+def create_llm_scheduler() -> LlmScheduler:
+    """
+    Создает планировщик по переменным окружения. Если задан LLM_RATE_STATE_PATH,
+    квоты хранятся в SQLite и общие для всех процессов
+    """
+    state_path = os.environ.get("LLM_RATE_STATE_PATH")
+    store = SqliteRateStore(state_path) if state_path else MemoryRateStore()
+    backends = {
+        # По умолчанию - лимиты бесплатных тарифов
+        GROQ_BACKEND: {
+            "requests": float(os.environ.get("GROQ_RPM", "30")),
+            "tokens": float(os.environ.get("GROQ_TPM", "30000")),
+            "penalty": 0.0,
+        },
+        GITHUB_BACKEND: {
+            "requests": float(os.environ.get("GITHUB_MODELS_RPM", "10")),
+            "tokens": float(os.environ.get("GITHUB_MODELS_TPM", "0")),
+            # DeepSeek на GitHub Models принимает не более 8000 токенов на запрос вместе с ответом
+            "max_request_tokens": 8000,
+            # Резервная модель используется, только если это заметно быстрее
+            "penalty": float(os.environ.get("GITHUB_MODELS_PENALTY", "5")),
+        },
+    }
+    return LlmScheduler(
+        store,
+        backends,
+        max_wait=float(os.environ.get("LLM_SCHEDULER_MAX_WAIT", "20")),
+        default_block=float(os.environ.get("GROQ_RETRY_INTERVAL", "60")),
+    )
+
+
+class LlmClients:
+    """
+    Общий для процесса реестр клиентов моделей. Клиент каждого сервера создается
+    один раз на ключ доступа и переиспользует пул keep-alive соединений;
+    все запросы выполняются с таймаутами на подключение и чтение.
+    """
+    
+    POOL_MAXSIZE = int(os.environ.get("LLM_HTTP_POOL_SIZE", "10"))
+    CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+    READ_TIMEOUT = float(os.environ.get("LLM_HTTP_READ_TIMEOUT", "60"))
+    
+    _clients: Dict[Tuple[str, str], Any] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get(cls, backend: str, credential: str, factory: Callable[[str], Any]) -> Any:
+        """Возвращает клиент сервера, создавая его при первом обращении"""
+        key = (backend, credential)
+        client = cls._clients.get(key)
+        if client is not None:
+            return client
+        with cls._lock:
+            client = cls._clients.get(key)
+            if client is None:
+                client = factory(credential)
+                cls._clients[key] = client
+        return client
+
+    @classmethod
+    def groq(cls, api_key: str) -> "Groq":
+        def create(credential: str) -> "Groq":
+            sdk = _groq_sdk()
+            httpx = sdk.httpx
+            # Повторы выполняет сам анализатор, поэтому автоматические retry отключены
+            http_client = httpx.Client(
+                transport=httpx.HTTPTransport(
+                    retries=0,
+                    limits=httpx.Limits(max_connections=cls.POOL_MAXSIZE, max_keepalive_connections=cls.POOL_MAXSIZE),
+                ),
+                timeout=httpx.Timeout(cls.READ_TIMEOUT, connect=cls.CONNECT_TIMEOUT),
+            )
+            return sdk.Groq(api_key=credential, http_client=http_client, max_retries=0)
+        return cls._get(GROQ_BACKEND, api_key, create)
+
+    @classmethod
+    def github(cls, token: str) -> "ChatCompletionsClient":
+        def create(credential: str) -> "ChatCompletionsClient":
+            sdk = _azure_sdk()
+            return sdk.ChatCompletionsClient(
+                endpoint=ReviewAnalyzer.GITHUB_MODELS_ENDPOINT,
+                credential=sdk.AzureKeyCredential(credential),
+                connection_timeout=cls.CONNECT_TIMEOUT,
+                read_timeout=cls.READ_TIMEOUT,
+            )
+        return cls._get(GITHUB_BACKEND, token, create)
+
+    @classmethod
+    def close(cls) -> None:
+        """Закрывает всех клиентов (вызывается при остановке приложения)"""
+        with cls._lock:
+            for (backend, _), client in cls._clients.items():
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"Ошибка при закрытии клиента {backend}: {str(e)}")
+            cls._clients.clear()
+
+
+class LlmBackendError(Exception):
+    """Ошибка сервера модели с HTTP-статусом и заголовками ответа"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class LlmBackend(ABC):
+    """
+    Интерфейс сервера модели. Сервер выполняет один запрос и сообщает заголовки
+    ответа и расход токенов; повторы, выбор сервера и учет квот выполняет ReviewAnalyzer.
+    Ошибки сервера передаются исключениями с атрибутами status_code и headers или response.
+    """
+
+    # Название сервера для сообщений
+    title = ""
+
+    def __init__(self, name: str, model_name: str):
+        """
+        Args:
+            name: Ключ сервера в планировщике (GROQ_BACKEND или GITHUB_BACKEND)
+            model_name: Модель, используемая для бюджета токенов и ключа кэша
+        """
+        self.name = name
+        self.model_name = model_name
+
+    def unavailable_message(self) -> Optional[str]:
+        """Сообщение об ошибке, если не установлена библиотека клиента"""
+        return None
+
+    def configuration_error(self) -> Optional[str]:
+        """Сообщение об ошибке, если не задан ключ доступа"""
+        return None
+
+    @abstractmethod
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int) -> Tuple[Optional[str], Dict[str, str], Any]:
+        """Возвращает (текст ответа или None, заголовки ответа, расход токенов)"""
+
+    @abstractmethod
+    def stream(self, system_prompt: str, prompt: str, max_tokens: int, result: Dict[str, Any]) -> Iterator[str]:
+        """Возвращает фрагменты ответа; по окончании записывает в result заголовки ("headers") и расход токенов ("usage")"""
+
+
+class GroqBackend(LlmBackend):
+    title = "Groq API"
+
+    def unavailable_message(self) -> Optional[str]:
+        if not GROQ_AVAILABLE:
+            return "Ошибка: Библиотека groq не установлена. Выполните 'pip install groq'."
+        return None
+
+    def configuration_error(self) -> Optional[str]:
+        if not ReviewAnalyzer._get_api_key():
+            return ReviewAnalyzer.MISSING_GROQ_KEY_MESSAGE
+        return None
+
+    def _create(self, system_prompt: str, prompt: str, max_tokens: int, stream: bool):
+        client = LlmClients.groq(ReviewAnalyzer._get_api_key())
+        # Сырой ответ нужен для заголовков x-ratelimit-*
+        return client.chat.completions.with_raw_response.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens,
+            top_p=0.8,
+            stream=stream
+        )
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int) -> Tuple[Optional[str], Dict[str, str], Any]:
+        raw_response = self._create(system_prompt, prompt, max_tokens, stream=False)
+        response = raw_response.parse()
+        content = response.choices[0].message.content if response and response.choices else None
+        return content, dict(raw_response.headers), getattr(response, "usage", None)
+
+    def stream(self, system_prompt: str, prompt: str, max_tokens: int, result: Dict[str, Any]) -> Iterator[str]:
+        raw_response = self._create(system_prompt, prompt, max_tokens, stream=True)
+        result["headers"] = dict(raw_response.headers)
+        for chunk in raw_response.parse():
+            # Groq передает расход токенов в последнем фрагменте потока
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                result["usage"] = usage
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class GithubModelsBackend(LlmBackend):
+    title = "GitHub Models API"
+
+    def unavailable_message(self) -> Optional[str]:
+        if not GITHUB_MODELS_AVAILABLE:
+            return "Ошибка: Модуль azure-ai-inference не установлен. Выполните 'pip install azure-ai-inference'."
+        return None
+
+    def configuration_error(self) -> Optional[str]:
+        if not ReviewAnalyzer._get_github_token():
+            return "Ошибка: Не найден токен GitHub. Укажите GITHUB_TOKEN в файле .env"
+        return None
+
+    def _complete(self, system_prompt: str, prompt: str, max_tokens: int, stream: bool, headers: Dict[str, str]):
+        client = LlmClients.github(ReviewAnalyzer._get_github_token())
+        sdk = _azure_sdk()
+        return client.complete(
+            stream=stream,
+            messages=[
+                sdk.SystemMessage(system_prompt),
+                sdk.UserMessage(prompt),
+            ],
+            temperature=0.3,
+            top_p=0.8,
+            max_tokens=max_tokens,
+            model=self.model_name,
+            raw_response_hook=lambda pipeline_response: headers.update(pipeline_response.http_response.headers),
+        )
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int) -> Tuple[Optional[str], Dict[str, str], Any]:
+        headers = {}
+        response = self._complete(system_prompt, prompt, max_tokens, False, headers)
+        content = response.choices[0].message.content if response and response.choices else None
+        return content, headers, getattr(response, "usage", None)
+
+    def stream(self, system_prompt: str, prompt: str, max_tokens: int, result: Dict[str, Any]) -> Iterator[str]:
+        result["headers"] = {}
+        for update in self._complete(system_prompt, prompt, max_tokens, True, result["headers"]):
+            if getattr(update, "usage", None) is not None:
+                result["usage"] = update.usage
+            if update.choices and update.choices[0].delta and update.choices[0].delta.content:
+                yield update.choices[0].delta.content
+
+
+class StubBackend(LlmBackend):
+    """
+    Локальная заглушка сервера модели для нагрузочного тестирования без сети и квот.
+    Ответ детерминированно строится из отзывов в промпте и имеет формат
+    "Плюсы/Минусы/Рекомендации"; задержка и доля ошибок и ответов 429 настраиваются.
+    """
+
+    title = "локальной заглушки модели"
+
+    _REVIEW_RE = re.compile(r"^Отзыв \d+: (.*)$", re.MULTILINE)
+    _PROS_RE = re.compile(r"Плюсы: (.+?)(?:\s+Минусы:|$)")
+    _CONS_RE = re.compile(r"Минусы: (.+)$")
+    _PRODUCT_RE = re.compile(r'о товар[еах]* "([^"]*)"')
+
+    def __init__(self, name: str, model_name: str, latency: float = 0.0, token_delay: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 60.0, seed: int = 0):
+        """
+        Args:
+            latency: Задержка перед ответом в секундах
+            token_delay: Задержка между фрагментами потокового ответа в секундах
+            error_rate: Доля запросов, завершающихся ошибкой 500
+            rate_limit_rate: Доля запросов, завершающихся ошибкой 429
+            retry_after: Значение заголовка retry-after для ошибок 429
+            seed: Начальное значение генератора ошибок
+        """
+        super().__init__(name, model_name)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, system_prompt: str, prompt: str, max_tokens: int) -> Tuple[str, Dict[str, str], Any]:
+        with self._lock:
+            roll = self._random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if roll < self.rate_limit_rate:
+            raise LlmBackendError("Error code: 429 - too many requests", 429, {"retry-after": str(self.retry_after)})
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise LlmBackendError("Error code: 500 - internal server error", 500)
+        
+        content = self.render(prompt)
+        prompt_tokens = _estimate_tokens(system_prompt, self.model_name) + _estimate_tokens(prompt, self.model_name)
+        completion_tokens = min(max_tokens, _estimate_tokens(content, self.model_name))
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                total_tokens=prompt_tokens + completion_tokens)
+        return content, {}, usage
+
+    @classmethod
+    def render(cls, prompt: str) -> str:
+        """Строит ответ из отзывов промпта: первые упомянутые плюсы и минусы и число отзывов"""
+        reviews = cls._REVIEW_RE.findall(prompt)
+        pros, cons = [], []
+        for review in reviews:
+            pros_match = cls._PROS_RE.search(review)
+            cons_match = cls._CONS_RE.search(review)
+            if pros_match and len(pros) < 5:
+                pros.append(pros_match.group(1).strip())
+            if cons_match and len(cons) < 5:
+                cons.append(cons_match.group(1).strip())
+        product_match = cls._PRODUCT_RE.search(prompt)
+        product_name = product_match.group(1) if product_match else "товар"
+        
+        pros_text = "\n".join(f"- {item}" for item in pros) or "- Покупатели в целом довольны товаром"
+        cons_text = "\n".join(f"- Некоторые пользователи отмечают: {item}" for item in cons) \
+            or "- Судя по отзывам, явных или часто упоминаемых минусов не обнаружено"
+        return (
+            f"Плюсы:\n{pros_text}\n\n"
+            f"Минусы:\n{cons_text}\n\n"
+            f"Рекомендации:\nОтвет локальной заглушки модели по {len(reviews)} отзывам о товаре \"{product_name}\"."
+        )
+
+    def complete(self, system_prompt: str, prompt: str, max_tokens: int) -> Tuple[Optional[str], Dict[str, str], Any]:
+        return self._respond(system_prompt, prompt, max_tokens)
+
+    def stream(self, system_prompt: str, prompt: str, max_tokens: int, result: Dict[str, Any]) -> Iterator[str]:
+        content, result["headers"], result["usage"] = self._respond(system_prompt, prompt, max_tokens)
+        for part in re.findall(r"\S+\s*", content):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield part
+
+
+def create_llm_backends(groq_model_name: str, github_model_name: str) -> Dict[str, LlmBackend]:
+    """
+    Создает серверы моделей по переменной окружения LLM_BACKEND:
+    remote - Groq и GitHub Models, stub - локальные заглушки с параметрами
+    из переменных LLM_STUB_* (для отдельного сервера - LLM_STUB_GROQ_*, LLM_STUB_GITHUB_*)
+    """
+    if LLM_BACKEND_KIND == "stub":
+        def option(name: str, prefix: str, default: str) -> float:
+            return float(os.environ.get(f"LLM_STUB_{prefix}_{name}", os.environ.get(f"LLM_STUB_{name}", default)))
+        
+        backends = {}
+        for name, model_name in ((GROQ_BACKEND, groq_model_name), (GITHUB_BACKEND, github_model_name)):
+            prefix = name.upper()
+            backends[name] = StubBackend(
+                name,
+                model_name,
+                latency=option("LATENCY", prefix, "0.5"),
+                token_delay=option("TOKEN_DELAY", prefix, "0.01"),
+                error_rate=option("ERROR_RATE", prefix, "0"),
+                rate_limit_rate=option("RATE_LIMIT_RATE", prefix, "0"),
+                retry_after=option("RETRY_AFTER", prefix, "60"),
+                seed=int(option("SEED", prefix, "0")),
+            )
+        return backends
+    
+    if LLM_BACKEND_KIND != "remote":
+        logger.warning(f"Неизвестный вид сервера моделей '{LLM_BACKEND_KIND}', используем remote")
+    return {
+        GROQ_BACKEND: GroqBackend(GROQ_BACKEND, groq_model_name),
+        GITHUB_BACKEND: GithubModelsBackend(GITHUB_BACKEND, github_model_name),
+    }
+
+
 class ReviewAnalyzer:
     """
     Класс для анализа отзывов с Wildberries с использованием Groq API и модели Llama-4-Scout
@@ -37,91 +943,285 @@ class ReviewAnalyzer:
     GITHUB_MODELS_ENDPOINT = "https://models.inference.ai.azure.com"
     GITHUB_MODEL_NAME = "DeepSeek-V3-0324"
     
-    # Флаг, указывающий, что Groq API временно недоступен (ошибка 429)
-    _groq_api_rate_limited = False
+    GROQ_MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
+    
+    MISSING_GROQ_KEY_MESSAGE = """Ошибка анализа отзывов
+
+Не найден API ключ Groq. Пожалуйста, установите переменную окружения GROQ_API_KEY
+или создайте файл .env или .groq_api_key с ключом API.
+
+Инструкции:
+1. Получите API ключ на сайте https://console.groq.com
+2. Сохраните ключ в переменной окружения GROQ_API_KEY
+   или в файле .env в формате GROQ_API_KEY=ваш_ключ
+   или в файле .groq_api_key в директории приложения"""
+    
+    SYSTEM_PROMPT = "Ты - профессиональный аналитик отзывов о товарах. Твои ответы должны быть структурированными, информативными и строго придерживаться указанного формата без эмодзи."
+    
+    # Версия промпта анализа; увеличивается при изменении промпта, чтобы не использовать старый кэш
+    PROMPT_VERSION = 3
+    
+    # Бюджет токенов на тексты отзывов в промпте для каждой модели
+    # (у DeepSeek на GitHub Models лимит 8000 токенов на запрос вместе с ответом)
+    REVIEW_TOKEN_BUDGETS = {
+        GROQ_MODEL_NAME: 6000,
+        GITHUB_MODEL_NAME: 3500,
+    }
+    
+    # Кэш готовых анализов (ANALYSIS_CACHE_MAX_AGE=0 отключает кэш)
+    ANALYSIS_CACHE = AnalysisCache(
+        path=os.environ.get("ANALYSIS_CACHE_PATH", _DEFAULT_ANALYSIS_CACHE_PATH),
+        max_age=float(os.environ.get("ANALYSIS_CACHE_MAX_AGE", str(24 * 60 * 60))),
+        max_entries=int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "5000")),
+    )
+    
+    # Число одновременных запросов к модели на этапе map в режиме map-reduce
+    MAP_REDUCE_MAX_WORKERS = int(os.environ.get("MAP_REDUCE_MAX_WORKERS", "4"))
     
-    # Время последней ошибки 429 от Groq API
-    _groq_api_rate_limited_time = 0
+    # История отслеживаемых товаров для инкрементального анализа
+    REVIEW_HISTORY = ReviewHistoryStore(os.environ.get("ANALYSIS_CACHE_PATH", _DEFAULT_ANALYSIS_CACHE_PATH))
     
-    # Интервал для повторной проверки доступности Groq API (в секундах)
-    _groq_api_retry_interval = 60
+    # Планировщик запросов к моделям: лимиты Groq и GitHub Models и выбор сервера
+    LLM_SCHEDULER = create_llm_scheduler()
+    
+    # Серверы моделей: основной (Groq) и резервный (GitHub Models) или их локальные заглушки
+    LLM_BACKENDS = create_llm_backends(GROQ_MODEL_NAME, GITHUB_MODEL_NAME)
+    
+    # Максимальная длина ответа модели в токенах
+    MAX_OUTPUT_TOKENS = 1500
+    
+    # Если модели недоступны, вместо сообщения об ошибке возвращается локальный анализ (extractive.py)
+    LOCAL_FALLBACK = os.environ.get("LOCAL_ANALYSIS_FALLBACK", "1") != "0"
+    LOCAL_FALLBACK_NOTE = "Серверы моделей сейчас недоступны, поэтому анализ составлен автоматически без модели; повторите запрос позже для подробного анализа."
     
     @staticmethod
-    def _truncate_reviews(reviews: List[str], max_length: int = 15000) -> List[str]:
+    def _collapse_near_duplicates(reviews: List[str]) -> List[str]:
         """
-        Обрезает список отзывов, чтобы их общая длина не превышала max_length
+        Схлопывает почти одинаковые отзывы ("Всё отлично", "Все отлично!") в один
+        представитель с пометкой числа таких отзывов, например "Всё отлично (×37)".
+        Короткие отзывы группируются по MinHash с LSH, длинные - по точному совпадению
+        нормализованного текста. Отзывы, отличающиеся только отрицанием ("Размер подошел"
+        и "Размер не подошел"), не объединяются. Группы сохраняют порядок первого появления.
         """
         if not reviews:
             return []
+        
+        features = [_review_features(review) for review in reviews]
+        # Каждый отзыв сравнивается только с первыми отзывами уже найденных групп,
+        # поэтому время работы линейно по числу отзывов
+        leader_of = list(range(len(reviews)))
+        exact = {}
+        buckets = {}
+        for i, review_features in enumerate(features):
+            if not review_features:
+                continue
+            if review_features in exact:
+                leader_of[i] = exact[review_features]
+                continue
+            exact[review_features] = i
+            if len(review_features) > NEAR_DUPLICATE_MAX_WORDS:
+                continue
             
-        total_length = 0
-        truncated_reviews = []
+            signature = _minhash_signature(review_features)
+            band_keys = [
+                (band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])
+                for band in range(MINHASH_BANDS)
+            ]
+            best_leader, best_similarity = None, 0.0
+            for key in band_keys:
+                for j in buckets.get(key, ()):
+                    # Кандидатов из LSH проверяем по точному коэффициенту Жаккара
+                    intersection = len(review_features & features[j])
+                    similarity = intersection / (len(review_features) + len(features[j]) - intersection)
+                    if (similarity >= max(best_similarity, _near_duplicate_threshold(review_features, features[j]))
+                            and not _differ_by_negation(review_features, features[j])):
+                        best_leader, best_similarity = j, similarity
+            
+            if best_leader is not None:
+                leader_of[i] = best_leader
+                exact[review_features] = best_leader
+                continue
+            for key in band_keys:
+                bucket = buckets.setdefault(key, [])
+                bucket.append(i)
+                if len(bucket) > _MAX_BUCKET_LEADERS:
+                    del bucket[0]
         
-        for review in reviews:
-            # Добавляем отзыв, если общая длина не превышает максимальную
-            if total_length + len(review) <= max_length:
-                truncated_reviews.append(review)
-                total_length += len(review)
+        clusters = {}
+        for i in range(len(reviews)):
+            clusters.setdefault(leader_of[i], []).append(i)
+        
+        collapsed = []
+        for members in clusters.values():
+            # Представитель группы - самый содержательный отзыв
+            representative = max(members, key=lambda i: (len(features[i]), -i))
+            if len(members) > 1:
+                collapsed.append(f"{reviews[representative]} (×{len(members)})")
             else:
-                # Если отзыв слишком длинный, добавляем часть до достижения max_length
-                available_length = max_length - total_length
-                if available_length > 100:  # Если осталось достаточно места, добавляем часть отзыва
-                    truncated_reviews.append(review[:available_length])
-                break
-                
-        return truncated_reviews
+                collapsed.append(reviews[representative])
+        return collapsed
+    
+    @staticmethod
+    def _review_budget(model: str, reserved_tokens: int = 0) -> int:
+        """
+        Бюджет токенов на тексты отзывов для модели. Если у сервера модели есть лимит
+        размера запроса (max_request_tokens), бюджет уменьшается так, чтобы в лимит поместились
+        шаблон промпта с системным промптом (reserved_tokens) и ответ модели
+        """
+        budget = ReviewAnalyzer.REVIEW_TOKEN_BUDGETS.get(model, min(ReviewAnalyzer.REVIEW_TOKEN_BUDGETS.values()))
+        for name, backend in ReviewAnalyzer.LLM_BACKENDS.items():
+            limit = ReviewAnalyzer.LLM_SCHEDULER.backends.get(name, {}).get("max_request_tokens")
+            if backend.model_name == model and limit:
+                budget = min(budget, int(limit) - reserved_tokens - ReviewAnalyzer.MAX_OUTPUT_TOKENS)
+        return max(budget, 0)
     
     @staticmethod
-    def _should_try_groq_api() -> bool:
+    def _template_tokens(make_prompt: Callable[[List[str]], str], model: str) -> int:
+        """Токены системного промпта и шаблона промпта без отзывов"""
+        return _estimate_tokens(ReviewAnalyzer.SYSTEM_PROMPT, model) + _estimate_tokens(make_prompt([]), model)
+    
+    @classmethod
+    def _fit_prompt(cls, make_prompt: Callable[[List[str]], str], reviews: List[str], model: str) -> Tuple[str, List[str]]:
         """
-        Проверяет, следует ли пытаться использовать Groq API
-        или сразу переключиться на GitHub Models API
+        Отбирает отзывы под бюджет модели за вычетом шаблона промпта и ответа
+        и возвращает (промпт, отобранные отзывы)
         """
-        # Если Groq API не ограничен по скорости, используем его
-        if not ReviewAnalyzer._groq_api_rate_limited:
-            return True
+        selected = cls._select_reviews(reviews, model, cls._template_tokens(make_prompt, model))
+        return make_prompt(selected), selected
+    
+    @staticmethod
+    def _select_reviews(reviews: List[str], model: str, reserved_tokens: int = 0) -> List[str]:
+        """
+        Отбирает отзывы так, чтобы максимально заполнить бюджет токенов модели
+        (reserved_tokens - токены шаблона промпта, см. _review_budget).
+        Почти одинаковые отзывы пропускаются, предпочтение отдается информативным
+        (с плюсами/минусами и развернутым текстом); слишком длинные отзывы обрезаются.
+        Отобранные отзывы сохраняют исходный порядок.
+        """
+        if not reviews:
+            return []
+        
+        budget = ReviewAnalyzer._review_budget(model, reserved_tokens)
+        # Один отзыв не может занять больше этой доли бюджета
+        max_review_tokens = max(budget // 8, 150)
+        
+        candidates = []
+        seen = set()
+        for position, review in enumerate(reviews):
+            normalized = _NON_WORD_RE.sub(" ", review.lower()).strip()
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
             
-        # Проверяем, прошло ли достаточно времени с момента последней ошибки 429
-        current_time = time.time()
-        time_since_rate_limit = current_time - ReviewAnalyzer._groq_api_rate_limited_time
-        
-        # Если прошло достаточно времени, сбрасываем флаг и пробуем Groq API снова
-        if time_since_rate_limit >= ReviewAnalyzer._groq_api_retry_interval:
-            logger.info(f"Прошло {time_since_rate_limit:.1f} секунд с момента ограничения Groq API. Пробуем снова.")
-            ReviewAnalyzer._groq_api_rate_limited = False
-            return True
+            tokens = _estimate_tokens(review, model)
+            if tokens > max_review_tokens:
+                review = _truncate_to_tokens(review, max_review_tokens, model)
+                tokens = _estimate_tokens(review, model)
             
-        logger.info(f"Groq API все еще ограничен. Используем GitHub Models API. Повторная проверка через {ReviewAnalyzer._groq_api_retry_interval - time_since_rate_limit:.1f} секунд.")
-        return False
+            score = min(tokens, 120)
+            cluster_match = _CLUSTER_SUFFIX_RE.search(review)
+            if cluster_match:
+                # Мнение, которое разделяют многие покупатели
+                score += min(int(cluster_match.group(1)), 10) * 10
+            if "Плюсы:" in review:
+                score += 40
+            if "Минусы:" in review:
+                score += 40
+            candidates.append((score, position, review, tokens + _REVIEW_PREFIX_TOKENS))
+        
+        # Жадная упаковка: сначала самые информативные, затем добираем тем, что еще помещается
+        candidates.sort(key=lambda c: (-c[0], c[1]))
+        remaining = budget
+        selected = []
+        for score, position, review, tokens in candidates:
+            if tokens <= remaining:
+                selected.append((position, review))
+                remaining -= tokens
+            if remaining < _REVIEW_PREFIX_TOKENS + 1:
+                break
+        
+        selected.sort()
+        return [review for _, review in selected]
     
     @staticmethod
-    def _mark_groq_api_rate_limited():
-        """Отмечает Groq API как временно недоступный из-за ограничения скорости"""
-        ReviewAnalyzer._groq_api_rate_limited = True
-        ReviewAnalyzer._groq_api_rate_limited_time = time.time()
-        logger.warning(f"Groq API помечен как ограниченный на {ReviewAnalyzer._groq_api_retry_interval} секунд")
+    def _chunk_reviews(reviews: List[str], model: str, reserved_tokens: int = 0) -> List[List[str]]:
+        """
+        Делит отзывы на последовательные части, каждая из которых помещается
+        в бюджет токенов модели (reserved_tokens - токены шаблона промпта, см. _review_budget)
+        """
+        budget = ReviewAnalyzer._review_budget(model, reserved_tokens)
+        max_review_tokens = max(budget // 8, 150)
+        
+        chunks = []
+        current, current_tokens = [], 0
+        for review in reviews:
+            review = _truncate_to_tokens(review, max_review_tokens, model)
+            tokens = _estimate_tokens(review, model) + _REVIEW_PREFIX_TOKENS
+            if current and current_tokens + tokens > budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(review)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    @staticmethod
+    def _prompt_tokens(prompt: str, backend: str) -> int:
+        """Оценка числа токенов запроса к модели вместе с системным промптом"""
+        model = ReviewAnalyzer.LLM_BACKENDS[backend].model_name
+        return _estimate_tokens(ReviewAnalyzer.SYSTEM_PROMPT, model) + _estimate_tokens(prompt, model)
+    
+    @staticmethod
+    def _error_details(error: Exception) -> Tuple[Optional[int], Dict[str, str]]:
+        """HTTP-статус и заголовки ответа из исключения клиента Groq, Azure или httpx"""
+        response = getattr(error, "response", None)
+        status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+        headers = getattr(error, "headers", None) or getattr(response, "headers", None)
+        return status_code, dict(headers) if headers else {}
+    
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        status_code, _ = ReviewAnalyzer._error_details(error)
+        error_str = str(error)
+        return status_code == 429 or "429" in error_str or "too many requests" in error_str.lower()
+    
+    @staticmethod
+    def _record_llm_error(backend: str, error: Exception) -> bool:
+        """Передает ошибку планировщику; возвращает True, если это ограничение запросов (429)"""
+        if not ReviewAnalyzer._is_rate_limit_error(error):
+            return False
+        metrics.LLM_RATE_LIMITED.inc(backend=backend)
+        _, headers = ReviewAnalyzer._error_details(error)
+        ReviewAnalyzer.LLM_SCHEDULER.record(backend, headers=headers, rate_limited=True)
+        return True
+    
+    @staticmethod
+    def _record_llm_response(backend: str, started_at: float, headers, usage, prompt_tokens: int):
+        """Передает планировщику время ответа, остаток квоты из заголовков и фактический расход токенов"""
+        ReviewAnalyzer.LLM_SCHEDULER.record(
+            backend,
+            latency=time.time() - started_at,
+            headers=dict(headers) if headers else None,
+            used_tokens=getattr(usage, "total_tokens", None),
+            reserved_tokens=prompt_tokens + ReviewAnalyzer.MAX_OUTPUT_TOKENS,
+        )
     
     @staticmethod
     def _generate_ai_prompt(reviews: List[str], product_name: str) -> str:
         """
         Генерирует промпт для отправки в модель ИИ
         """
-        # Если используется GitHub Models API, сильно сокращаем промпт для соблюдения лимитов DeepSeek
-        if ReviewAnalyzer._groq_api_rate_limited:
-            # Более агрессивное сокращение для DeepSeek модели (ограничение 8000 токенов)
-            # Берем только 20 отзывов максимум и ограничиваем их длину до 100 символов
-            shortened_reviews = reviews[:20]
-            reviews_text = "\n".join([f"Отзыв {i+1}: {review[:100]}..." if len(review) > 100 else f"Отзыв {i+1}: {review}" 
-                                     for i, review in enumerate(shortened_reviews)])
-        else:
-            # Для Groq используем стандартный формат
-            reviews_text = "\n".join([f"Отзыв {i+1}: {review}" for i, review in enumerate(reviews)])
+        # Объем отзывов уже подобран под бюджет токенов модели в _select_reviews
+        reviews_text = "\n".join([f"Отзыв {i+1}: {review}" for i, review in enumerate(reviews)])
         
         prompt = f"""Проанализируй следующие отзывы о товаре "{product_name}".
 
 ОТЗЫВЫ:
 {reviews_text}
 
+Пометка (×N) в конце отзыва означает, что N покупателей оставили практически такой же отзыв - учитывай это при оценке того, насколько часто упоминается достоинство или недостаток.
+
 Твой ответ должен быть строго в следующем формате и не должен содержать эмодзи или другие символы:
 
 Плюсы:
@@ -148,8 +1248,113 @@ class ReviewAnalyzer:
         return prompt
     
     @staticmethod
+    def _generate_incremental_prompt(previous_analysis: str, new_reviews: List[str], product_name: str) -> str:
+        """
+        Генерирует промпт для обновления предыдущего анализа с учетом только новых отзывов
+        """
+        reviews_text = "\n".join([f"Отзыв {i+1}: {review}" for i, review in enumerate(new_reviews)])
+        
+        prompt = f"""Ранее ты проанализировал отзывы о товаре "{product_name}". Вот этот анализ:
+
+ПРЕДЫДУЩИЙ АНАЛИЗ:
+{previous_analysis}
+
+С тех пор появились новые отзывы:
+
+НОВЫЕ ОТЗЫВЫ:
+{reviews_text}
+
+Пометка (×N) в конце отзыва означает, что N покупателей оставили практически такой же отзыв.
+
+Обнови анализ с учетом новых отзывов. Сохрани выводы предыдущего анализа, если новые отзывы им не противоречат, добавь новые часто упоминаемые достоинства и недостатки, и скорректируй формулировки, если новые отзывы меняют картину (например, проблема стала массовой или, наоборот, перестала упоминаться).
+
+Твой ответ должен быть строго в следующем формате и не должен содержать эмодзи или другие символы:
+
+Плюсы:
+- [основные положительные характеристики товара]
+
+Минусы:
+- [основные отрицательные моменты; указывай частный или субъективный характер недостатков, если это следует из отзывов. Если минусов нет, напиши "Судя по отзывам, явных или часто упоминаемых минусов не обнаружено"]
+
+Рекомендации:
+[Развернутая рекомендация, стоит ли покупать этот товар и для каких покупателей он подойдет, минимум 3-5 предложений.]
+
+Важные требования:
+1. Не используй эмодзи
+2. Используй только простой текст без форматирования
+3. Строго придерживайся указанной структуры
+4. Основывай свой анализ только на предыдущем анализе и предоставленных отзывах
+5. Плюсы и минусы оформляй в виде маркированного списка с дефисами
+"""
+        return prompt
+    
+    @staticmethod
+    def _generate_chunk_prompt(reviews: List[str], product_name: str) -> str:
+        """
+        Генерирует промпт этапа map: краткие плюсы и минусы по одной части отзывов
+        (или по нескольким промежуточным сводкам)
+        """
+        reviews_text = "\n".join([f"Отзыв {i+1}: {review}" for i, review in enumerate(reviews)])
+        
+        prompt = f"""Это часть отзывов о товаре "{product_name}". Кратко выпиши, что в них говорится о товаре.
+
+ОТЗЫВЫ:
+{reviews_text}
+
+Пометка (×N) в конце отзыва означает, что N покупателей оставили практически такой же отзыв.
+
+Твой ответ должен быть строго в следующем формате, без эмодзи и вступлений:
+
+Плюсы:
+- [достоинство] (упоминаний: [примерное число])
+
+Минусы:
+- [недостаток] (упоминаний: [примерное число])
+
+Если минусов нет, напиши в разделе "Минусы" "- не упоминаются". Не добавляй другие разделы.
+"""
+        return prompt
+    
+    @staticmethod
+    def _generate_reduce_prompt(partial_summaries: List[str], product_name: str, review_count: int) -> str:
+        """
+        Генерирует промпт этапа reduce: итоговый анализ по промежуточным сводкам частей отзывов
+        """
+        summaries_text = "\n\n".join([f"Сводка {i+1}:\n{summary}" for i, summary in enumerate(partial_summaries)])
+        
+        prompt = f"""Отзывы о товаре "{product_name}" ({review_count} шт.) были разбиты на части, и для каждой части составлена сводка плюсов и минусов с числом упоминаний.
+
+СВОДКИ:
+{summaries_text}
+
+Объедини сводки в итоговый анализ товара. Суммируй одинаковые по смыслу пункты и учитывай число упоминаний: часто упоминаемое выноси в начало списка, единичные жалобы указывай как мнение части покупателей.
+
+Твой ответ должен быть строго в следующем формате и не должен содержать эмодзи или другие символы:
+
+Плюсы:
+- [основные положительные характеристики товара]
+
+Минусы:
+- [основные отрицательные моменты; указывай частный или субъективный характер недостатков. Если минусов нет, напиши "Судя по отзывам, явных или часто упоминаемых минусов не обнаружено"]
+
+Рекомендации:
+[Развернутая рекомендация, стоит ли покупать этот товар и для каких покупателей он подойдет, минимум 3-5 предложений.]
+
+Важные требования:
+1. Не используй эмодзи
+2. Используй только простой текст без форматирования
+3. Строго придерживайся указанной структуры
+4. Плюсы и минусы оформляй в виде маркированного списка с дефисами
+"""
+        return prompt
+    
+    @staticmethod
+    @lru_cache(maxsize=1)
     def _get_api_key() -> str:
-        """Получает API ключ Groq из переменной окружения или файла"""
+        """
+        Получает API ключ Groq из переменной окружения или файла.
+        Ключ определяется один раз за время работы процесса
+        """
         # Ключ из .env файла уже должен быть загружен в переменные окружения через load_dotenv()
         api_key = os.environ.get("GROQ_API_KEY")
         
@@ -178,170 +1383,297 @@ class ReviewAnalyzer:
         return os.environ.get("GITHUB_TOKEN", "")
     
     @staticmethod
-    def _get_ai_response_github(prompt: str) -> str:
+    def _clean_response(content: str) -> str:
+        """Удаляет эмодзи и прочие лишние символы из ответа модели"""
+        return re.sub(r'[^\w\s\,\.\-\:\;\"\'\(\)\[\]\{\}\?\!]', '', content)
+    
+    @staticmethod
+    def _complete_with_backend(backend_name: str, prompt: str, prompt_tokens: int) -> Optional[str]:
         """
-        Получает ответ от модели ИИ через GitHub Models API
-        Используется как запасной вариант при ошибке 429 от Groq
+        Один запрос к серверу модели: ожидание квоты, запрос, учет ответа в планировщике и метриках
+        Возвращает текст ответа или None, если ответ пустой
         """
-        if not GITHUB_MODELS_AVAILABLE:
-            return "Ошибка: Модуль azure-ai-inference не установлен. Выполните 'pip install azure-ai-inference'."
+        backend = ReviewAnalyzer.LLM_BACKENDS[backend_name]
+        with metrics.stage("llm_quota_wait"):
+            ReviewAnalyzer.LLM_SCHEDULER.acquire(backend_name, prompt_tokens, ReviewAnalyzer.MAX_OUTPUT_TOKENS)
         
-        token = ReviewAnalyzer._get_github_token()
-        if not token:
-            return "Ошибка: Не найден токен GitHub. Укажите GITHUB_TOKEN в файле .env"
+        started_at = time.time()
+        outcome = "error"
+        try:
+            with metrics.LLM_INFLIGHT.track_inprogress(backend=backend_name), metrics.stage("llm"):
+                content, headers, usage = backend.complete(ReviewAnalyzer.SYSTEM_PROMPT, prompt, ReviewAnalyzer.MAX_OUTPUT_TOKENS)
+            outcome = "ok"
+        except Exception as e:
+            if ReviewAnalyzer._is_rate_limit_error(e):
+                outcome = "429"
+            raise
+        finally:
+            metrics.UPSTREAM_SECONDS.observe(time.time() - started_at, upstream=backend_name, outcome=outcome)
+        
+        ReviewAnalyzer._record_llm_response(backend_name, started_at, headers, usage, prompt_tokens)
+        return content
+    
+    @staticmethod
+    def _stream_with_backend(backend_name: str, prompt: str, prompt_tokens: int) -> Iterator[str]:
+        """Потоковый запрос к серверу модели с ожиданием квоты и учетом ответа в планировщике и метриках"""
+        backend = ReviewAnalyzer.LLM_BACKENDS[backend_name]
+        with metrics.stage("llm_quota_wait"):
+            ReviewAnalyzer.LLM_SCHEDULER.acquire(backend_name, prompt_tokens, ReviewAnalyzer.MAX_OUTPUT_TOKENS)
         
+        started_at = time.time()
+        outcome = "error"
+        result = {}
         try:
-            logger.info(f"Используем GitHub Models API с моделью {ReviewAnalyzer.GITHUB_MODEL_NAME}")
-            
-            client = ChatCompletionsClient(
-                endpoint=ReviewAnalyzer.GITHUB_MODELS_ENDPOINT,
-                credential=AzureKeyCredential(token),
-            )
-            
-            response = client.complete(
-                messages=[
-                    SystemMessage("Ты - профессиональный аналитик отзывов о товарах. Твои ответы должны быть структурированными, информативными и строго придерживаться указанного формата без эмодзи."),
-                    UserMessage(prompt),
-                ],
-                temperature=0.3,
-                top_p=0.8,
-                max_tokens=1500,
-                model=ReviewAnalyzer.GITHUB_MODEL_NAME
-            )
+            with metrics.LLM_INFLIGHT.track_inprogress(backend=backend_name), metrics.stage("llm"):
+                for part in backend.stream(ReviewAnalyzer.SYSTEM_PROMPT, prompt, ReviewAnalyzer.MAX_OUTPUT_TOKENS, result):
+                    yield ReviewAnalyzer._clean_response(part)
+            outcome = "ok"
+        except Exception as e:
+            if ReviewAnalyzer._is_rate_limit_error(e):
+                outcome = "429"
+            raise
+        finally:
+            metrics.UPSTREAM_SECONDS.observe(time.time() - started_at, upstream=backend_name, outcome=outcome)
+        
+        ReviewAnalyzer._record_llm_response(backend_name, started_at, result.get("headers"), result.get("usage"), prompt_tokens)
+    
+    @staticmethod
+    def _fallback_reason(reason: str) -> str:
+        """Учитывает переключение на резервный сервер и возвращает его ключ"""
+        metrics.LLM_FALLBACKS.inc(reason=reason)
+        return GITHUB_BACKEND
+    
+    @staticmethod
+    def _fallback_prompt(backend_name: str, prompt: str, fallback_prompt: Optional[Callable[[str], str]]) -> str:
+        """Промпт для резервного сервера: пересобранный под бюджет его модели, если задан fallback_prompt"""
+        if fallback_prompt is None:
+            return prompt
+        return fallback_prompt(ReviewAnalyzer.LLM_BACKENDS[backend_name].model_name)
+    
+    @staticmethod
+    def _get_fallback_response(reason: str, prompt: str, fallback_prompt: Optional[Callable[[str], str]]) -> str:
+        """Ответ резервного сервера на промпт, подобранный под его модель"""
+        backend_name = ReviewAnalyzer._fallback_reason(reason)
+        return ReviewAnalyzer._get_backend_response(
+            backend_name, ReviewAnalyzer._fallback_prompt(backend_name, prompt, fallback_prompt)
+        )
+    
+    @staticmethod
+    def _stream_fallback_response(reason: str, prompt: str, fallback_prompt: Optional[Callable[[str], str]]) -> Iterator[str]:
+        """Потоковый ответ резервного сервера на промпт, подобранный под его модель"""
+        backend_name = ReviewAnalyzer._fallback_reason(reason)
+        yield from ReviewAnalyzer._stream_backend_response(
+            backend_name, ReviewAnalyzer._fallback_prompt(backend_name, prompt, fallback_prompt)
+        )
+    
+    @staticmethod
+    def _get_backend_response(backend_name: str, prompt: str) -> str:
+        """
+        Одна попытка получить ответ от указанного сервера модели
+        Используется для резервного сервера при ошибке 429 от Groq
+        """
+        backend = ReviewAnalyzer.LLM_BACKENDS[backend_name]
+        error_message = backend.unavailable_message() or backend.configuration_error()
+        if error_message:
+            return error_message
+        
+        prompt_tokens = ReviewAnalyzer._prompt_tokens(prompt, backend_name)
+        try:
+            logger.info(f"Используем {backend.title} с моделью {backend.model_name}")
+            content = ReviewAnalyzer._complete_with_backend(backend_name, prompt, prompt_tokens)
             
-            if response and response.choices and len(response.choices) > 0:
-                logger.info("Успешно получен ответ от GitHub Models API")
-                content = response.choices[0].message.content
+            if content:
+                logger.info(f"Успешно получен ответ от {backend.title}")
                 # Удаляем эмодзи из ответа
-                clean_response = re.sub(r'[^\w\s\,\.\-\:\;\"\'\(\)\[\]\{\}\?\!]', '', content)
-                return clean_response
+                return ReviewAnalyzer._clean_response(content)
             else:
-                return "Ошибка: Не удалось получить ответ от GitHub Models API"
+                return f"Ошибка: Не удалось получить ответ от {backend.title}"
                 
         except Exception as e:
-            logger.error(f"Ошибка при использовании GitHub Models API: {str(e)}")
-            return f"Ошибка GitHub Models API: {str(e)}"
+            logger.error(f"Ошибка при использовании {backend.title}: {str(e)}")
+            ReviewAnalyzer._record_llm_error(backend_name, e)
+            return f"Ошибка {backend.title}: {str(e)}"
     
     @staticmethod
-    def _get_ai_response(prompt: str, max_attempts: int = 3) -> str:
+    def _get_ai_response(prompt: str, max_attempts: int = 3,
+                         fallback_prompt: Optional[Callable[[str], str]] = None) -> str:
         """
-        Получает ответ от модели ИИ через Groq API с несколькими попытками в случае ошибки
+        Получает ответ от модели ИИ через Groq API с несколькими попытками в случае ошибки.
+        Планировщик может сразу направить запрос в GitHub Models API, если квота Groq
+        исчерпана и ожидание ее пополнения дольше, чем ответ резервной модели.
+        fallback_prompt(модель) строит промпт под бюджет резервной модели; без него
+        резервному серверу отправляется тот же промпт.
         """
-        # Проверяем, следует ли использовать Groq API или сразу GitHub Models API
-        if not ReviewAnalyzer._should_try_groq_api():
-            return ReviewAnalyzer._get_ai_response_github(prompt)
-            
-        api_key = ReviewAnalyzer._get_api_key()
-        
-        if not api_key:
-            return """Ошибка анализа отзывов
-
-Не найден API ключ Groq. Пожалуйста, установите переменную окружения GROQ_API_KEY
-или создайте файл .env или .groq_api_key с ключом API.
-
-Инструкции:
-1. Получите API ключ на сайте https://console.groq.com
-2. Сохраните ключ в переменной окружения GROQ_API_KEY
-   или в файле .env в формате GROQ_API_KEY=ваш_ключ
-   или в файле .groq_api_key в директории приложения"""
+        backend = ReviewAnalyzer.LLM_BACKENDS[GROQ_BACKEND]
+        prompt_tokens = ReviewAnalyzer._prompt_tokens(prompt, GROQ_BACKEND)
+        if ReviewAnalyzer._choose_backend(prompt_tokens) != GROQ_BACKEND:
+            logger.info("Планировщик направил запрос на резервный сервер")
+            return ReviewAnalyzer._get_fallback_response("scheduler", prompt, fallback_prompt)
         
-        if not GROQ_AVAILABLE:
-            logger.warning("Библиотека Groq недоступна, используем GitHub Models API")
-            return ReviewAnalyzer._get_ai_response_github(prompt)
-            
-        # Устанавливаем API ключ напрямую в переменную окружения
-        os.environ["GROQ_API_KEY"] = api_key
+        configuration_error = backend.configuration_error()
+        if configuration_error:
+            return configuration_error
         
-        model_name = "meta-llama/llama-4-scout-17b-16e-instruct"
-        try:
-            # Создаем кастомный HTTP клиент без автоматических retry
-            transport = httpx.HTTPTransport(retries=0)
-            http_client = httpx.Client(transport=transport)
-            
-            # Используем класс Groq с кастомным клиентом
-            client = Groq(api_key=api_key, http_client=http_client)
-        except Exception as e:
-            logger.error(f"Ошибка при инициализации клиента Groq: {str(e)}")
-            # Пробуем резервный API
-            return ReviewAnalyzer._get_ai_response_github(prompt)
+        unavailable_message = backend.unavailable_message()
+        if unavailable_message:
+            logger.warning(f"{unavailable_message} Используем резервный сервер")
+            return ReviewAnalyzer._get_fallback_response("unavailable", prompt, fallback_prompt)
         
         for attempt in range(max_attempts):
+            if attempt > 0:
+                metrics.LLM_RETRIES.inc(backend=GROQ_BACKEND)
             try:
-                logger.info(f"Попытка {attempt+1} получить ответ от модели {model_name}")
+                logger.info(f"Попытка {attempt+1} получить ответ от модели {backend.model_name}")
                 
-                # Отправляем запрос к Groq API
-                response = client.chat.completions.create(
-                    model=model_name,
-                    messages=[
-                        {"role": "system", "content": "Ты - профессиональный аналитик отзывов о товарах. Твои ответы должны быть структурированными, информативными и строго придерживаться указанного формата без эмодзи."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.3,
-                    max_tokens=1500,
-                    top_p=0.8
-                )
+                # Каждая попытка расходует квоту, поэтому дожидаемся ее перед запросом
+                content = ReviewAnalyzer._complete_with_backend(GROQ_BACKEND, prompt, prompt_tokens)
                 
-                if response and response.choices and len(response.choices) > 0:
+                if content:
                     logger.info("Успешно получен ответ от модели")
-                    content = response.choices[0].message.content
                     # Удаляем эмодзи из ответа
-                    clean_response = re.sub(r'[^\w\s\,\.\-\:\;\"\'\(\)\[\]\{\}\?\!]', '', content)
-                    return clean_response
+                    return ReviewAnalyzer._clean_response(content)
                 
                 logger.warning("Получен пустой ответ от модели, попробуем еще раз")
-                time.sleep(2)  # Небольшая задержка перед следующей попыткой
-                
-            except httpx.HTTPStatusError as e:
-                status_code = e.response.status_code
-                error_str = str(e)
-                logger.error(f"HTTP ошибка при получении ответа от модели: {error_str}")
-                
-                # Проверяем, является ли ошибка 429 (Too Many Requests)
-                if status_code == 429:
-                    logger.warning("Обнаружено ограничение запросов (429). Переключаемся на GitHub Models API")
-                    # Помечаем Groq API как временно недоступный
-                    ReviewAnalyzer._mark_groq_api_rate_limited()
-                    # Используем GitHub Models API как резервный вариант
-                    return ReviewAnalyzer._get_ai_response_github(prompt)
-                
-                time.sleep(3)  # Увеличиваем задержку после ошибки
+                with metrics.stage("llm_retry_wait"):
+                    time.sleep(2)  # Небольшая задержка перед следующей попыткой
             
             except Exception as e:
-                error_str = str(e)
-                logger.error(f"Ошибка при получении ответа от модели: {error_str}")
+                logger.error(f"Ошибка при получении ответа от модели: {str(e)}")
                 
-                # Проверяем, является ли ошибка связана с ограничением запросов
-                if "429" in error_str or "too many requests" in error_str.lower():
-                    logger.warning("Обнаружено ограничение запросов. Переключаемся на GitHub Models API")
-                    # Помечаем Groq API как временно недоступный
-                    ReviewAnalyzer._mark_groq_api_rate_limited()
-                    # Используем GitHub Models API как резервный вариант
-                    return ReviewAnalyzer._get_ai_response_github(prompt)
+                # Проверяем, является ли ошибка ограничением запросов (429)
+                if ReviewAnalyzer._record_llm_error(GROQ_BACKEND, e):
+                    logger.warning("Обнаружено ограничение запросов. Переключаемся на резервный сервер")
+                    return ReviewAnalyzer._get_fallback_response("rate_limited", prompt, fallback_prompt)
                 
-                time.sleep(3)  # Увеличиваем задержку после ошибки
+                with metrics.stage("llm_retry_wait"):
+                    time.sleep(3)  # Увеличиваем задержку после ошибки
                 
-        # Последняя попытка - попробуем GitHub Models API
-        logger.warning("Все попытки с Groq исчерпаны, пробуем GitHub Models API")
-        return ReviewAnalyzer._get_ai_response_github(prompt)
+        # Последняя попытка - резервный сервер
+        logger.warning("Все попытки с Groq исчерпаны, пробуем резервный сервер")
+        return ReviewAnalyzer._get_fallback_response("retries_exhausted", prompt, fallback_prompt)
+    
+    @staticmethod
+    def _stream_backend_response(backend_name: str, prompt: str) -> Iterator[str]:
+        """
+        Потоковый ответ указанного сервера модели: возвращает фрагменты текста по мере генерации
+        """
+        backend = ReviewAnalyzer.LLM_BACKENDS[backend_name]
+        error_message = backend.unavailable_message() or backend.configuration_error()
+        if error_message:
+            yield error_message
+            return
+        
+        prompt_tokens = ReviewAnalyzer._prompt_tokens(prompt, backend_name)
+        started = False
+        try:
+            logger.info(f"Потоковый запрос к {backend.title} с моделью {backend.model_name}")
+            for part in ReviewAnalyzer._stream_with_backend(backend_name, prompt, prompt_tokens):
+                started = True
+                yield part
+            if not started:
+                yield f"Ошибка: Не удалось получить ответ от {backend.title}"
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом запросе к {backend.title}: {str(e)}")
+            if started:
+                raise
+            ReviewAnalyzer._record_llm_error(backend_name, e)
+            yield f"Ошибка {backend.title}: {str(e)}"
+    
+    @staticmethod
+    def _stream_ai_response(prompt: str, fallback_prompt: Optional[Callable[[str], str]] = None) -> Iterator[str]:
+        """
+        Потоковый ответ модели: фрагменты текста по мере генерации через Groq API,
+        при ошибке до начала ответа - через резервный сервер (fallback_prompt - см. _get_ai_response).
+        Если ответ оборвался после первых фрагментов, исключение пробрасывается вызывающему.
+        """
+        backend = ReviewAnalyzer.LLM_BACKENDS[GROQ_BACKEND]
+        prompt_tokens = ReviewAnalyzer._prompt_tokens(prompt, GROQ_BACKEND)
+        if ReviewAnalyzer._choose_backend(prompt_tokens) != GROQ_BACKEND:
+            logger.info("Планировщик направил запрос на резервный сервер")
+            yield from ReviewAnalyzer._stream_fallback_response("scheduler", prompt, fallback_prompt)
+            return
+        
+        configuration_error = backend.configuration_error()
+        if configuration_error:
+            yield configuration_error
+            return
+        
+        unavailable_message = backend.unavailable_message()
+        if unavailable_message:
+            logger.warning(f"{unavailable_message} Используем резервный сервер")
+            yield from ReviewAnalyzer._stream_fallback_response("unavailable", prompt, fallback_prompt)
+            return
+        
+        started = False
+        reason = "empty_response"
+        try:
+            logger.info(f"Потоковый запрос к модели {backend.model_name}")
+            for part in ReviewAnalyzer._stream_with_backend(GROQ_BACKEND, prompt, prompt_tokens):
+                started = True
+                yield part
+            if started:
+                return
+            logger.warning("Получен пустой потоковый ответ от модели, пробуем резервный сервер")
+        except Exception as e:
+            logger.error(f"Ошибка при потоковом получении ответа от модели: {str(e)}")
+            if started:
+                # Часть ответа уже отправлена клиенту - переключаться на другую модель поздно
+                raise
+            reason = "rate_limited" if ReviewAnalyzer._record_llm_error(GROQ_BACKEND, e) else "error"
+        
+        yield from ReviewAnalyzer._stream_fallback_response(reason, prompt, fallback_prompt)
+    
+    @staticmethod
+    def _usable_backends() -> List[str]:
+        """Серверы, для которых установлена библиотека клиента и задан ключ доступа"""
+        return [
+            name for name, backend in ReviewAnalyzer.LLM_BACKENDS.items()
+            if backend.unavailable_message() is None and backend.configuration_error() is None
+        ]
+    
+    @staticmethod
+    def _choose_backend(prompt_tokens: int) -> str:
+        """
+        Сервер для запроса по оценке планировщика. Не настроенные серверы не выбираются:
+        без токена GitHub запрос дожидается квоты Groq, а не завершается ошибкой
+        """
+        return ReviewAnalyzer.LLM_SCHEDULER.choose(prompt_tokens, ReviewAnalyzer.MAX_OUTPUT_TOKENS,
+                                                   ReviewAnalyzer._usable_backends())
+    
+    @staticmethod
+    def _current_model_name() -> str:
+        """Модель, которая будет использована для следующего запроса"""
+        return ReviewAnalyzer.LLM_BACKENDS[ReviewAnalyzer._choose_backend(0)].model_name
+    
+    @staticmethod
+    def _is_error_response(response: str) -> bool:
+        """Проверяет, что ответ является сообщением об ошибке, а не анализом"""
+        return response.startswith("Ошибка")
+    
+    @classmethod
+    def _is_degraded_response(cls, response: str) -> bool:
+        """Проверяет, что вместо анализа модели получено сообщение об ошибке или локальный анализ"""
+        return cls._is_error_response(response) or cls.LOCAL_FALLBACK_NOTE in response
     
     @staticmethod
     def _format_analysis(raw_analysis: str) -> str:
         """
         Форматирует сырой ответ модели для лучшего отображения
         """
-        # Проверяем, что ответ содержит нужные заголовки
-        if "Плюсы:" not in raw_analysis:
-            parts = raw_analysis.split("\n\n")
-            formatted = "Плюсы:\n"
-            if len(parts) > 0:
-                formatted += parts[0] + "\n\n"
-            formatted += "Минусы:\nИнформация о минусах не предоставлена\n\n"
-            formatted += "Рекомендации:\n"
-            if len(parts) > 1:
-                formatted += parts[-1]
-            return formatted
+        with metrics.stage("format"):
+            # Проверяем, что ответ содержит нужные заголовки
+            if "Плюсы:" not in raw_analysis:
+                parts = raw_analysis.split("\n\n")
+                formatted = "Плюсы:\n"
+                if len(parts) > 0:
+                    formatted += parts[0] + "\n\n"
+                formatted += "Минусы:\nИнформация о минусах не предоставлена\n\n"
+                formatted += "Рекомендации:\n"
+                if len(parts) > 1:
+                    formatted += parts[-1]
+                return formatted
             
-        return raw_analysis
+            return raw_analysis
     
     @staticmethod
     def _generate_comparison_prompt(individual_analyses_data: List[Dict[str, Any]]) -> str:
@@ -379,16 +1711,47 @@ class ReviewAnalyzer:
         return prompt
 
     @classmethod
-    def analyze_reviews(cls, reviews: List[str], product_name: str) -> str:
+    def _prepare_analysis_prompt(cls, reviews: List[str], product_name: str) -> Tuple[str, str, Callable[[str], str]]:
+        """
+        Отбирает отзывы и возвращает (промпт, ключ кэша анализа, построитель промпта для резервной модели)
+        """
+        with metrics.stage("prompt_build"):
+            # Отбираем отзывы под бюджет токенов модели (слишком много отзывов может превысить контекст модели)
+            model_name = cls._current_model_name()
+            collapsed_reviews = cls._collapse_near_duplicates(reviews)
+            make_prompt = lambda selected: cls._generate_ai_prompt(selected, product_name)
+            prompt, truncated_reviews = cls._fit_prompt(make_prompt, collapsed_reviews, model_name)
+            cache_key = AnalysisCache.make_key(truncated_reviews, product_name, cls.PROMPT_VERSION, model_name)
+            return prompt, cache_key, lambda model: cls._fit_prompt(make_prompt, collapsed_reviews, model)[0]
+
+    @staticmethod
+    def analyze_reviews_local(reviews: List[Any], product_name: str, note: str = "") -> str:
+        """Анализ отзывов (wb.Review) по частоте упоминаний плюсов и минусов, без запроса к модели"""
+        with metrics.stage("local_analysis"):
+            return extractive.analyze(reviews, product_name, note)
+    
+    @classmethod
+    def _local_fallback(cls, reviews: Optional[List[Any]], product_name: str, error_analysis: str) -> str:
+        """Локальный анализ отзывов (wb.Review) вместо сообщения об ошибке модели (не кэшируется)"""
+        if not cls.LOCAL_FALLBACK or not reviews:
+            return error_analysis
+        logger.warning(f"Модели недоступны, для товара '{product_name}' возвращается локальный анализ")
+        metrics.LLM_FALLBACKS.inc(reason="local")
+        return cls.analyze_reviews_local(reviews, product_name, cls.LOCAL_FALLBACK_NOTE)
+    
+    @classmethod
+    def analyze_reviews(cls, reviews: List[str], product_name: str, fallback_reviews: Optional[List[Any]] = None) -> str:
         """
         Анализирует отзывы с помощью модели Llama-4-Scout через Groq API
         
         Args:
             reviews: Список строк с отзывами
             product_name: Название товара
+            fallback_reviews: Те же отзывы (wb.Review); при ошибке модели по ним возвращается
+                локальный анализ, без них - сообщение об ошибке
             
         Returns:
-            Строка с отформатированным анализом отзывов
+            Строка с отформатированным анализом отзывов или сообщение об ошибке, начинающееся с "Ошибка"
         """
         try:
             logger.info(f"Начинаем анализ {len(reviews)} отзывов для товара '{product_name}'")
@@ -398,24 +1761,24 @@ class ReviewAnalyzer:
 
 Для товара "{product_name}" не найдено отзывов."""
             
-            # Ограничиваем количество и объем отзывов (слишком много отзывов может превысить контекст модели)
-            max_reviews = min(len(reviews), 100)  # Не более 100 отзывов
-            truncated_reviews = cls._truncate_reviews(reviews[:max_reviews])
-            
-            # Если осталось слишком мало отзывов после обрезки
-            if len(truncated_reviews) < 3 and len(reviews) >= 3:
-                # Берем только первые 200 символов из каждого отзыва
-                shortened_reviews = [review[:200] + ("..." if len(review) > 200 else "") for review in reviews[:30]]
-                truncated_reviews = shortened_reviews
+            prompt, cache_key, fallback_prompt = cls._prepare_analysis_prompt(reviews, product_name)
             
-            # Генерируем промпт для ИИ
-            prompt = cls._generate_ai_prompt(truncated_reviews, product_name)
+            # Если эти отзывы уже анализировались, берем результат из кэша
+            cached_analysis = cls.ANALYSIS_CACHE.get(cache_key)
+            if cached_analysis is not None:
+                logger.info(f"Анализ для товара '{product_name}' взят из кэша")
+                return cached_analysis
             
             # Получаем ответ от ИИ
-            raw_analysis = cls._get_ai_response(prompt)
+            raw_analysis = cls._get_ai_response(prompt, fallback_prompt=fallback_prompt)
+            
+            # Сообщение об ошибке возвращается без форматирования, чтобы вызывающий код распознал его через _is_error_response
+            if cls._is_error_response(raw_analysis):
+                return cls._local_fallback(fallback_reviews, product_name, raw_analysis)
             
             # Форматируем ответ
             formatted_analysis = cls._format_analysis(raw_analysis)
+            cls.ANALYSIS_CACHE.put(cache_key, formatted_analysis)
             
             # Не добавляем информацию о количестве проанализированных отзывов
             
@@ -434,4 +1797,218 @@ class ReviewAnalyzer:
 Во время анализа отзывов произошла ошибка: {str(e)}
 
 Пожалуйста, попробуйте еще раз позже или проверьте наличие API ключа Groq.
-""" 
\ No newline at end of file
+""" 
+
+    @classmethod
+    def analyze_reviews_stream(cls, reviews: List[str], product_name: str) -> Iterator[str]:
+        """
+        Потоковый вариант analyze_reviews: возвращает фрагменты ответа модели по мере генерации.
+        Готовый анализ из кэша возвращается одним фрагментом. Итоговый текст получается
+        объединением фрагментов и обработкой через _format_analysis.
+        """
+        if not reviews:
+            yield f"""Анализ невозможен
+
+Для товара "{product_name}" не найдено отзывов."""
+            return
+        
+        logger.info(f"Начинаем потоковый анализ {len(reviews)} отзывов для товара '{product_name}'")
+        prompt, cache_key, fallback_prompt = cls._prepare_analysis_prompt(reviews, product_name)
+        cached_analysis = cls.ANALYSIS_CACHE.get(cache_key)
+        if cached_analysis is not None:
+            logger.info(f"Анализ для товара '{product_name}' взят из кэша")
+            yield cached_analysis
+            return
+        
+        parts = []
+        for part in cls._stream_ai_response(prompt, fallback_prompt):
+            parts.append(part)
+            yield part
+        
+        raw_analysis = "".join(parts)
+        if raw_analysis and not cls._is_error_response(raw_analysis):
+            cls.ANALYSIS_CACHE.put(cache_key, cls._format_analysis(raw_analysis))
+        logger.info(f"Потоковый анализ для товара '{product_name}' завершен")
+
+    @classmethod
+    def _save_history(cls, product_key: str, seen_ids: set, analysis: str, watermark: str) -> None:
+        """Сохраняет анализ в историю товара; сообщение об ошибке вместо анализа не сохраняется"""
+        if cls._is_error_response(analysis):
+            logger.warning(f"Анализ товара {product_key} завершился ошибкой и не сохранен в историю")
+            return
+        cls.REVIEW_HISTORY.save(product_key, seen_ids, analysis, watermark)
+    
+    @classmethod
+    def analyze_reviews_incremental(cls, product_key: str, reviews: List[Any], review_texts: List[str], product_name: str,
+                                    watermark: str = "") -> str:
+        """
+        Инкрементальный анализ отслеживаемого товара
+        
+        Args:
+            product_key: Ключ товара в истории (артикул)
+            reviews: Новые отзывы (результат WbReview.parse с exclude_ids и newer_than из истории)
+            review_texts: Тексты этих же отзывов для промпта
+            product_name: Название товара
+            watermark: Дата самого нового отзыва в загруженном ответе (WbReview.latest_review_date).
+                Следующий запуск считает новыми только более поздние отзывы, поэтому отзывы,
+                не вошедшие в лимит parse, не принимаются за новые
+            
+        Returns:
+            Строка с отформатированным анализом, обновленным с учетом новых отзывов
+        """
+        history = cls.REVIEW_HISTORY.get(product_key)
+        
+        # Товар анализируется впервые - выполняем полный анализ
+        if history is None:
+            # Ошибка и локальный анализ не сохраняются в историю: отзывы не отмечаются
+            # обработанными, и следующий запрос снова выполнит полный анализ моделью
+            analysis = cls.analyze_reviews(review_texts, product_name)
+            if cls._is_error_response(analysis):
+                return cls._local_fallback(reviews, product_name, analysis)
+            if reviews:
+                cls._save_history(product_key, {review.id for review in reviews if review.id}, analysis, watermark)
+            return analysis
+        
+        # Новых отзывов нет - предыдущий анализ актуален
+        if not reviews:
+            logger.info(f"Для товара '{product_name}' новых отзывов нет, используем сохраненный анализ")
+            return history["analysis"]
+        
+        try:
+            logger.info(f"Обновляем анализ товара '{product_name}' с учетом {len(reviews)} новых отзывов")
+            collapsed_reviews = cls._collapse_near_duplicates(review_texts)
+            make_prompt = lambda selected: cls._generate_incremental_prompt(history["analysis"], selected, product_name)
+            prompt, _ = cls._fit_prompt(make_prompt, collapsed_reviews, cls._current_model_name())
+            raw_analysis = cls._get_ai_response(
+                prompt, fallback_prompt=lambda model: cls._fit_prompt(make_prompt, collapsed_reviews, model)[0]
+            )
+            if cls._is_error_response(raw_analysis):
+                return raw_analysis
+            
+            analysis = cls._format_analysis(raw_analysis)
+            seen_ids = history["seen_ids"] | {review.id for review in reviews if review.id}
+            cls._save_history(product_key, seen_ids, analysis, max(history["watermark"], watermark))
+            return analysis
+        except Exception as e:
+            logger.error(f"Ошибка при инкрементальном анализе отзывов: {str(e)}")
+            return f"""Ошибка анализа отзывов
+
+Во время анализа отзывов произошла ошибка: {str(e)}
+
+Пожалуйста, попробуйте еще раз позже или проверьте наличие API ключа Groq.
+"""
+
+    @classmethod
+    def _summarize_chunks(cls, chunks: List[List[str]], product_name: str, model_name: str,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """
+        Этап map: параллельно получает сводки частей отзывов.
+        Готовые сводки кэшируются, поэтому повторный запуск не повторяет завершенные части.
+        Части, для которых модель вернула ошибку, пропускаются.
+        """
+        summaries: List[Optional[str]] = [None] * len(chunks)
+        pending = []
+        for index, chunk in enumerate(chunks):
+            cache_key = AnalysisCache.make_key(chunk, product_name, cls.PROMPT_VERSION, f"{model_name}:map")
+            cached = cls.ANALYSIS_CACHE.get(cache_key)
+            if cached is not None:
+                summaries[index] = cached
+            else:
+                pending.append((index, chunk, cache_key))
+        
+        done_count = len(chunks) - len(pending)
+        if progress_callback:
+            progress_callback(done_count, len(chunks))
+        
+        make_prompt = lambda selected: cls._generate_chunk_prompt(selected, product_name)
+        
+        def summarize(chunk: List[str], cache_key: str) -> Optional[str]:
+            # Часть подобрана под бюджет основной модели; для резервной модели отзывы части отбираются заново
+            response = cls._get_ai_response(
+                make_prompt(chunk), fallback_prompt=lambda model: cls._fit_prompt(make_prompt, chunk, model)[0]
+            )
+            if cls._is_error_response(response):
+                logger.warning(f"Не удалось получить сводку части отзывов: {response[:200]}")
+                return None
+            cls.ANALYSIS_CACHE.put(cache_key, response)
+            return response
+        
+        if pending:
+            workers = max(1, min(cls.MAP_REDUCE_MAX_WORKERS, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Замеры этапов в потоках пула попадают в детализацию времени запроса
+                futures = {
+                    executor.submit(contextvars.copy_context().run, summarize, chunk, cache_key): index
+                    for index, chunk, cache_key in pending
+                }
+                for future in as_completed(futures):
+                    summaries[futures[future]] = future.result()
+                    done_count += 1
+                    logger.info(f"Готова сводка {done_count} из {len(chunks)} для товара '{product_name}'")
+                    if progress_callback:
+                        progress_callback(done_count, len(chunks))
+        
+        return [summary for summary in summaries if summary]
+
+    @classmethod
+    def analyze_reviews_map_reduce(cls, reviews: List[str], product_name: str,
+                                   progress_callback: Optional[Callable[[int, int], None]] = None,
+                                   fallback_reviews: Optional[List[Any]] = None) -> str:
+        """
+        Анализ большого числа отзывов по схеме map-reduce: отзывы делятся на части
+        по бюджету токенов, для каждой части параллельно составляется сводка плюсов
+        и минусов, затем сводки объединяются в итоговый анализ
+        
+        Args:
+            reviews: Список строк с отзывами
+            product_name: Название товара
+            progress_callback: Вызывается как progress_callback(готово_частей, всего_частей)
+            fallback_reviews: Те же отзывы (wb.Review) для локального анализа при ошибке модели
+            
+        Returns:
+            Строка с отформатированным анализом отзывов или сообщение об ошибке, начинающееся с "Ошибка"
+        """
+        try:
+            if not reviews:
+                return f"""Анализ невозможен
+
+Для товара "{product_name}" не найдено отзывов."""
+            
+            model_name = cls._current_model_name()
+            collapsed_reviews = cls._collapse_near_duplicates(reviews)
+            chunk_template_tokens = cls._template_tokens(lambda selected: cls._generate_chunk_prompt(selected, product_name), model_name)
+            chunks = cls._chunk_reviews(collapsed_reviews, model_name, chunk_template_tokens)
+            
+            # Все отзывы помещаются в один запрос - обычный анализ
+            if len(chunks) == 1:
+                return cls.analyze_reviews(reviews, product_name, fallback_reviews)
+            
+            logger.info(f"Анализ map-reduce: {len(reviews)} отзывов для товара '{product_name}' разбиты на {len(chunks)} частей")
+            summaries = cls._summarize_chunks(chunks, product_name, model_name, progress_callback)
+            
+            # Сводки не помещаются в один запрос - сворачиваем их, пока не поместятся
+            while len(summaries) > 1:
+                summary_chunks = cls._chunk_reviews(summaries, model_name, chunk_template_tokens)
+                if len(summary_chunks) == 1:
+                    break
+                summaries = cls._summarize_chunks(summary_chunks, product_name, model_name)
+            
+            if not summaries:
+                raw_analysis = """Ошибка анализа отзывов
+
+Не удалось получить сводку ни для одной части отзывов. Пожалуйста, попробуйте еще раз позже."""
+            else:
+                raw_analysis = cls._get_ai_response(cls._generate_reduce_prompt(summaries, product_name, len(reviews)))
+            if cls._is_error_response(raw_analysis):
+                return cls._local_fallback(fallback_reviews, product_name, raw_analysis)
+            
+            logger.info(f"Анализ map-reduce для товара '{product_name}' успешно завершен")
+            return cls._format_analysis(raw_analysis)
+        except Exception as e:
+            logger.error(f"Ошибка при анализе отзывов map-reduce: {str(e)}")
+            return f"""Ошибка анализа отзывов
+
+Во время анализа отзывов произошла ошибка: {str(e)}
+
+Пожалуйста, попробуйте еще раз позже или проверьте наличие API ключа Groq.
+"""
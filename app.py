@@ -1,24 +1,52 @@
 import sys
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import json
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 import time
 import traceback
 import webbrowser
 import threading
+import atexit
+import hashlib
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+import http_cache
 
 try:
-    from ai import ReviewAnalyzer
-    from wb import WbReview
+    from ai import ReviewAnalyzer, LlmClients
+    from wb import WbReview, WbHttpPool, AsyncWbReview, AIOHTTP_AVAILABLE
+    from jobs import JobQueue, QueueFullError, create_job_store, ACTIVE_STATUSES
 except ImportError as e:
     print(f"Критическая ошибка импорта: {e}")
     # Если модули не найдены, продолжаем работу, но API будет неработоспособен
     ReviewAnalyzer = None
+    LlmClients = None
     WbReview = None
+    WbHttpPool = None
+    AsyncWbReview = None
+    AIOHTTP_AVAILABLE = False
+    JobQueue = None
+
+# Закрываем пулы соединений к Wildberries и клиентов моделей при остановке приложения
+if WbHttpPool:
+    atexit.register(WbHttpPool.close)
+if LlmClients:
+    atexit.register(LlmClients.close)
 
-app = Flask(__name__, static_folder='.', static_url_path='')
+# Каталог приложения не раздается целиком: доступны только файлы интерфейса (serve_index, serve_asset)
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
+# Максимальное число товаров, обрабатываемых одновременно в режиме сравнения
+MULTI_MODE_MAX_WORKERS = int(os.environ.get("MULTI_MODE_MAX_WORKERS", "4"))
+
+# Максимальное число отзывов, загружаемых для анализа в режиме map-reduce
+MAP_REDUCE_REVIEW_LIMIT = int(os.environ.get("MAP_REDUCE_REVIEW_LIMIT", "5000"))
+
 # Функция для извлечения ID товара из URL или прямого ввода
 def extract_product_id_py(url_or_id):
     if isinstance(url_or_id, str) and url_or_id.isdigit():
@@ -40,124 +68,556 @@ def extract_product_id_py(url_or_id):
     return "unknown_id"
 
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_reviews_api():
+def _build_review_texts(reviews_list):
+    """Подготовка текстов отзывов для анализа (текст каждого отзыва собирается один раз и хранится в нем)"""
+    return [review.prompt_text for review in reviews_list]
+
+
+def _analysis_fingerprint(product_id, reviews_list, variant):
+    """
+    Отпечаток анализа: артикул, набор отзывов, вариант анализа и версия промпта.
+    Используется как ETag ответа /api/analyze
+    """
+    digest = hashlib.sha256(f"{product_id}\0{variant}\0{ReviewAnalyzer.PROMPT_VERSION}".encode("utf-8"))
+    for review in reviews_list:
+        digest.update(b"\0")
+        digest.update(review.prompt_text.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def _model_fingerprint(fingerprint, analysis):
+    """
+    Отпечаток для ETag только у анализа модели: ошибка и локальный анализ, выданный
+    вместо ответа модели, не должны возвращаться клиенту как неизмененные (304)
+    """
+    return None if ReviewAnalyzer._is_degraded_response(analysis) else fingerprint
+
+
+def _load_product_for_comparison(input_str):
+    """Получает название и отзывы одного товара для режима сравнения"""
+    product_id = extract_product_id_py(input_str)
+    wb_instance = WbReview(product_id)
+    return _comparison_product(product_id, wb_instance.product_name, wb_instance.parse(only_this_variation=True))
+
+
+def _comparison_product(product_id, product_name, reviews_list):
+    """Данные товара для режима сравнения"""
+    product_name = product_name or f"Товар {product_id}"
+    return {
+        "product_id": product_id,
+        "product_name": product_name,
+        "reviews": reviews_list,
+        "fingerprint": _analysis_fingerprint(product_id, reviews_list, "single")
+    }
+
+
+def _comparison_fingerprint(products):
+    """Отпечаток сравнения по отпечаткам товаров; известен до запросов к модели"""
+    return hashlib.sha256("\0".join(product["fingerprint"] for product in products).encode("utf-8")).hexdigest()[:32]
+
+
+def _analyze_loaded_product(product):
+    """Анализ товара, загруженного _load_product_for_comparison"""
+    product_id, product_name, reviews_list = product["product_id"], product["product_name"], product["reviews"]
+    
+    current_analysis_text = ""
+    review_count = 0
+    if not reviews_list:
+        current_analysis_text = f"Для «{product_name}» (ID {product_id}) отзывов не найдено."
+    else:
+        review_count = len(reviews_list)
+        reviews_texts = _build_review_texts(reviews_list)
+        current_analysis_text = ReviewAnalyzer.analyze_reviews(reviews_texts, product_name, reviews_list)
+    
+    return {
+        "product_id": product_id,
+        "product_name": product_name,
+        "analysis": current_analysis_text,
+        "review_count": review_count,
+        "fingerprint": _model_fingerprint(product["fingerprint"], current_analysis_text)
+    }
+
+
+def _analyze_product_for_comparison(input_str):
+    """Получает отзывы и анализ одного товара для режима сравнения"""
+    return _analyze_loaded_product(_load_product_for_comparison(input_str))
+
+
+def _load_products_for_comparison(executor, valid_product_inputs):
+    """
+    Загружает отзывы всех товаров сравнения параллельно, в порядке ввода.
+    С установленным aiohttp товары загружаются одновременно в одном потоке через AsyncWbReview,
+    иначе - в потоках executor
+    """
+    if AIOHTTP_AVAILABLE:
+        product_ids = [extract_product_id_py(input_str) for input_str in valid_product_inputs]
+        loaded = asyncio.run(AsyncWbReview.parse_many(product_ids))
+        return [
+            _comparison_product(product_id, wb_instance.product_name, reviews_list)
+            for product_id, (wb_instance, reviews_list) in zip(product_ids, loaded)
+        ]
+    
+    # Каждый поток получает копию контекста, чтобы замеры этапов попали в детализацию времени
+    futures = [
+        executor.submit(contextvars.copy_context().run, _load_product_for_comparison, input_str)
+        for input_str in valid_product_inputs
+    ]
+    return [future.result() for future in futures]
+
+
+def _comparison_result_fingerprint(fingerprint, individual_analyses_data, overall_recommendation_text):
+    """Отпечаток сравнения для ETag, если все анализы и общий вывод получены от модели"""
+    if any(d["fingerprint"] is None for d in individual_analyses_data):
+        return None
+    return _model_fingerprint(fingerprint, overall_recommendation_text)
+
+
+def _comparison_unavailable_message(individual_analyses_data, comparison_prompt):
+    """Возвращает причину, по которой сравнение невозможно, или None"""
+    # Проверка возможности сравнения
+    failed_analyses = "Анализ не удалось завершить" in " ".join(d["analysis"] for d in individual_analyses_data)
+    not_enough_data_for_comparison = len(individual_analyses_data) < 2
+
+    if not comparison_prompt: 
+        return "Недостаточно данных для формирования общих рекомендаций."
+    elif failed_analyses or not_enough_data_for_comparison:
+        return "Не удалось выполнить полное сравнение из-за проблем с анализом одного или нескольких товаров, или недостаточного количества товаров для сравнения."
+    return None
+
+
+def _build_comparison_response(individual_analyses_data, overall_recommendation_text):
+    product_names_for_title = [d["product_name"] for d in individual_analyses_data]
+    overall_title = f"Сравнение: {', '.join(product_names_for_title)}"
+
+    return {
+        "comparison_title": overall_title,
+        "individual_product_analyses": individual_analyses_data,
+        "overall_recommendation": overall_recommendation_text,
+        "type": "multi"
+    }
+
+
+def _sse_event(event, payload):
+    """Форматирует событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _stream_single_analysis(product_url_input, known_fingerprints=None):
+    """
+    События потокового анализа одного товара.
+    Если отпечаток анализа есть в known_fingerprints (If-None-Match), вместо анализа
+    отправляется событие not_modified: клиент показывает сохраненный у себя результат
+    """
+    product_id = extract_product_id_py(product_url_input)
+    wb_instance = WbReview(product_id)
+    product_name = wb_instance.product_name or f"Товар {product_id}"
+    yield _sse_event("meta", {"type": "single", "product_name": product_name})
+    
+    reviews_list = wb_instance.parse(only_this_variation=True)
+    fingerprint = _analysis_fingerprint(product_id, reviews_list, "single")
+    if known_fingerprints and known_fingerprints.contains_weak(fingerprint):
+        yield _sse_event("not_modified", {"fingerprint": fingerprint})
+        return
+    
+    if not reviews_list:
+        analysis_result = f"В настоящее время для «{product_name}» (ID {product_id}) отзывов не найдено. Анализ невозможен."
+    else:
+        reviews_texts = _build_review_texts(reviews_list)
+        # Локальный анализ показывается сразу, пока модель формирует ответ
+        yield _sse_event("preview", {"analysis": ReviewAnalyzer.analyze_reviews_local(reviews_list, product_name)})
+        parts = []
+        for part in ReviewAnalyzer.analyze_reviews_stream(reviews_texts, product_name):
+            parts.append(part)
+            yield _sse_event("token", {"text": part})
+        raw_analysis = "".join(parts)
+        if ReviewAnalyzer._is_error_response(raw_analysis):
+            analysis_result = ReviewAnalyzer._local_fallback(reviews_list, product_name, raw_analysis)
+        else:
+            analysis_result = ReviewAnalyzer._format_analysis(raw_analysis)
+    
+    yield _sse_event("done", {
+        "product_name": product_name,
+        "analysis": analysis_result,
+        "type": "single",
+        "fingerprint": _model_fingerprint(fingerprint, analysis_result)
+    })
+
+
+def _stream_multi_analysis(valid_product_inputs, known_fingerprints=None):
+    """
+    События потокового сравнения: анализ каждого товара по готовности, затем общий вывод.
+    Если отзывы всех товаров не изменились (If-None-Match), отправляется событие not_modified
+    """
+    yield _sse_event("meta", {"type": "multi", "product_count": len(valid_product_inputs)})
+    
+    individual_analyses_data = [None] * len(valid_product_inputs)
+    workers = max(1, min(MULTI_MODE_MAX_WORKERS, len(valid_product_inputs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        products = _load_products_for_comparison(executor, valid_product_inputs)
+        fingerprint = _comparison_fingerprint(products)
+        if known_fingerprints and known_fingerprints.contains_weak(fingerprint):
+            yield _sse_event("not_modified", {"fingerprint": fingerprint})
+            return
+        
+        futures = {
+            executor.submit(_analyze_loaded_product, product): index
+            for index, product in enumerate(products)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            individual_analyses_data[index] = future.result()
+            yield _sse_event("product", dict(individual_analyses_data[index], index=index))
+    
+    comparison_prompt = ReviewAnalyzer._generate_comparison_prompt(individual_analyses_data)
+    overall_recommendation_text = _comparison_unavailable_message(individual_analyses_data, comparison_prompt)
+    if overall_recommendation_text is None:
+        parts = []
+        for part in ReviewAnalyzer._stream_ai_response(comparison_prompt):
+            parts.append(part)
+            yield _sse_event("token", {"text": part})
+        overall_recommendation_text = "".join(parts)
+    
+    response_data = _build_comparison_response(individual_analyses_data, overall_recommendation_text)
+    response_data["fingerprint"] = _comparison_result_fingerprint(fingerprint, individual_analyses_data, overall_recommendation_text)
+    yield _sse_event("done", response_data)
+
+
+# Потоковый анализ: ответ модели передается клиенту по мере генерации (Server-Sent Events)
+@app.route('/api/analyze/stream', methods=['POST'])
+def analyze_reviews_stream_api():
     if not WbReview or not ReviewAnalyzer:
         return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
 
     data = request.get_json()
     mode = data.get('mode')
 
+    if mode == 'single':
+        product_url_input = data.get('product_url')
+        if not product_url_input:
+            return jsonify({"error": "URL товара или ID не указан"}), 400
+        events = _stream_single_analysis(product_url_input, request.if_none_match)
+    elif mode == 'multi':
+        product_url_inputs = data.get('product_urls', [])
+        valid_product_inputs = [url for url in product_url_inputs if url and isinstance(url, str) and url.strip()]
+        if len(valid_product_inputs) < 2:
+            return jsonify({"error": "Для сравнения требуется как минимум два товара"}), 400
+        events = _stream_multi_analysis(valid_product_inputs, request.if_none_match)
+    else:
+        return jsonify({"error": "Неверный режим анализа"}), 400
+
+    def generate():
+        try:
+            yield from events
+        except Exception as e:
+            print(f"Ошибка в /api/analyze/stream: {traceback.format_exc()}")
+            yield _sse_event("error", {"error": f"Внутренняя ошибка сервера: {str(e)}"})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
+def _run_analysis(data, known_fingerprints=None, progress_callback=None):
+    """
+    Выполняет анализ по телу запроса /api/analyze
+    Возвращает (данные ответа, HTTP-статус)
+    С параметром "timings": true в ответ добавляется время каждого этапа анализа
+    known_fingerprints - ETag из If-None-Match: если отпечаток анализа совпадает, возвращается статус 304
+    progress_callback(готово_частей, всего_частей) - ход анализа в режиме map-reduce
+    """
+    if not data.get('timings'):
+        return _execute_analysis(data, known_fingerprints, progress_callback)
+    
+    with metrics.collect_timings() as timings:
+        response_data, status = _execute_analysis(data, known_fingerprints, progress_callback)
+    response_data["timings"] = timings
+    return response_data, status
+
+
+def _execute_analysis(data, known_fingerprints=None, progress_callback=None):
+    mode = data.get('mode')
+
     try:
         if mode == 'single':
             product_url_input = data.get('product_url')
             if not product_url_input:
-                return jsonify({"error": "URL товара или ID не указан"}), 400
+                return {"error": "URL товара или ID не указан"}, 400
 
             product_id = extract_product_id_py(product_url_input)
             
             # Получение данных о товаре
             wb_instance = WbReview(product_id)
             product_name = wb_instance.product_name or f"Товар {product_id}"
-            reviews_list = wb_instance.parse(only_this_variation=True)
+            
+            if data.get('incremental'):
+                # Инкрементальный режим: анализируются только отзывы, появившиеся с прошлого анализа
+                history = ReviewAnalyzer.REVIEW_HISTORY.get(product_id)
+                reviews_list = wb_instance.parse(
+                    only_this_variation=True,
+                    exclude_ids=history["seen_ids"] if history else None,
+                    newer_than=history["watermark"] if history else None,
+                )
+                
+                if not reviews_list and not history:
+                    analysis_result = f"В настоящее время для «{product_name}» (ID {product_id}) отзывов не найдено. Анализ невозможен."
+                else:
+                    analysis_result = ReviewAnalyzer.analyze_reviews_incremental(
+                        product_id, reviews_list, _build_review_texts(reviews_list), product_name,
+                        watermark=wb_instance.latest_review_date(),
+                    )
+                
+                response_data = {
+                    "product_name": product_name,
+                    "analysis": analysis_result,
+                    "new_review_count": len(reviews_list),
+                    "type": "single"
+                }
+                return response_data, 200
+            
+            # В режиме map-reduce анализируются все отзывы, а не только первые 300
+            map_reduce = bool(data.get('map_reduce'))
+            # Локальный режим: анализ по частоте упоминаний без запроса к модели
+            local = bool(data.get('local'))
+            reviews_list = wb_instance.parse(only_this_variation=True, limit=MAP_REDUCE_REVIEW_LIMIT if map_reduce else 300)
+
+            # Отзывы не изменились с прошлого запроса клиента - анализ не нужен
+            variant = "local" if local else "map_reduce" if map_reduce else "single"
+            fingerprint = _analysis_fingerprint(product_id, reviews_list, variant)
+            if known_fingerprints and known_fingerprints.contains_weak(fingerprint):
+                return {"fingerprint": fingerprint}, 304
 
             if not reviews_list:
                 analysis_result = f"В настоящее время для «{product_name}» (ID {product_id}) отзывов не найдено. Анализ невозможен."
             else:
-                # Подготовка текстов отзывов для анализа
-                reviews_texts = []
-                for r in reviews_list:
-                    text_parts = []
-                    if r.get('text'): text_parts.append(r.get('text'))
-                    if r.get('pros'): text_parts.append(f"Плюсы: {r.get('pros')}")
-                    if r.get('cons'): text_parts.append(f"Минусы: {r.get('cons')}")
-                    reviews_texts.append("\n".join(text_parts))
-                
-                analysis_result = ReviewAnalyzer.analyze_reviews(reviews_texts, product_name)
+                reviews_texts = _build_review_texts(reviews_list)
+                if local:
+                    analysis_result = ReviewAnalyzer.analyze_reviews_local(reviews_list, product_name)
+                elif map_reduce:
+                    analysis_result = ReviewAnalyzer.analyze_reviews_map_reduce(reviews_texts, product_name, progress_callback, reviews_list)
+                else:
+                    analysis_result = ReviewAnalyzer.analyze_reviews(reviews_texts, product_name, reviews_list)
             
             response_data = {
                 "product_name": product_name,
                 "analysis": analysis_result,
-                "type": "single"
+                "type": "single",
+                "fingerprint": _model_fingerprint(fingerprint, analysis_result)
             }
-            return jsonify(response_data)
+            return response_data, 200
 
         elif mode == 'multi':
             product_url_inputs = data.get('product_urls', [])
             valid_product_inputs = [url for url in product_url_inputs if url and isinstance(url, str) and url.strip()]
 
             if len(valid_product_inputs) < 2:
-                return jsonify({"error": "Для сравнения требуется как минимум два товара"}), 400
-
-            individual_analyses_data = []
+                return {"error": "Для сравнения требуется как минимум два товара"}, 400
 
-            for input_str in valid_product_inputs:
-                product_id = extract_product_id_py(input_str)
-                wb_instance = WbReview(product_id)
-                product_name = wb_instance.product_name or f"Товар {product_id}"
-                reviews_list = wb_instance.parse(only_this_variation=True)
+            # Товары обрабатываются параллельно, порядок результатов совпадает с порядком ввода
+            workers = max(1, min(MULTI_MODE_MAX_WORKERS, len(valid_product_inputs)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                products = _load_products_for_comparison(executor, valid_product_inputs)
                 
-                current_analysis_text = ""
-                review_count = 0
-                if not reviews_list:
-                    current_analysis_text = f"Для «{product_name}» (ID {product_id}) отзывов не найдено."
-                else:
-                    review_count = len(reviews_list)
-                    reviews_texts = []
-                    for r in reviews_list:
-                        text_parts = []
-                        if r.get('text'): text_parts.append(r.get('text'))
-                        if r.get('pros'): text_parts.append(f"Плюсы: {r.get('pros')}")
-                        if r.get('cons'): text_parts.append(f"Минусы: {r.get('cons')}")
-                        reviews_texts.append("\n".join(text_parts))
-                    current_analysis_text = ReviewAnalyzer.analyze_reviews(reviews_texts, product_name)
+                # Отзывы всех товаров не изменились с прошлого запроса клиента - анализ не нужен
+                fingerprint = _comparison_fingerprint(products)
+                if known_fingerprints and known_fingerprints.contains_weak(fingerprint):
+                    return {"fingerprint": fingerprint}, 304
                 
-                individual_analyses_data.append({
-                    "product_id": product_id,
-                    "product_name": product_name,
-                    "analysis": current_analysis_text,
-                    "review_count": review_count
-                })
+                futures = [
+                    executor.submit(contextvars.copy_context().run, _analyze_loaded_product, product)
+                    for product in products
+                ]
+                individual_analyses_data = [future.result() for future in futures]
             
             # Формирование общего сравнения товаров
             comparison_prompt = ReviewAnalyzer._generate_comparison_prompt(individual_analyses_data)
-            overall_recommendation_text = ""
-            
-            # Проверка возможности сравнения
-            failed_analyses = "Анализ не удалось завершить" in " ".join(d["analysis"] for d in individual_analyses_data)
-            not_enough_data_for_comparison = len(valid_product_inputs) < 2
-
-            if not comparison_prompt: 
-                overall_recommendation_text = "Недостаточно данных для формирования общих рекомендаций."
-            elif failed_analyses or not_enough_data_for_comparison:
-                overall_recommendation_text = "Не удалось выполнить полное сравнение из-за проблем с анализом одного или нескольких товаров, или недостаточного количества товаров для сравнения."
-            else:
+            overall_recommendation_text = _comparison_unavailable_message(individual_analyses_data, comparison_prompt)
+            if overall_recommendation_text is None:
                 overall_recommendation_text = ReviewAnalyzer._get_ai_response(comparison_prompt)
 
-            product_names_for_title = [d["product_name"] for d in individual_analyses_data]
-            overall_title = f"Сравнение: {', '.join(product_names_for_title)}"
-
-            response_data = {
-                "comparison_title": overall_title,
-                "individual_product_analyses": individual_analyses_data,
-                "overall_recommendation": overall_recommendation_text,
-                "type": "multi"
-            }
-            return jsonify(response_data)
+            response_data = _build_comparison_response(individual_analyses_data, overall_recommendation_text)
+            response_data["fingerprint"] = _comparison_result_fingerprint(fingerprint, individual_analyses_data, overall_recommendation_text)
+            return response_data, 200
 
         else:
-            return jsonify({"error": "Неверный режим анализа"}), 400
+            return {"error": "Неверный режим анализа"}, 400
     
     except Exception as e:
-        print(f"Ошибка в /api/analyze: {traceback.format_exc()}")
-        return jsonify({"error": f"Внутренняя ошибка сервера: {str(e)}"}), 500
+        print(f"Ошибка при анализе: {traceback.format_exc()}")
+        return {"error": f"Внутренняя ошибка сервера: {str(e)}"}, 500
+
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_reviews_api():
+    if not WbReview or not ReviewAnalyzer:
+        return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
+
+    response_data, status = _run_analysis(request.get_json(), request.if_none_match)
+    if status == 304:
+        response = Response(status=304)
+    else:
+        response = jsonify(response_data)
+        response.status_code = status
+    # Клиент может повторить запрос с If-None-Match и получить 304, если отзывы не изменились
+    if response_data.get("fingerprint"):
+        response.set_etag(response_data["fingerprint"])
+        response.cache_control.no_cache = True
+    return response
+
+# Очередь фоновых задач анализа
+analysis_jobs = JobQueue(
+    create_job_store(),
+    _run_analysis,
+    max_workers=int(os.environ.get("JOBS_MAX_WORKERS", "4")),
+    max_pending=int(os.environ.get("JOBS_MAX_PENDING", "100")),
+    ttl=float(os.environ.get("JOBS_TTL", "3600")),
+) if JobQueue else None
+
+
+def _public_job(job):
+    """Данные задачи для ответа клиенту"""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "progress": job["progress"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+# Фоновый анализ: запрос сразу возвращает идентификатор задачи
+@app.route('/api/jobs', methods=['POST'])
+def create_job_api():
+    if not analysis_jobs or not WbReview or not ReviewAnalyzer:
+        return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
+
+    data = request.get_json()
+    if not isinstance(data, dict) or data.get('mode') not in ('single', 'multi'):
+        return jsonify({"error": "Неверный режим анализа"}), 400
+
+    try:
+        job_id, deduplicated = analysis_jobs.submit(data)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job_id, "deduplicated": deduplicated}), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_api(job_id):
+    job = analysis_jobs.get(job_id) if analysis_jobs else None
+    if job is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+    return jsonify(_public_job(job))
+
+
+# Подписка на изменения статуса и хода выполнения задачи (Server-Sent Events)
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events_api(job_id):
+    if not analysis_jobs or analysis_jobs.get(job_id) is None:
+        return jsonify({"error": "Задача не найдена"}), 404
+
+    def generate():
+        last_status = None
+        last_progress = None
+        while True:
+            job = analysis_jobs.get(job_id)
+            if job is None:
+                yield _sse_event("error", {"error": "Задача не найдена"})
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                last_progress = job["progress"]
+                yield _sse_event("status", _public_job(job))
+            elif job["progress"] != last_progress:
+                last_progress = job["progress"]
+                yield _sse_event("progress", _public_job(job))
+            if job["status"] not in ACTIVE_STATUSES:
+                return
+            time.sleep(0.5)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+# Статистика пулов соединений к серверам Wildberries
+@app.route('/api/http-pool-stats', methods=['GET'])
+def http_pool_stats_api():
+    if not WbHttpPool:
+        return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
+    return jsonify(WbHttpPool.stats())
+
+# Статистика кэшей карточек товаров и отзывов, а также объединения запросов карточек
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats_api():
+    if not WbReview:
+        return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
+    return jsonify({
+        "cards": WbReview.CARD_CACHE.stats(),
+        "feedbacks": WbReview.FEEDBACKS_CACHE.stats(),
+        "card_batches": WbReview.CARD_BATCHER.stats(),
+    })
+
+# Состояние квот и время ответа серверов моделей
+@app.route('/api/llm-scheduler-stats', methods=['GET'])
+def llm_scheduler_stats_api():
+    if not ReviewAnalyzer:
+        return jsonify({"error": "Ошибка сервера: не удалось загрузить модули анализа."}), 500
+    return jsonify(ReviewAnalyzer.LLM_SCHEDULER.stats())
+
+def _cache_samples(field):
+    """Значения счетчика field для кэшей карточек и отзывов"""
+    return [({"cache": cache.name}, cache.stats()[field]) for cache in (WbReview.CARD_CACHE, WbReview.FEEDBACKS_CACHE)]
+
+if WbReview:
+    metrics.CallbackMetric("cache_hits_total", "Попадания в кэши карточек и отзывов", "counter", ("cache",),
+                           lambda: _cache_samples("hits"))
+    metrics.CallbackMetric("cache_misses_total", "Промахи кэшей карточек и отзывов", "counter", ("cache",),
+                           lambda: _cache_samples("misses"))
+    metrics.CallbackMetric("cache_bytes", "Размер кэшей карточек и отзывов", "gauge", ("cache",),
+                           lambda: _cache_samples("bytes"))
+if analysis_jobs:
+    metrics.CallbackMetric("jobs_pending", "Незавершенные фоновые задачи", "gauge", (),
+                           lambda: [({}, analysis_jobs.pending_count())])
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unknown"
+    metrics.HTTP_INFLIGHT.inc(endpoint=g.metrics_endpoint)
+
+@app.after_request
+def _count_request(response):
+    metrics.HTTP_REQUESTS.inc(endpoint=g.get("metrics_endpoint", "unknown"), status=response.status_code)
+    return response
+
+@app.after_request
+def _compress_response(response):
+    return http_cache.compress_response(response, request.accept_encodings)
+
+@app.teardown_request
+def _finish_request_metrics(error=None):
+    # Для потоковых ответов вызывается после отправки последнего события
+    if "metrics_endpoint" in g:
+        metrics.HTTP_INFLIGHT.dec(endpoint=g.metrics_endpoint)
+
+# Метрики в формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Файлы интерфейса: index.html ссылается на script.js и style.css с хэшем содержимого
+static_assets = http_cache.StaticAssets(os.path.dirname(os.path.abspath(__file__)))
 
 # Роут для главной страницы
 @app.route('/')
+@app.route('/index.html')
 def serve_index():
-    return send_from_directory(os.getcwd(), 'index.html')
+    return static_assets.response('index.html', request)
+
+@app.route('/<any("script.js", "style.css"):filename>')
+def serve_asset(filename):
+    return static_assets.response(filename, request)
 
 if __name__ == '__main__':
+    # Сервер разработки; для рабочего режима с несколькими воркерами используйте serve.py
     # Запуск на порту 5001 для избежания конфликтов
     app.run(host='0.0.0.0', debug=True, port=5001)
 
@@ -0,0 +1,423 @@
+"""
+Нагрузочный тест конвейера анализа отзывов без сети и квот моделей.
+
+Ответы detail.aspx, card.wb.ru и feedbacks1/2.wb.ru отдает локальный сервер-заглушка,
+вместо моделей используется локальная заглушка (LLM_BACKEND=stub). Измеряется время
+каждого этапа анализа и пропускная способность /api/analyze в режимах single и multi
+при разном числе одновременных запросов. Результат выводится в JSON.
+
+Запуск:
+    python benchmark.py run --sizes 10,100,1000,10000 --concurrency 1,4,16 --output bench.json
+    python benchmark.py record 12345678
+
+Команда record сохраняет настоящие ответы Wildberries для товара в каталог фикстур;
+записанные отзывы используются как образцы для ответов заглушки нужного размера.
+Без записанных фикстур отзывы генерируются детерминированно.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import platform
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Any, Dict, List, Optional
+
+DEFAULT_FIXTURES_DIR = "benchmark_fixtures"
+
+# Этапы анализа одного товара в порядке выполнения
+STAGES = ("get_product_info", "get_review_payload", "parse", "prompt_build", "llm", "format")
+
+_SAMPLE_TEXTS = [
+    "Отличный товар, полностью соответствует описанию",
+    "Качество хорошее, но доставка была долгой",
+    "Размер подошел, материал приятный к телу",
+    "Пришел с небольшим браком, продавец быстро заменил",
+    "За свои деньги очень достойно, рекомендую",
+    "Цвет немного отличается от фотографии",
+    "Пользуюсь месяц, полет нормальный",
+    "Упаковка была помята, сам товар целый",
+]
+_SAMPLE_PROS = ["Цена", "Качество материала", "Быстрая доставка", "Удобный", "Красивый цвет", ""]
+_SAMPLE_CONS = ["Запах", "Тонкая ткань", "Маломерит", "Нет", ""]
+
+
+class WbFixtures:
+    """
+    Ответы серверов Wildberries для товаров с заданным числом отзывов.
+    Для каждого размера создаются два товара, чтобы проверять режим сравнения.
+    """
+
+    PRODUCTS_PER_SIZE = 2
+
+    def __init__(self, sizes: List[int], fixtures_dir: str, seed: int = 0):
+        self.seed = seed
+        self.products: Dict[int, Dict[str, Any]] = {}
+        self.skus_by_size: Dict[int, List[str]] = {}
+        self._templates = self._load_recorded(fixtures_dir)
+        self._feedbacks_cache: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+        for size in sizes:
+            self.skus_by_size[size] = []
+            for variant in range(self.PRODUCTS_PER_SIZE):
+                sku = 100000000 + size * 10 + variant
+                self.products[sku] = {"size": size, "root": sku + 300000000}
+                self.skus_by_size[size].append(str(sku))
+        self._roots = {product["root"]: sku for sku, product in self.products.items()}
+
+    @staticmethod
+    def _load_recorded(fixtures_dir: str) -> Dict[str, Any]:
+        """Загружает записанные командой record ответы всех товаров каталога фикстур"""
+        templates = {"feedbacks": [], "card": None, "page": None}
+        if not os.path.isdir(fixtures_dir):
+            return templates
+        for name in sorted(os.listdir(fixtures_dir)):
+            path = os.path.join(fixtures_dir, name)
+            try:
+                with open(os.path.join(path, "feedbacks.json"), encoding="utf-8") as f:
+                    templates["feedbacks"].extend((json.load(f) or {}).get("feedbacks") or [])
+                if templates["card"] is None and os.path.exists(os.path.join(path, "card.json")):
+                    with open(os.path.join(path, "card.json"), encoding="utf-8") as f:
+                        templates["card"] = json.load(f)["data"]["products"][0]
+                if templates["page"] is None and os.path.exists(os.path.join(path, "detail.html")):
+                    with open(os.path.join(path, "detail.html"), "rb") as f:
+                        templates["page"] = f.read()
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"Пропускаем фикстуры {path}: {e}", file=sys.stderr)
+        return templates
+
+    def _make_feedback(self, rng: random.Random, sku: int, index: int) -> Dict[str, Any]:
+        if self._templates["feedbacks"]:
+            feedback = dict(self._templates["feedbacks"][index % len(self._templates["feedbacks"])])
+        else:
+            feedback = {
+                "text": f"{rng.choice(_SAMPLE_TEXTS)}. {rng.choice(_SAMPLE_TEXTS)}",
+                "pros": rng.choice(_SAMPLE_PROS),
+                "cons": rng.choice(_SAMPLE_CONS),
+                "productValuation": rng.randint(1, 5),
+                "color": "черный",
+                "size": "0",
+                "wbUserDetails": {"name": "Покупатель", "country": "ru"},
+                "photo": None,
+                "video": None,
+                "votes": {"pluses": rng.randint(0, 20), "minuses": rng.randint(0, 5)},
+            }
+        feedback["id"] = f"{sku}-{index}"
+        # Как и в настоящем ответе, в общей ленте есть отзывы о других вариантах товара
+        feedback["nmId"] = sku if index % 5 != 4 else sku + 1000
+        feedback["createdDate"] = f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T12:00:00Z"
+        return feedback
+
+    def feedbacks(self, root: int) -> Optional[bytes]:
+        sku = self._roots.get(root)
+        if sku is None:
+            return None
+        with self._lock:
+            body = self._feedbacks_cache.get(root)
+            if body is None:
+                rng = random.Random(self.seed + sku)
+                size = self.products[sku]["size"]
+                # Отзывы о других вариантах не входят в размер товара
+                count = size + size // 4
+                data = {"feedbacks": [self._make_feedback(rng, sku, index) for index in range(count)],
+                        "feedbackCount": count, "valuation": "4.7"}
+                body = self._feedbacks_cache[root] = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            return body
+
+    def card(self, skus: List[int]) -> bytes:
+        products = []
+        for sku in skus:
+            if sku not in self.products:
+                continue
+            product = dict(self._templates["card"] or {"brand": "Бренд", "colors": [{"name": "черный"}], "supplierRating": 4.8})
+            product.update(id=sku, root=self.products[sku]["root"],
+                           name=f"Товар с {self.products[sku]['size']} отзывами")
+            products.append(product)
+        return json.dumps({"state": 0, "data": {"products": products}}, ensure_ascii=False).encode("utf-8")
+
+    def page(self, sku: int) -> bytes:
+        if self._templates["page"] is not None:
+            return self._templates["page"]
+        return (f'<html><head><title>Wildberries</title></head><body>{"<div></div>" * 2000}'
+                f'<h1 class="product-page__title">Товар {sku}</h1></body></html>').encode("utf-8")
+
+
+class FixtureServer:
+    """Локальный HTTP-сервер, отвечающий вместо серверов Wildberries"""
+
+    def __init__(self, fixtures: WbFixtures):
+        self.fixtures = fixtures
+        fixtures_ref = fixtures
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело отправляются отдельно; без этого задержанное подтверждение TCP добавляет ~40 мс
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                body = None
+                try:
+                    if parts.path.endswith("/detail.aspx"):
+                        body = fixtures_ref.page(int(parts.path.split("/")[2]))
+                    elif parts.path.startswith("/cards/"):
+                        nm = parse_qs(parts.query).get("nm", [""])[0]
+                        body = fixtures_ref.card([int(sku) for sku in nm.split(";") if sku.isdigit()])
+                    elif parts.path.startswith("/feedbacks"):
+                        body = fixtures_ref.feedbacks(int(parts.path.rsplit("/", 1)[1]))
+                except ValueError:
+                    body = None
+
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8" if parts.path.endswith(".aspx") else "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def install(self) -> None:
+        """Направляет запросы WbReview на этот сервер"""
+        from wb import WbReview
+        WbReview.PRODUCT_PAGE_URL = self.base_url + "/catalog/{sku}/detail.aspx"
+        WbReview.CARD_API_URL = self.base_url + "/cards/v2/detail?appType=1&curr=byn&dest=-8144334&spp=30&nm={sku}"
+        WbReview.FEEDBACKS_URLS = (
+            self.base_url + "/feedbacks1/feedbacks/v1/{root_id}",
+            self.base_url + "/feedbacks2/feedbacks/v1/{root_id}",
+        )
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    """Статистика замеров в миллисекундах"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure_stages(fixtures: WbFixtures, repeat: int, limit: int) -> Dict[str, Any]:
+    """Время каждого этапа анализа одного товара при пустых кэшах"""
+    from app import _build_review_texts
+    from ai import ReviewAnalyzer
+    from wb import WbReview
+
+    results = {}
+    for size, skus in fixtures.skus_by_size.items():
+        timings = {stage: [] for stage in STAGES}
+        review_count = 0
+        for _ in range(repeat):
+            WbReview.CARD_CACHE.clear()
+            WbReview.FEEDBACKS_CACHE.clear()
+
+            started = time.perf_counter()
+            wb_instance = WbReview(skus[0])
+            timings["get_product_info"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            payload = wb_instance.get_review_payload()
+            timings["get_review_payload"].append(time.perf_counter() - started)
+
+            # Разбор уже загруженных данных, без повторного запроса
+            started = time.perf_counter()
+            reviews_list = wb_instance._select_feedbacks(payload, True, limit)
+            timings["parse"].append(time.perf_counter() - started)
+            review_count = len(reviews_list)
+
+            started = time.perf_counter()
+            prompt, _, fallback_prompt = ReviewAnalyzer._prepare_analysis_prompt(_build_review_texts(reviews_list), wb_instance.product_name)
+            timings["prompt_build"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            raw_analysis = ReviewAnalyzer._get_ai_response(prompt, fallback_prompt=fallback_prompt)
+            timings["llm"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            ReviewAnalyzer._format_analysis(raw_analysis)
+            timings["format"].append(time.perf_counter() - started)
+
+        results[str(size)] = {
+            "feedbacks_bytes": len(fixtures.feedbacks(fixtures.products[int(skus[0])]["root"])),
+            "reviews_parsed": review_count,
+            "stages": {stage: _summary(samples) for stage, samples in timings.items()},
+        }
+    return results
+
+
+def measure_throughput(fixtures: WbFixtures, concurrency_levels: List[int], requests_per_level: int,
+                       map_reduce: bool) -> Dict[str, Any]:
+    """Пропускная способность /api/analyze через настоящий HTTP-сервер приложения"""
+    import requests
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/analyze"
+
+    results = {}
+    try:
+        for size, skus in fixtures.skus_by_size.items():
+            payloads = {
+                "single": {"mode": "single", "product_url": skus[0], "map_reduce": map_reduce},
+                "multi": {"mode": "multi", "product_urls": skus},
+            }
+            for mode, payload in payloads.items():
+                for concurrency in concurrency_levels:
+                    session = requests.Session()
+                    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+                    def call(_):
+                        started = time.perf_counter()
+                        response = session.post(url, json=payload, timeout=600)
+                        return time.perf_counter() - started, response.status_code
+
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        outcomes = list(executor.map(call, range(requests_per_level)))
+                    elapsed = time.perf_counter() - started
+                    session.close()
+
+                    results.setdefault(str(size), {}).setdefault(mode, {})[str(concurrency)] = {
+                        "requests": requests_per_level,
+                        "errors": sum(1 for _, status in outcomes if status != 200),
+                        "requests_per_second": round(requests_per_level / elapsed, 3),
+                        "latency": _summary([latency for latency, _ in outcomes]),
+                    }
+    finally:
+        server.shutdown()
+    return results
+
+
+def run(args) -> Dict[str, Any]:
+    # Модули приложения читают настройки при импорте, поэтому окружение задается до него
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY"] = str(args.llm_latency)
+    os.environ["LLM_STUB_TOKEN_DELAY"] = "0"
+    os.environ.setdefault("GROQ_RPM", "0")
+    os.environ.setdefault("GROQ_TPM", "0")
+    os.environ.setdefault("GITHUB_MODELS_RPM", "0")
+    os.environ.setdefault("ANALYSIS_CACHE_MAX_AGE", "0")
+    if not args.warm_cache:
+        os.environ["WB_CARD_CACHE_TTL"] = "0"
+        os.environ["WB_FEEDBACKS_CACHE_TTL"] = "0"
+
+    fixtures = WbFixtures(args.sizes, args.fixtures, seed=args.seed)
+    fixture_server = FixtureServer(fixtures)
+    fixture_server.install()
+    logging.getLogger("ReviewAnalyzer").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    try:
+        result = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "sizes": args.sizes,
+                "concurrency": args.concurrency,
+                "repeat": args.repeat,
+                "requests_per_level": args.requests,
+                "llm_latency": args.llm_latency,
+                "warm_cache": args.warm_cache,
+                "map_reduce": args.map_reduce,
+                "recorded_fixtures": bool(fixtures._templates["feedbacks"]),
+            },
+            "stages": measure_stages(fixtures, args.repeat, args.limit),
+        }
+        if not args.skip_throughput:
+            result["throughput"] = measure_throughput(fixtures, args.concurrency, args.requests, args.map_reduce)
+        return result
+    finally:
+        fixture_server.close()
+
+
+def record(args) -> None:
+    """Сохраняет ответы Wildberries для товара в каталог фикстур"""
+    from wb import WbReview
+
+    wb_instance = WbReview(args.sku)
+    target = os.path.join(args.fixtures, wb_instance.sku)
+    os.makedirs(target, exist_ok=True)
+
+    responses = {
+        "detail.html": WbReview.HTTP.get(WbReview.PRODUCT_PAGE_URL.format(sku=wb_instance.sku), headers=WbReview.HEADERS),
+        "card.json": WbReview.HTTP.get(WbReview.CARD_API_URL.format(sku=wb_instance.sku), headers=WbReview.HEADERS),
+        "feedbacks.json": WbReview.HTTP.get(WbReview.FEEDBACKS_URLS[0].format(root_id=wb_instance.root_id), headers=WbReview.HEADERS),
+    }
+    for name, response in responses.items():
+        if response.status_code != 200:
+            print(f"{name}: HTTP {response.status_code}, не сохранено", file=sys.stderr)
+            continue
+        with open(os.path.join(target, name), "wb") as f:
+            f.write(response.content)
+        print(f"{name}: {len(response.content)} байт")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест анализа отзывов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Запустить замеры")
+    run_parser.add_argument("--sizes", type=_int_list, default=[10, 100, 1000, 10000], help="Числа отзывов у товаров")
+    run_parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="Числа одновременных запросов")
+    run_parser.add_argument("--requests", type=int, default=32, help="Запросов на каждый уровень нагрузки")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Повторов замера этапов")
+    run_parser.add_argument("--limit", type=int, default=300, help="Максимум отзывов для анализа")
+    run_parser.add_argument("--llm-latency", type=float, default=0.2, help="Задержка заглушки модели в секундах")
+    run_parser.add_argument("--warm-cache", action="store_true", help="Не отключать кэши карточек и отзывов")
+    run_parser.add_argument("--map-reduce", action="store_true", help="Анализировать товары в режиме map-reduce")
+    run_parser.add_argument("--skip-throughput", action="store_true", help="Только замеры этапов")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR, help="Каталог записанных фикстур")
+    run_parser.add_argument("--output", help="Файл для результата (по умолчанию stdout)")
+
+    record_parser = subparsers.add_parser("record", help="Записать ответы Wildberries для товара")
+    record_parser.add_argument("sku", help="Артикул или ссылка на товар")
+    record_parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR, help="Каталог фикстур")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args)
+        return
+
+    result = run(args)
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Локальный анализ отзывов без модели.
+
+Плюсы и минусы товара определяются по частоте слов и пар слов в полях «Плюсы» и
+«Минусы» отзывов. Результат имеет тот же вид, что и ответ модели (разделы «Плюсы»,
+«Минусы», «Рекомендации»), и используется как мгновенный предварительный анализ,
+пока отвечает модель, и как замена анализа, если серверы моделей недоступны.
+
+Тексты разделов всех отзывов нормализуются одним проходом по объединенной строке
+(регистр, ё, пунктуация): 10 тысяч отзывов обрабатываются за доли секунды
+(порядка 0,25-0,5 с в зависимости от длины разделов).
+"""
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from wb import Review
+
+# Перевод строки разделяет отзывы в объединенном тексте и не удаляется
+_NON_WORD_RE = re.compile(r"[^\w\n]+|_+|\d+")
+
+# Длина основы слова: "качество" и "качественный" считаются одним аспектом
+_STEM_LENGTH = 5
+
+# Сколько аспектов выводится в разделах «Плюсы» и «Минусы»
+MAX_ASPECTS = 5
+
+_STOP_WORDS = frozenset("""
+а без бы был была были было в вам вас весь во вот все всем всех вся вы где да даже для до его ее ей ему
+если есть еще же за здесь и из или им их к как ко когда кто ли либо мне меня мой моя мы на нам нас наш
+него нее нет ни них но ну о об однако он она они оно от очень по под при просто раз с свой своих себе
+со так также там то тоже только у уже хотя чем что чтобы эта эти это этот я вообще пока прям прямо
+вроде всё немного чуть сразу можно нужно было будет буду бывает который которые которая
+товар товара товаром товаре вещь вещи вещью покупка покупкой покупке
+плюсы плюс плюсов минусы минус минусов достоинства недостатки
+""".replace("ё", "е").split())
+
+# Основы слов, которые вместе с "не" означают отсутствие минусов ("не обнаружено", "не нашла")
+_NO_CONS_STEMS = frozenset({"обнар", "нашел", "нашла", "нашли", "замет", "выявл", "увиде", "имеет"})
+_NO_CONS_WORDS = frozenset({"отсутствуют", "отсутствует", "нету", "нема"})
+
+
+def _normalize_lines(texts: List[str]) -> List[str]:
+    """Нормализует все тексты за один проход по объединенной строке"""
+    joined = "\n".join(text.replace("\n", " ") for text in texts)
+    return _NON_WORD_RE.sub(" ", joined.lower().replace("ё", "е")).split("\n")
+
+
+def _tokens(line: str) -> Tuple[List[str], List[str]]:
+    """
+    Слова и основы слов раздела без служебных слов.
+    Частица "не" присоединяется к следующему слову: "не маломерит" - отдельный аспект.
+    """
+    words: List[str] = []
+    stems: List[str] = []
+    negate = False
+    for word in line.split():
+        if word == "не":
+            negate = True
+            continue
+        if word in _STOP_WORDS or len(word) < 3:
+            continue
+        stem = word[:_STEM_LENGTH]
+        if negate:
+            word, stem = "не " + word, "не " + stem
+            negate = False
+        words.append(word)
+        stems.append(stem)
+    return words, stems
+
+
+def _is_no_cons(stems: List[str], words: List[str]) -> bool:
+    """Раздел «Минусы» вида "нет", "не обнаружено", "минусов нет" не содержит жалоб"""
+    return all(stem[3:] in _NO_CONS_STEMS if stem.startswith("не ") else word in _NO_CONS_WORDS
+               for stem, word in zip(stems, words))
+
+
+def _count_aspects(lines: List[str], skip_empty_cons: bool) -> Tuple[Counter, List[Tuple[List[str], List[str]]], int]:
+    """
+    Считает, в скольких разделах встречается каждая основа и пара соседних основ.
+    Возвращает (счетчик, токены разделов, число непустых разделов).
+    """
+    counts: Counter = Counter()
+    tokenized = []
+    for line in lines:
+        words, stems = _tokens(line)
+        if not stems or (skip_empty_cons and _is_no_cons(stems, words)):
+            continue
+        tokenized.append((words, stems))
+        keys = set(stems)
+        keys.update(f"{a} {b}" for a, b in zip(stems, stems[1:]) if a != b)
+        counts.update(keys)
+    return counts, tokenized, len(tokenized)
+
+
+def _select_aspects(counts: Counter, total: int) -> List[Tuple[str, int]]:
+    """
+    Выбирает самые частые аспекты. Пара слов предпочтительнее отдельного слова,
+    если встречается не намного реже; аспекты с общими словами не повторяются.
+    """
+    min_count = 2 if total >= 20 else 1
+    candidates = []
+    for key, count in counts.most_common(MAX_ASPECTS * 20):
+        if count < min_count:
+            break
+        weight = count * 1.5 if len(_key_stems(key)) > 1 else count
+        candidates.append((weight, count, key))
+    candidates.sort(key=lambda item: -item[0])
+
+    selected: List[Tuple[str, int]] = []
+    used_stems = set()
+    for _, count, key in candidates:
+        key_stems = set(_key_stems(key))
+        if key_stems & used_stems:
+            continue
+        selected.append((key, count))
+        used_stems |= key_stems
+        if len(selected) == MAX_ASPECTS:
+            break
+    selected.sort(key=lambda item: -item[1])
+    return selected
+
+
+def _key_stems(key: str) -> List[str]:
+    """Основы аспекта; "не маломерит" - одна основа"""
+    return re.findall(r"(?:не )?\S+", key)
+
+
+def _surface_forms(aspects: List[Tuple[str, int]], tokenized: List[Tuple[List[str], List[str]]]) -> Dict[str, str]:
+    """Самая частая словоформа каждого аспекта: основа "качес" выводится как "качество" """
+    forms: Dict[str, Counter] = {key: Counter() for key, _ in aspects}
+    for words, stems in tokenized:
+        for i, stem in enumerate(stems):
+            if stem in forms:
+                forms[stem][words[i]] += 1
+            if i + 1 < len(stems):
+                pair = f"{stem} {stems[i + 1]}"
+                if pair in forms:
+                    forms[pair][f"{words[i]} {words[i + 1]}"] += 1
+    return {key: counter.most_common(1)[0][0] if counter else key for key, counter in forms.items()}
+
+
+def _in_reviews(count: int) -> str:
+    """Число отзывов в предложном падеже: "в 1 отзыве", "в 5 отзывах" """
+    return f"в {count} отзыве" if count % 10 == 1 and count % 100 != 11 else f"в {count} отзывах"
+
+
+def _format_aspects(aspects: List[Tuple[str, int]], forms: Dict[str, str]) -> List[str]:
+    return [f"- {forms[key][:1].upper()}{forms[key][1:]} (упоминается {_in_reviews(count)})" for key, count in aspects]
+
+
+def analyze(reviews: List["Review"], product_name: str, note: str = "") -> str:
+    """
+    Анализ отзывов по частоте упоминаний.
+
+    Args:
+        reviews: Отзывы (wb.Review); учитываются поля pros и cons
+        product_name: Название товара
+        note: Пояснение, добавляемое в конец раздела «Рекомендации»
+
+    Returns:
+        Анализ в формате ответа модели: «Плюсы», «Минусы», «Рекомендации»
+    """
+    pros_counts, pros_tokens, pros_total = _count_aspects(_normalize_lines([review.pros for review in reviews]), False)
+    cons_counts, cons_tokens, cons_total = _count_aspects(_normalize_lines([review.cons for review in reviews]), True)
+
+    pros = _select_aspects(pros_counts, pros_total)
+    cons = _select_aspects(cons_counts, cons_total)
+    pros_forms = _surface_forms(pros, pros_tokens)
+    cons_forms = _surface_forms(cons, cons_tokens)
+
+    pros_lines = _format_aspects(pros, pros_forms) or ["- Покупатели не указали повторяющихся достоинств"]
+    cons_lines = _format_aspects(cons, cons_forms) or ["- Повторяющихся недостатков в отзывах не найдено"]
+
+    recommendations = []
+    if pros:
+        recommendations.append("Чаще всего покупатели отмечают: " + ", ".join(pros_forms[key] for key, _ in pros[:3]) + ".")
+    if cons:
+        recommendations.append("Перед покупкой обратите внимание на жалобы: " + ", ".join(cons_forms[key] for key, _ in cons[:3]) + ".")
+    else:
+        recommendations.append(f"Серьезных повторяющихся претензий к товару «{product_name}» нет.")
+    recommendations.append(f"Анализ составлен по частоте упоминаний {_in_reviews(len(reviews))}: "
+                           f"плюсы указаны в {pros_total}, минусы - в {cons_total}.")
+    if note:
+        recommendations.append(note)
+
+    return ("Плюсы:\n" + "\n".join(pros_lines)
+            + "\n\nМинусы:\n" + "\n".join(cons_lines)
+            + "\n\nРекомендации:\n" + " ".join(recommendations))
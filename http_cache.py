@@ -0,0 +1,154 @@
+"""
+Сжатие ответов и кэширование статических файлов интерфейса.
+
+Ответы API сжимаются gzip или brotli (если установлен пакет brotli) в зависимости
+от заголовка Accept-Encoding клиента. Файлы интерфейса хранятся в памяти вместе со
+сжатыми вариантами; ссылки на script.js и style.css в index.html содержат хэш
+содержимого, поэтому такие запросы кэшируются браузером без повторной проверки.
+"""
+import os
+import re
+import gzip
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask import Response
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Ответы меньше этого размера не сжимаются
+COMPRESS_MIN_SIZE = int(os.environ.get("HTTP_COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("HTTP_GZIP_LEVEL", "6"))
+# Для ответов API используется быстрый уровень, статические файлы сжимаются один раз максимально
+BROTLI_QUALITY = int(os.environ.get("HTTP_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json", "application/javascript", "text/javascript",
+    "text/html", "text/css", "text/plain",
+}
+
+# Срок кэширования файлов, запрошенных по ссылке с хэшем содержимого
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    """Лучшее поддерживаемое сжатие из заголовка Accept-Encoding (request.accept_encodings)"""
+    return accept_encodings.best_match(_encodings())
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response: Response, accept_encodings) -> Response:
+    """
+    Сжимает тело готового ответа, если клиент это поддерживает.
+    Потоковые ответы (Server-Sent Events) и файлы не сжимаются.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # Сжатый ответ побайтово отличается от исходного, поэтому ETag становится слабым
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class StaticAssets:
+    """
+    Файлы интерфейса в памяти: исходное содержимое, сжатые варианты и хэш.
+    Файл перечитывается, если он изменился на диске.
+    """
+
+    MIMETYPES = {".html": "text/html", ".js": "application/javascript", ".css": "text/css"}
+
+    def __init__(self, directory: str, index: str = "index.html"):
+        self.directory = directory
+        self.index = index
+        self._assets: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name: str) -> Dict:
+        path = os.path.join(self.directory, name)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(name)
+        if asset is not None and asset["version"] == version and (name != self.index or self._links_current(asset)):
+            return asset
+
+        with open(path, "rb") as f:
+            data = f.read()
+        links = {}
+        if name == self.index:
+            data, links = self._link_hashed(data)
+        asset = {
+            "version": version,
+            "hash": hashlib.sha256(data).hexdigest()[:16],
+            "mimetype": self.MIMETYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+            "links": links,
+            "variants": {None: data},
+        }
+        for encoding in _encodings():
+            asset["variants"][encoding] = compress(data, encoding, best=True)
+        with self._lock:
+            self._assets[name] = asset
+        return asset
+
+    def _links_current(self, asset: Dict) -> bool:
+        """Проверяет, что файлы, на которые ссылается index.html, не изменились"""
+        return all(self._load(name)["hash"] == file_hash for name, file_hash in asset["links"].items())
+
+    def _link_hashed(self, html: bytes) -> Tuple[bytes, Dict[str, str]]:
+        """Добавляет к ссылкам на локальные .js и .css параметр с хэшем содержимого"""
+        links = {}
+
+        def replace(match):
+            name = match.group(2).decode("utf-8")
+            if not os.path.isfile(os.path.join(self.directory, name)):
+                return match.group(0)
+            links[name] = self._load(name)["hash"]
+            return match.group(1) + f"{name}?v={links[name]}".encode("utf-8") + match.group(3)
+
+        html = re.sub(rb'((?:src|href)=")([\w./-]+\.(?:js|css))(")', replace, html)
+        return html, links
+
+    def response(self, name: str, request) -> Response:
+        """Ответ с файлом name с учетом Accept-Encoding и If-None-Match"""
+        asset = self._load(name)
+        encoding = choose_encoding(request.accept_encodings)
+        response = Response(asset["variants"][encoding], mimetype=asset["mimetype"])
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        # У каждого варианта сжатия свой ETag
+        response.set_etag(f"{asset['hash']}-{encoding or 'identity'}")
+        if name != self.index and request.args.get("v") == asset["hash"]:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ai import DATA_DIR, SqliteStore
+
+logger = logging.getLogger('AnalysisJobs')
+
+# Статусы задач
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Процесс раз в HEARTBEAT_INTERVAL секунд обновляет время своих незавершенных задач.
+# Незавершенная задача, которую не обновляли дольше STALE_AFTER, осталась от завершившегося
+# процесса: она отмечается как failed и не используется для объединения одинаковых запросов
+HEARTBEAT_INTERVAL = float(os.environ.get("JOBS_HEARTBEAT_INTERVAL", "10"))
+STALE_AFTER = HEARTBEAT_INTERVAL * 6
+
+ORPHANED_ERROR = "Задача прервана: процесс, выполнявший ее, был остановлен. Повторите запрос"
+
+
+class InMemoryJobStore:
+    """Хранилище задач в памяти процесса"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, key: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id, "key": key, "status": QUEUED, "payload": payload,
+                "result": None, "error": None, "progress": None, "created_at": now, "updated_at": now,
+            }
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def find_active(self, key: str) -> Optional[str]:
+        """Идентификатор незавершенной задачи с тем же ключом"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["key"] == key and job["status"] in ACTIVE_STATUSES:
+                    return job["job_id"]
+        return None
+
+    def touch(self, job_ids: List[str]) -> None:
+        """Обновляет время незавершенных задач (heartbeat процесса, который их выполняет)"""
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is not None and job["status"] in ACTIVE_STATUSES:
+                    job["updated_at"] = now
+
+    def fail_stale(self, older_than: float, error: str) -> None:
+        """Отмечает как failed незавершенные задачи, не обновлявшиеся с older_than"""
+        now = time.time()
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] in ACTIVE_STATUSES and job["updated_at"] < older_than:
+                    job.update(status=FAILED, error=error, updated_at=now)
+
+    def purge(self, older_than: float) -> None:
+        """Удаляет завершенные задачи, обновленные раньше older_than"""
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job["status"] not in ACTIVE_STATUSES and job["updated_at"] < older_than]:
+                del self._jobs[job_id]
+
+
+class SqliteJobStore(SqliteStore):
+    """
+    Хранилище задач в SQLite: статусы и результаты переживают перезапуск
+    и видны всем процессам, использующим один файл базы
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "job_id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+        "result TEXT, error TEXT, progress TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS jobs_key_status ON jobs(key, status)",
+    ]
+    MIGRATIONS = ["ALTER TABLE jobs ADD COLUMN progress TEXT"]
+
+    # Поля, которые хранятся в JSON
+    _JSON_FIELDS = ("result", "progress")
+    _COLUMNS = ("job_id", "key", "status", "payload", "result", "error", "progress", "created_at", "updated_at")
+
+    def create(self, job_id: str, key: str, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO jobs (job_id, key, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, key, QUEUED, json.dumps(payload, ensure_ascii=False), now, now),
+            )
+
+    def update(self, job_id: str, **fields) -> None:
+        for name in self._JSON_FIELDS:
+            if name in fields:
+                fields[name] = json.dumps(fields[name], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        connection = self._connection()
+        with connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if not row:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        for name in self._JSON_FIELDS:
+            job[name] = json.loads(job[name]) if job[name] else None
+        return job
+
+    def find_active(self, key: str) -> Optional[str]:
+        """Идентификатор незавершенной задачи с тем же ключом"""
+        row = self._connection().execute(
+            "SELECT job_id FROM jobs WHERE key = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+            (key, *ACTIVE_STATUSES),
+        ).fetchone()
+        return row[0] if row else None
+
+    def touch(self, job_ids: List[str]) -> None:
+        """Обновляет время незавершенных задач (heartbeat процесса, который их выполняет)"""
+        if not job_ids:
+            return
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status IN (?, ?) AND job_id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *ACTIVE_STATUSES, *job_ids),
+            )
+
+    def fail_stale(self, older_than: float, error: str) -> None:
+        """Отмечает как failed незавершенные задачи, не обновлявшиеся с older_than"""
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND updated_at < ?",
+                (FAILED, error, time.time(), *ACTIVE_STATUSES, older_than),
+            )
+
+    def purge(self, older_than: float) -> None:
+        """Удаляет завершенные задачи, обновленные раньше older_than"""
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?",
+                (*ACTIVE_STATUSES, older_than),
+            )
+
+
+def create_job_store():
+    """Создает хранилище задач по переменной окружения JOBS_BACKEND (memory или sqlite)"""
+    backend = os.environ.get("JOBS_BACKEND", "memory")
+    if backend == "sqlite":
+        return SqliteJobStore(os.environ.get("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.sqlite3")))
+    if backend != "memory":
+        logger.warning(f"Неизвестное хранилище задач '{backend}', используем memory")
+    return InMemoryJobStore()
+
+
+class QueueFullError(Exception):
+    """Очередь задач переполнена"""
+
+
+class JobQueue:
+    """
+    Очередь фоновых задач анализа с пулом исполнителей.
+    Одинаковые задачи, которые еще не завершились, не запускаются повторно:
+    клиент получает идентификатор уже существующей задачи.
+    Незавершенные задачи этого процесса периодически отмечаются в хранилище (heartbeat);
+    задачи завершившегося процесса отмечаются как failed и не объединяются с новыми.
+    """
+
+    def __init__(self, store, runner: Callable[..., Tuple[Dict[str, Any], int]],
+                 max_workers: int, max_pending: int, ttl: float):
+        """
+        Args:
+            store: Хранилище задач (InMemoryJobStore или SqliteJobStore)
+            runner: Функция, выполняющая задачу: runner(данные, progress_callback=...);
+                возвращает (результат, HTTP-статус). progress_callback(готово, всего)
+                сохраняет ход выполнения в поле progress задачи
+            max_workers: Число одновременно выполняемых задач
+            max_pending: Максимальное число незавершенных задач этого процесса
+            ttl: Время хранения завершенных задач в секундах
+        """
+        self.store = store
+        self.runner = runner
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._lock = threading.Lock()
+        self._pending = 0
+        # Незавершенные задачи этого процесса и поток, обновляющий их время
+        self._active_ids = set()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """Ключ задачи для поиска одинаковых запросов"""
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def submit(self, payload: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Ставит задачу в очередь
+        Возвращает (идентификатор задачи, True если задача уже выполнялась и была переиспользована)
+        """
+        key = self.make_key(payload)
+        with self._lock:
+            self._start_heartbeat()
+            self.store.fail_stale(time.time() - STALE_AFTER, ORPHANED_ERROR)
+            existing_job_id = self.store.find_active(key)
+            if existing_job_id is not None:
+                return existing_job_id, True
+            if self._pending >= self.max_pending:
+                raise QueueFullError("Слишком много задач в очереди, попробуйте позже")
+
+            self.store.purge(time.time() - self.ttl)
+            job_id = uuid.uuid4().hex
+            self.store.create(job_id, key, payload)
+            self._pending += 1
+            self._active_ids.add(job_id)
+
+        self._executor.submit(self._run, job_id, payload)
+        return job_id, False
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is not None and job["status"] in ACTIVE_STATUSES and job["updated_at"] < time.time() - STALE_AFTER:
+            # Процесс, выполнявший задачу, завершился - клиент получает ошибку вместо вечного ожидания
+            self.store.fail_stale(time.time() - STALE_AFTER, ORPHANED_ERROR)
+            job = self.store.get(job_id)
+        return job
+
+    def pending_count(self) -> int:
+        """Число незавершенных задач этого процесса"""
+        with self._lock:
+            return self._pending
+
+    def _start_heartbeat(self) -> None:
+        """
+        Запускает поток heartbeat при первой задаче. Поток создается в процессе, который
+        выполняет задачи: при запуске через serve.py это воркер, а не главный процесс
+        """
+        if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="analysis-job-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                job_ids = list(self._active_ids)
+            try:
+                self.store.touch(job_ids)
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка обновления времени задач: {str(e)}")
+
+    def _report_progress(self, job_id: str, done: int, total: int) -> None:
+        """Сохраняет ход выполнения задачи; ошибка записи не прерывает анализ"""
+        try:
+            self.store.update(job_id, progress={"done": done, "total": total})
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка сохранения хода задачи {job_id}: {str(e)}")
+
+    def _run(self, job_id: str, payload: Dict[str, Any]) -> None:
+        try:
+            self.store.update(job_id, status=RUNNING)
+            result, status = self.runner(payload, progress_callback=lambda done, total: self._report_progress(job_id, done, total))
+            if status == 200:
+                self.store.update(job_id, status=DONE, result=result)
+            else:
+                self.store.update(job_id, status=FAILED, error=result.get("error", f"Ошибка {status}"))
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи {job_id}: {str(e)}")
+            try:
+                self.store.update(job_id, status=FAILED, error=str(e))
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._active_ids.discard(job_id)
@@ -0,0 +1,218 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Префикс имен всех метрик приложения
+PREFIX = "wb_analyzer_"
+
+# Границы корзин гистограмм времени в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+# Замеры этапов текущего запроса (если для него включена детализация времени)
+_current_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("trace", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Метрика с набором меток в текстовом формате Prometheus"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        """Увеличивает значение на время выполнения блока"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            items = [(key, {"counts": list(state["counts"]), "sum": state["sum"], "count": state["count"]})
+                     for key, state in self._values.items()]
+        for key, state in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, state["sum"]
+            yield f"{self.name}_count", labels, state["count"]
+
+
+class CallbackMetric(_Metric):
+    """Метрика, значения которой вычисляются при каждом запросе /metrics"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Tuple[str, ...],
+                 callback: Callable[[], List[Tuple[Dict[str, Any], float]]]):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for labels, value in self.callback():
+            yield self.name, {name: str(labels.get(name, "")) for name in self.labelnames}, value
+
+
+# Время этапов анализа: страница товара, card.wb.ru, отзывы, разбор, промпт, модель, форматирование
+STAGE_SECONDS = Histogram("stage_seconds", "Время этапов анализа", ("stage",))
+
+# Время запросов к внешним серверам: хосты Wildberries и серверы моделей
+UPSTREAM_SECONDS = Histogram("upstream_request_seconds", "Время запросов к внешним серверам", ("upstream", "outcome"))
+
+LLM_RETRIES = Counter("llm_retries_total", "Повторные попытки запроса к модели", ("backend",))
+LLM_RATE_LIMITED = Counter("llm_rate_limited_total", "Ответы 429 от серверов моделей", ("backend",))
+LLM_FALLBACKS = Counter("llm_fallbacks_total", "Переключения на резервный сервер модели", ("reason",))
+LLM_INFLIGHT = Gauge("llm_inflight_requests", "Выполняющиеся запросы к моделям", ("backend",))
+
+CARD_BATCH_SIZE = Histogram("card_batch_size", "Число артикулов в одном запросе к card.wb.ru", buckets=(1, 2, 5, 10, 20, 50, 100))
+FEEDBACKS_MIRROR_FALLBACKS = Counter("feedbacks_mirror_fallbacks_total", "Отзывы получены не от первого опрошенного зеркала")
+ANALYSIS_CACHE_REQUESTS = Counter("analysis_cache_requests_total", "Обращения к кэшу готовых анализов", ("result",))
+
+HTTP_REQUESTS = Counter("http_requests_total", "Запросы к API приложения", ("endpoint", "status"))
+HTTP_INFLIGHT = Gauge("http_inflight_requests", "Выполняющиеся запросы к API приложения", ("endpoint",))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замеряет время этапа анализа; при включенной детализации добавляет замер в ответ запроса"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((name, elapsed))
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, Any]]:
+    """
+    Собирает замеры этапов, выполненных в блоке, в словарь
+    {"total_ms": ..., "stages": {этап: {"count": ..., "total_ms": ...}}}.
+    Для потоков пула контекст нужно передавать через contextvars.copy_context().
+    """
+    trace: List[Tuple[str, float]] = []
+    token = _current_trace.set(trace)
+    result: Dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        _current_trace.reset(token)
+        stages: Dict[str, Dict[str, float]] = {}
+        for name, elapsed in list(trace):
+            entry = stages.setdefault(name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += elapsed * 1000
+        for entry in stages.values():
+            entry["total_ms"] = round(entry["total_ms"], 3)
+        result["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        result["stages"] = stages
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -161,26 +161,69 @@ document.addEventListener("DOMContentLoaded", () => {
         updateLoadingProgress(0.1, "Отправка запроса на сервер...");
 
         try {
-            const response = await fetch(`${API_BASE_URL}/api/analyze`, {
+            const headers = { 'Content-Type': 'application/json' };
+            // Если отзывы не изменились с прошлого анализа, сервер не запускает анализ и присылает событие not_modified
+            const cachedEntry = findCachedEntry(requestBody);
+            if (cachedEntry) headers['If-None-Match'] = `"${cachedEntry.fingerprint}"`;
+
+            const response = await fetch(`${API_BASE_URL}/api/analyze/stream`, {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
+                headers,
                 body: JSON.stringify(requestBody)
             });
-            
-            updateLoadingProgress(0.5, "Обработка ответа от сервера...");
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ error: "Не удалось обработать ошибку сервера." }));
                 throw new Error(errorData.error || `Ошибка сервера: ${response.status}`);
             }
 
-            const resultData = await response.json();
-            updateLoadingProgress(0.8, "Подготовка результатов...");
-            await new Promise(resolve => setTimeout(resolve, 300)); // Небольшая пауза для "красоты"
+            updateLoadingProgress(0.3, "Получение отзывов...");
+
+            // Ответ приходит потоком событий: текст анализа показывается по мере генерации
+            let resultData = null;
+            let streamedText = "";
+            let productCount = 0;
+            let productsDone = 0;
+            await readEventStream(response, (event, payload) => {
+                if (event === "meta") {
+                    productCount = payload.product_count || 1;
+                    if (payload.type === "single") {
+                        clearResultView();
+                        singleResultContainer.style.display = "block";
+                        productNameResult.textContent = payload.product_name;
+                        updateLoadingProgress(0.5, "Анализируем отзывы...");
+                    }
+                } else if (event === "product") {
+                    productsDone += 1;
+                    updateLoadingProgress(0.3 + 0.6 * productsDone / productCount, `Готов анализ товара ${productsDone} из ${productCount}`);
+                } else if (event === "preview") {
+                    // Предварительный анализ без модели; заменяется ответом модели по мере генерации
+                    showScreen("results");
+                    analysisResultText.textContent = payload.analysis;
+                } else if (event === "token") {
+                    streamedText += payload.text;
+                    if (requestBody.mode === "single") {
+                        if (streamedText === payload.text) showScreen("results"); // Первый фрагмент ответа
+                        analysisResultText.textContent = streamedText;
+                    } else {
+                        updateLoadingProgress(0.95, "Формируем общий вывод...");
+                    }
+                } else if (event === "done") {
+                    resultData = payload;
+                } else if (event === "not_modified") {
+                    // Показываем сохраненный результат; запись истории переносится наверх
+                    resultData = { ...cachedEntry };
+                    analysisHistory.splice(analysisHistory.indexOf(cachedEntry), 1);
+                } else if (event === "error") {
+                    throw new Error(payload.error);
+                }
+            });
 
-            let historyEntryData = { ...resultData, timestamp: new Date() };
+            if (!resultData) {
+                throw new Error("Соединение с сервером прервано до завершения анализа.");
+            }
+
+            let historyEntryData = { ...resultData, request: requestBody, timestamp: new Date() };
 
             if (resultData.type === "single") {
                 displaySingleResult(resultData.product_name, resultData.analysis);
@@ -190,7 +233,6 @@ document.addEventListener("DOMContentLoaded", () => {
             
             addHistoryEntry(historyEntryData);
             updateLoadingProgress(1, "Анализ завершен!");
-            await new Promise(resolve => setTimeout(resolve, 300));
             showScreen("results");
             resultsSection.dataset.fromHistory = "false"; // Это новый результат
 
@@ -201,6 +243,30 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    // Чтение потока Server-Sent Events из ответа fetch
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf("\n\n")) !== -1) {
+                const rawEvent = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+                let event = "message";
+                let data = "";
+                rawEvent.split("\n").forEach(line => {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
     function updateLoadingProgress(value, message) {
         const progressBar = document.getElementById("progressBar");
         const loadingMessage = document.getElementById("loadingMessage");
@@ -273,6 +339,12 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 
     // --- Управление историей ---
+    // Последняя запись истории с тем же запросом, для которой сервер вернул отпечаток анализа
+    function findCachedEntry(requestBody) {
+        const requestKey = JSON.stringify(requestBody);
+        return analysisHistory.find(entry => entry.fingerprint && JSON.stringify(entry.request) === requestKey);
+    }
+
     function addHistoryEntry(entryData) {
         analysisHistory.unshift(entryData); // Добавляем в начало (новые сверху)
         if (analysisHistory.length > 20) { // Ограничение на 20 записей
@@ -0,0 +1,268 @@
+"""
+Запуск приложения в рабочем режиме.
+
+Приложение загружается один раз в главном процессе, после чего создаются процессы-воркеры
+(fork), которые используют загруженные модули и слушающий сокет главного процесса.
+Каждый воркер обслуживает запросы пулом потоков фиксированного размера и, пока все потоки
+заняты, не принимает новые соединения: они достаются свободным воркерам. Главный процесс
+перезапускает завершившиеся воркеры и останавливает их по SIGTERM или Ctrl+C.
+На системах без fork (Windows) запускается один процесс с пулом потоков.
+
+При запуске выводятся время загрузки приложения и память главного процесса и каждого воркера.
+
+Запуск:
+    python serve.py --workers 4 --threads 8 --port 5001
+
+Настройки по умолчанию задаются переменными окружения WEB_HOST, WEB_PORT, WEB_WORKERS,
+WEB_THREADS и WEB_REQUEST_TIMEOUT.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Сколько секунд воркер ждет завершения текущих запросов при остановке
+GRACEFUL_TIMEOUT = 10.0
+
+# Воркер, завершившийся быстрее этого времени, перезапускается с паузой
+MIN_WORKER_UPTIME = 1.0
+
+
+def _rss_mb() -> float:
+    """Занимаемая процессом память (RSS) в мегабайтах"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Пиковое значение: на Linux в килобайтах, на macOS в байтах
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # HTTP/1.1 нужен для потоковых ответов (chunked); соединение Werkzeug закрывает после каждого ответа
+    protocol_version = "HTTP/1.1"
+    # Клиент, не присылающий запрос, освобождает поток пула через это время
+    timeout = float(os.environ.get("WEB_REQUEST_TIMEOUT", "5"))
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    HTTP-сервер Werkzeug, обрабатывающий соединения в пуле из threads потоков.
+    Соединение принимается (accept) только при свободном потоке: занятый воркер не забирает
+    соединения из общего слушающего сокета и не держит их в очереди пула
+    """
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int, multiprocess: bool = False):
+        self.multiprocess = multiprocess
+        super().__init__(host, port, app, handler=_RequestHandler)
+        self.threads = threads
+        # Потоки пула создаются при первом соединении, то есть уже в воркере
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        # Свободные потоки пула: занимается при приеме соединения, освобождается после ответа
+        self._slots = threading.BoundedSemaphore(threads)
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+    def service_actions(self) -> None:
+        """Вызывается циклом serve_forever перед каждым accept(): ждет свободный поток пула"""
+        self._slots.acquire()
+        self._slots.release()
+
+    def process_request(self, request, client_address) -> None:
+        # Поток свободен: service_actions дождался его, а освобождаются потоки только пулом
+        self._slots.acquire()
+        with self._active_lock:
+            self._active += 1
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._active_lock:
+                self._active -= 1
+            self._slots.release()
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Ждет завершения принятых соединений; возвращает False, если время истекло"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._active_lock:
+                if self._active == 0:
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._executor.shutdown(wait=False)
+
+
+class _Stop(Exception):
+    """Получен сигнал остановки"""
+
+
+def _raise_stop(signum, frame) -> None:
+    raise _Stop()
+
+
+def _run_worker(server: PooledWSGIServer, index: int) -> None:
+    """Тело процесса-воркера: обслуживает запросы до сигнала остановки"""
+    signal.signal(signal.SIGTERM, _raise_stop)
+    signal.signal(signal.SIGINT, _raise_stop)
+    print(f"Воркер {index} (pid {os.getpid()}) запущен: потоков {server.threads}, память {_rss_mb():.1f} МБ", flush=True)
+    try:
+        server.serve_forever()
+    except _Stop:
+        # Новые соединения больше не принимаются, начатые запросы дорабатываются
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.socket.close()
+        if not server.wait_idle(GRACEFUL_TIMEOUT):
+            print(f"Воркер {index}: запросы не завершились за {GRACEFUL_TIMEOUT:.0f} с", flush=True)
+    finally:
+        server.server_close()
+
+
+def _spawn_worker(server: PooledWSGIServer, index: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(server, index)
+        except BaseException:
+            logging.getLogger("serve").exception(f"Воркер {index} завершился с ошибкой")
+            code = 1
+        finally:
+            # Завершаем процесс здесь, не возвращаясь в цикл главного процесса
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+def _stop_workers(workers: Dict[int, int]) -> None:
+    """Отправляет воркерам SIGTERM и ждет их завершения, затем завершает оставшиеся принудительно"""
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + GRACEFUL_TIMEOUT + 1
+    while workers and time.monotonic() < deadline:
+        for pid in list(workers):
+            finished, _ = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                del workers[pid]
+        time.sleep(0.05)
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+
+def _serve_prefork(server: PooledWSGIServer, worker_count: int) -> None:
+    """Главный процесс: запускает воркеры и перезапускает завершившиеся"""
+    workers: Dict[int, int] = {}
+    started_at: Dict[int, float] = {}
+
+    signal.signal(signal.SIGTERM, _raise_stop)
+    signal.signal(signal.SIGINT, _raise_stop)
+    try:
+        for index in range(worker_count):
+            pid = _spawn_worker(server, index)
+            workers[pid] = index
+            started_at[index] = time.monotonic()
+
+        while True:
+            pid, status = os.wait()
+            index = workers.pop(pid, None)
+            if index is None:
+                continue
+            print(f"Воркер {index} (pid {pid}) завершился с кодом {os.waitstatus_to_exitcode(status)}, перезапускаем", flush=True)
+            if time.monotonic() - started_at[index] < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+            pid = _spawn_worker(server, index)
+            workers[pid] = index
+            started_at[index] = time.monotonic()
+    except _Stop:
+        print("Останавливаем воркеры", flush=True)
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        _stop_workers(workers)
+        server.server_close()
+
+
+def _shared_state_warnings(worker_count: int) -> List[str]:
+    """Настройки, при которых состояние не разделяется между воркерами"""
+    if worker_count < 2:
+        return []
+    warnings = []
+    if os.environ.get("JOBS_BACKEND", "memory") != "sqlite":
+        warnings.append("задачи хранятся в памяти воркера: JOBS_BACKEND=sqlite нужен, чтобы статус задачи был виден всем воркерам")
+    if not os.environ.get("LLM_RATE_STATE_PATH"):
+        warnings.append("квоты моделей учитываются в каждом воркере отдельно: задайте LLM_RATE_STATE_PATH")
+    return warnings
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Запуск приложения в рабочем режиме")
+    parser.add_argument("--host", default=os.environ.get("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WEB_PORT", "5001")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", str(os.cpu_count() or 1))),
+                        help="Число процессов-воркеров (по умолчанию число ядер)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", "8")),
+                        help="Число потоков обработки запросов в каждом воркере")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    can_fork = hasattr(os, "fork")
+    worker_count = max(1, args.workers) if can_fork else 1
+    if not can_fork and args.workers > 1:
+        print("fork недоступен на этой системе, запускается один процесс", flush=True)
+
+    # Приложение загружается до создания воркеров, чтобы они получили готовые модули
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    from app import app
+    import_ms = (time.perf_counter() - started) * 1000
+    rss_after = _rss_mb()
+    print(f"Приложение загружено за {import_ms:.0f} мс, память процесса {rss_after:.1f} МБ "
+          f"(загрузка +{rss_after - rss_before:.1f} МБ)", flush=True)
+    for warning in _shared_state_warnings(worker_count):
+        print(f"Внимание: {warning}", flush=True)
+
+    server = PooledWSGIServer(args.host, args.port, app, max(1, args.threads), multiprocess=worker_count > 1)
+    print(f"Сервер слушает http://{args.host}:{server.server_port}: воркеров {worker_count}, "
+          f"потоков в воркере {server.threads}", flush=True)
+
+    if worker_count == 1:
+        _run_worker(server, 0)
+    else:
+        _serve_prefork(server, worker_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Пакетный анализ каталога товаров.
+
+Принимает файл со списком артикулов или ссылок на товары (по одному в строке,
+строки с # пропускаются) и записывает результат анализа каждого товара отдельной
+строкой JSONL. Загрузка отзывов и запросы к модели выполняются в отдельных пулах
+с собственными ограничениями параллельности: пока модель анализирует одни товары,
+отзывы следующих уже загружаются.
+
+Файл результатов одновременно служит контрольной точкой: при повторном запуске
+товары, уже записанные со статусом done или no_reviews, пропускаются без загрузки
+и анализа. Товары с ошибкой загрузки или анализа обрабатываются заново, в файле остается последняя запись.
+
+Запуск:
+    python sweep.py skus.txt --output results.jsonl --fetch-workers 8 --llm-workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Статусы записей в файле результатов
+DONE = "done"
+NO_REVIEWS = "no_reviews"
+FAILED = "failed"
+COMPLETED_STATUSES = (DONE, NO_REVIEWS)
+
+
+def read_inputs(path: str) -> List[Tuple[str, str]]:
+    """Список (артикул, исходная строка) без повторов, в порядке файла"""
+    from app import extract_product_id_py
+
+    products = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            product_id = extract_product_id_py(line)
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            products.append((product_id, line))
+    return products
+
+
+def load_completed(path: str) -> Set[str]:
+    """Артикулы товаров, которые уже успешно обработаны в предыдущих запусках"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Последняя строка могла быть записана не полностью при прерывании
+                continue
+            if record.get("status") in COMPLETED_STATUSES:
+                completed.add(record["product_id"])
+            else:
+                completed.discard(record.get("product_id"))
+    return completed
+
+
+class ResultWriter:
+    """Дописывает записи в файл JSONL; каждая запись сбрасывается на диск сразу"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a+", encoding="utf-8")
+        # Не продолжаем недописанную строку прерванного запуска
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            # После прерывания незавершенные товары не записываются и будут обработаны при следующем запуске
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class CatalogSweep:
+    """
+    Конвейер из двух пулов: загрузка отзывов (fetch_workers потоков) и анализ
+    (llm_workers потоков). Число товаров, загруженных, но еще не проанализированных,
+    ограничено, чтобы отзывы всего каталога не накапливались в памяти.
+    """
+
+    def __init__(self, writer: ResultWriter, fetch_workers: int, llm_workers: int,
+                 limit: int = 300, map_reduce: bool = False):
+        self.writer = writer
+        self.fetch_workers = fetch_workers
+        self.llm_workers = llm_workers
+        self.limit = limit
+        self.map_reduce = map_reduce
+        self._fetch_executor: Optional[ThreadPoolExecutor] = None
+        self._llm_executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = threading.BoundedSemaphore(fetch_workers + llm_workers * 2)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {DONE: 0, NO_REVIEWS: 0, FAILED: 0}
+        self._total = 0
+        self._started = 0.0
+
+    def run(self, products: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """Обрабатывает товары и возвращает сводку по статусам"""
+        self._total = len(products)
+        self._started = time.perf_counter()
+        self._fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="sweep-fetch")
+        self._llm_executor = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="sweep-llm")
+        try:
+            for product_id, input_str in products:
+                self._in_flight.acquire()
+                self._fetch_executor.submit(self._fetch, product_id, input_str, time.perf_counter())
+            # Загрузка передает товары на анализ до завершения, поэтому пулы закрываются по очереди
+            self._fetch_executor.shutdown(wait=True)
+            self._llm_executor.shutdown(wait=True)
+        except KeyboardInterrupt:
+            self._stopping.set()
+            self._fetch_executor.shutdown(wait=False, cancel_futures=True)
+            self._llm_executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            processed = sum(self._counts.values())
+            return {
+                "total": self._total,
+                "processed": processed,
+                **self._counts,
+                "elapsed_seconds": round(elapsed, 3),
+                "products_per_second": round(processed / elapsed, 3) if elapsed > 0 else 0.0,
+            }
+
+    def _fetch(self, product_id: str, input_str: str, started: float) -> None:
+        from app import _build_review_texts
+        from wb import WbReview
+
+        try:
+            if self._stopping.is_set():
+                self._in_flight.release()
+                return
+            wb_instance = WbReview(product_id)
+            product_name = wb_instance.product_name or f"Товар {product_id}"
+            # Ошибки загрузки записываются как failed: без карточки или ответа feedbacks API
+            # parse возвращает пустой список, и товар ошибочно считался бы товаром без отзывов
+            if wb_instance.card_error is not None:
+                self._finish(product_id, input_str, started, FAILED, product_name=product_name,
+                             error=f"Не удалось получить карточку товара: {wb_instance.card_error}")
+                return
+            if wb_instance.get_review_payload() is None:
+                self._finish(product_id, input_str, started, FAILED, product_name=product_name,
+                             error="Не удалось загрузить отзывы ни с одного зеркала")
+                return
+            reviews_list = wb_instance.parse(only_this_variation=True, limit=self.limit)
+            if not reviews_list:
+                self._finish(product_id, input_str, started, NO_REVIEWS, product_name=product_name, review_count=0)
+                return
+            reviews_texts = _build_review_texts(reviews_list)
+        except Exception as e:
+            self._finish(product_id, input_str, started, FAILED, error=str(e))
+            return
+
+        try:
+            self._llm_executor.submit(self._analyze, product_id, input_str, started, product_name, reviews_texts)
+        except RuntimeError:
+            # Пул анализа уже остановлен после прерывания
+            self._in_flight.release()
+
+    def _analyze(self, product_id: str, input_str: str, started: float, product_name: str, reviews_texts: List[str]) -> None:
+        from ai import ReviewAnalyzer
+
+        try:
+            # Ошибка модели записывается как failed, а не как локальный анализ, чтобы повторный запуск проанализировал товар заново
+            if self.map_reduce:
+                analysis = ReviewAnalyzer.analyze_reviews_map_reduce(reviews_texts, product_name)
+            else:
+                analysis = ReviewAnalyzer.analyze_reviews(reviews_texts, product_name)
+        except Exception as e:
+            self._finish(product_id, input_str, started, FAILED, product_name=product_name, error=str(e))
+            return
+
+        if ReviewAnalyzer._is_error_response(analysis):
+            self._finish(product_id, input_str, started, FAILED, product_name=product_name,
+                         review_count=len(reviews_texts), error=analysis)
+        else:
+            self._finish(product_id, input_str, started, DONE, product_name=product_name,
+                         review_count=len(reviews_texts), analysis=analysis)
+
+    def _finish(self, product_id: str, input_str: str, started: float, status: str, **fields) -> None:
+        """Записывает результат товара и освобождает место в конвейере"""
+        try:
+            record = {
+                "product_id": product_id,
+                "input": input_str,
+                "status": status,
+                **fields,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.writer.write(record)
+            with self._lock:
+                self._counts[status] += 1
+                processed = sum(self._counts.values())
+            print(f"[{processed}/{self._total}] {product_id}: {status}", file=sys.stderr)
+        finally:
+            self._in_flight.release()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Пакетный анализ каталога товаров")
+    parser.add_argument("input", help="Файл с артикулами или ссылками на товары, по одному в строке")
+    parser.add_argument("--output", required=True, help="Файл результатов JSONL (он же контрольная точка)")
+    parser.add_argument("--fetch-workers", type=int, default=int(os.environ.get("SWEEP_FETCH_WORKERS", "8")),
+                        help="Число одновременных загрузок отзывов")
+    parser.add_argument("--llm-workers", type=int, default=int(os.environ.get("SWEEP_LLM_WORKERS", "4")),
+                        help="Число одновременных запросов к модели")
+    parser.add_argument("--limit", type=int, default=300, help="Максимум отзывов для анализа одного товара")
+    parser.add_argument("--map-reduce", action="store_true", help="Анализировать товары в режиме map-reduce")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("ReviewAnalyzer").setLevel(logging.WARNING)
+
+    products = read_inputs(args.input)
+    completed = load_completed(args.output)
+    pending = [(product_id, input_str) for product_id, input_str in products if product_id not in completed]
+    print(f"Товаров в списке: {len(products)}, уже обработано: {len(products) - len(pending)}", file=sys.stderr)
+
+    writer = ResultWriter(args.output)
+    sweep = CatalogSweep(writer, max(1, args.fetch_workers), max(1, args.llm_workers),
+                         limit=args.limit, map_reduce=args.map_reduce)
+    try:
+        summary = sweep.run(pending)
+    except KeyboardInterrupt:
+        print("Прервано, обработанные товары сохранены; повторный запуск продолжит с оставшихся", file=sys.stderr)
+        summary = sweep.summary()
+    finally:
+        writer.close()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
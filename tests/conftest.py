@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Модули приложения лежат в корне репозитория; базы создаются во временном каталоге,
+# запросы к моделям выполняет заглушка
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("WB_ANALYZER_DATA_DIR", tempfile.mkdtemp(prefix="wb-analyzer-tests-"))
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_STUB_LATENCY", "0")
+os.environ.setdefault("LLM_STUB_TOKEN_DELAY", "0")
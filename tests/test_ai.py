@@ -0,0 +1,18 @@
+from ai import ReviewAnalyzer
+
+
+def test_collapse_keeps_negated_reviews_apart():
+    reviews = [
+        "Размер подошел",
+        "Размер не подошел",
+        "Хороший товар, рекомендую",
+        "Хороший товар, не рекомендую",
+        "Качество хорошее, доставка быстрая, упаковка целая, рекомендую продавца",
+        "Качество хорошее, доставка быстрая, упаковка целая, не рекомендую продавца",
+    ]
+    assert ReviewAnalyzer._collapse_near_duplicates(reviews) == reviews
+
+
+def test_collapse_merges_near_duplicates():
+    collapsed = ReviewAnalyzer._collapse_near_duplicates(["Всё отлично", "Все отлично!", "Размер не подошел", "Размер не подошёл."])
+    assert collapsed == ["Всё отлично (×2)", "Размер не подошел (×2)"]
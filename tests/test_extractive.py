@@ -0,0 +1,17 @@
+import extractive
+from wb import Review
+
+
+def test_comment_with_section_header_is_not_resplit():
+    # Строка "Минусы: " в комментарии не должна попадать в раздел «Минусы»
+    reviews = [
+        Review(id=str(index), text="Отличная куртка\nМинусы: швы кривые", pros="теплая куртка", cons="")
+        for index in range(20)
+    ]
+
+    analysis = extractive.analyze(reviews, "Куртка")
+    cons_section = analysis.split("Минусы")[1].split("Рекомендации")[0]
+
+    assert "теплая" in analysis
+    assert "шв" not in cons_section
+    assert "Повторяющихся недостатков в отзывах не найдено" in cons_section
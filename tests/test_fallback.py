@@ -0,0 +1,35 @@
+import random
+
+from ai import GITHUB_BACKEND, GROQ_BACKEND, ReviewAnalyzer
+
+
+def _reviews(count):
+    # Длинные несовпадающие отзывы из случайных слов: схлопывание почти одинаковых отзывов их не объединяет
+    syllables = ["ка", "ро", "ми", "ту", "ле", "на", "по", "си", "ва", "зу", "бе", "го", "да", "жи", "фо", "ше"]
+    rng = random.Random(0)
+
+    def words(n):
+        return " ".join("".join(rng.choice(syllables) for _ in range(4)) for _ in range(n))
+
+    return [f"Плюсы: {words(20)} Минусы: {words(20)}" for _ in range(count)]
+
+
+def test_fallback_prompt_fits_fallback_model(monkeypatch):
+    groq = ReviewAnalyzer.LLM_BACKENDS[GROQ_BACKEND]
+    github = ReviewAnalyzer.LLM_BACKENDS[GITHUB_BACKEND]
+    monkeypatch.setattr(groq, "rate_limit_rate", 1.0)
+    monkeypatch.setattr(groq, "retry_after", 0.0)
+
+    prompts = []
+    respond = github._respond
+    monkeypatch.setattr(github, "_respond", lambda system_prompt, prompt, max_tokens: (
+        prompts.append(prompt) or respond(system_prompt, prompt, max_tokens)
+    ))
+    monkeypatch.setattr(ReviewAnalyzer.ANALYSIS_CACHE, "get", lambda key: None)
+
+    analysis = ReviewAnalyzer.analyze_reviews(_reviews(400), "Тестовый товар")
+
+    assert not ReviewAnalyzer._is_error_response(analysis)
+    assert len(prompts) == 1
+    limit = ReviewAnalyzer.LLM_SCHEDULER.backends[GITHUB_BACKEND]["max_request_tokens"]
+    assert ReviewAnalyzer._prompt_tokens(prompts[0], GITHUB_BACKEND) + ReviewAnalyzer.MAX_OUTPUT_TOKENS <= limit
@@ -0,0 +1,36 @@
+import json
+
+import app
+from wb import WbReview
+
+SKU = "700700"
+
+
+def _payload(count):
+    feedbacks = [
+        {"id": f"f{i}", "nmId": int(SKU), "createdDate": f"2024-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}Z",
+         "text": f"Отзыв номер {i}", "pros": "", "cons": "", "productValuation": 5}
+        for i in reversed(range(count))
+    ]
+    return json.dumps({"feedbacks": feedbacks})
+
+
+def _run(monkeypatch, payload):
+    monkeypatch.setattr(WbReview, "get_product_info", lambda self: self.sku)
+    monkeypatch.setattr(WbReview, "get_review_payload", lambda self: payload)
+    response, status = app._execute_analysis({"mode": "single", "product_url": SKU, "incremental": True})
+    assert status == 200
+    return response
+
+
+def test_unchanged_payload_has_no_new_reviews(monkeypatch):
+    payload = _payload(700)
+    first = _run(monkeypatch, payload)
+    assert first["new_review_count"] == 300
+
+    second = _run(monkeypatch, payload)
+    assert second["new_review_count"] == 0
+    assert second["analysis"] == first["analysis"]
+
+    third = _run(monkeypatch, _payload(705))
+    assert third["new_review_count"] == 5
@@ -0,0 +1,32 @@
+import json
+
+import sweep
+from wb import WbReview
+
+
+def _run(tmp_path, products):
+    path = tmp_path / "results.jsonl"
+    writer = sweep.ResultWriter(str(path))
+    try:
+        sweep.CatalogSweep(writer, fetch_workers=2, llm_workers=1).run(products)
+    finally:
+        writer.close()
+    return {record["product_id"]: record for record in map(json.loads, path.read_text(encoding="utf-8").splitlines())}
+
+
+def test_upstream_failures_are_retried(tmp_path, monkeypatch):
+    def load_card(self):
+        if self.sku == "111":
+            raise ConnectionError("card.wb.ru недоступен")
+        return {"root": self.sku, "name": "Товар"}, 1
+
+    monkeypatch.setattr(WbReview, "get_product_name_from_page", lambda self: "")
+    monkeypatch.setattr(WbReview, "_load_card_product_data", load_card)
+    monkeypatch.setattr(WbReview, "get_review_payload", lambda self: None if self.sku == "222" else '{"feedbacks": []}')
+
+    records = _run(tmp_path, [("111", "111"), ("222", "222"), ("333", "333")])
+
+    assert records["111"]["status"] == sweep.FAILED
+    assert records["222"]["status"] == sweep.FAILED
+    assert records["333"]["status"] == sweep.NO_REVIEWS
+    assert sweep.load_completed(str(tmp_path / "results.jsonl")) == {"333"}
@@ -1,13 +1,426 @@
+import os
 import re
+import time
+import asyncio
 import json
+import threading
+import contextlib
+import contextvars
+import importlib.util
 import requests
-from typing import List, Dict, Optional, Union, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Optional, Any, Callable, Tuple, Iterator
+
+import metrics
+
+# aiohttp нужен только асинхронному клиенту и импортируется при первом обращении
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
+if TYPE_CHECKING:
+    import aiohttp
+
+_JSON_DECODER = json.JSONDecoder()
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+def _skip_whitespace(text: str, position: int) -> int:
+    return _WHITESPACE_RE.match(text, position).end()
+
+
+class Review:
+    """
+    Отзыв о товаре. Хранит только поля, нужные для анализа; за счет __slots__ занимает
+    в несколько раз меньше памяти, чем словарь. Текст для промпта собирается один раз.
+    """
+    
+    __slots__ = ("id", "nm_id", "date", "text", "pros", "cons", "rating", "_prompt_text")
+    
+    def __init__(self, id: str = "", nm_id: Optional[int] = None, date: str = "", text: str = "",
+                 pros: str = "", cons: str = "", rating: Optional[int] = None):
+        self.id = id
+        self.nm_id = nm_id
+        self.date = date
+        self.text = text
+        self.pros = pros
+        self.cons = cons
+        self.rating = rating
+        self._prompt_text = None
+    
+    @classmethod
+    def from_feedback(cls, feedback: Dict[str, Any]) -> "Review":
+        """Создает отзыв из элемента ответа feedbacks API"""
+        return cls(
+            id=feedback.get("id") or "",
+            nm_id=feedback.get("nmId"),
+            date=feedback.get("createdDate") or "",
+            text=feedback.get("text") or "",
+            pros=feedback.get("pros") or "",
+            cons=feedback.get("cons") or "",
+            rating=feedback.get("productValuation"),
+        )
+    
+    @property
+    def prompt_text(self) -> str:
+        """Текст отзыва с плюсами и минусами в том виде, в котором он попадает в промпт"""
+        if self._prompt_text is None:
+            parts = []
+            if self.text:
+                parts.append(self.text)
+            if self.pros:
+                parts.append(f"Плюсы: {self.pros}")
+            if self.cons:
+                parts.append(f"Минусы: {self.cons}")
+            self._prompt_text = "\n".join(parts)
+        return self._prompt_text
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "date": self.date, "text": self.text, "pros": self.pros,
+                "cons": self.cons, "nm_id": self.nm_id, "rating": self.rating}
+    
+    def __repr__(self) -> str:
+        return f"Review(id={self.id!r}, nm_id={self.nm_id!r}, text={self.text[:30]!r})"
+
+
+class WbHttpPool:
+    """
+    Общий для процесса пул HTTP-соединений к серверам Wildberries.
+    Для каждого хоста создается своя сессия requests с keep-alive и пулом
+    ограниченного размера; все запросы выполняются с таймаутами на подключение и чтение.
+    """
+    
+    POOL_MAXSIZE = int(os.environ.get("WB_HTTP_POOL_SIZE", "20"))
+    CONNECT_TIMEOUT = float(os.environ.get("WB_HTTP_CONNECT_TIMEOUT", "3.05"))
+    READ_TIMEOUT = float(os.environ.get("WB_HTTP_READ_TIMEOUT", "15"))
+    
+    _sessions: Dict[str, requests.Session] = {}
+    _stats: Dict[str, Dict[str, float]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_session(cls, host: str) -> requests.Session:
+        """Возвращает сессию для хоста, создавая ее при первом обращении"""
+        session = cls._sessions.get(host)
+        if session is not None:
+            return session
+        with cls._lock:
+            session = cls._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._sessions[host] = session
+                cls._stats[host] = {"requests": 0, "errors": 0, "total_time": 0.0}
+        return session
+
+    @classmethod
+    def get(cls, url: str, **kwargs) -> requests.Response:
+        """GET-запрос через пул соединений хоста"""
+        host = urlsplit(url).netloc
+        session = cls._get_session(host)
+        kwargs.setdefault("timeout", (cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT))
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = session.get(url, **kwargs)
+            outcome = str(response.status_code)
+            return response
+        except Exception:
+            with cls._lock:
+                cls._stats[host]["errors"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with cls._lock:
+                cls._stats[host]["requests"] += 1
+                cls._stats[host]["total_time"] += elapsed
+            metrics.UPSTREAM_SECONDS.observe(elapsed, upstream=host, outcome=outcome)
+
+    @classmethod
+    def stats(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Статистика по хостам: число запросов, ошибок, открытых соединений,
+        доля переиспользованных соединений и среднее время запроса
+        """
+        result = {}
+        with cls._lock:
+            items = [(host, cls._sessions[host], dict(cls._stats[host])) for host in cls._sessions]
+        for host, session, counters in items:
+            connections = 0
+            pool_requests = 0
+            adapter = session.get_adapter(f"https://{host}")
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pool_requests += pool.num_requests
+            requests_count = counters["requests"]
+            result[host] = {
+                "requests": requests_count,
+                "errors": counters["errors"],
+                "connections_opened": connections,
+                "connection_reuse_rate": round(1 - connections / pool_requests, 3) if pool_requests else 0.0,
+                "avg_time_ms": round(counters["total_time"] / requests_count * 1000, 1) if requests_count else 0.0,
+                "pool_maxsize": cls.POOL_MAXSIZE,
+            }
+        return result
+
+    @classmethod
+    def close(cls) -> None:
+        """Закрывает все сессии (вызывается при остановке приложения)"""
+        with cls._lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions.clear()
+            cls._stats.clear()
+
+
+class TtlLruCache:
+    """
+    Потокобезопасный кэш в памяти с временем жизни записей и вытеснением
+    давно не использованных записей при превышении бюджета памяти.
+    Одновременные запросы одного ключа через get_or_load выполняют одну загрузку.
+    """
+    
+    def __init__(self, name: str, ttl: float, max_bytes: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Any, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "coalesced": 0}
+
+    def _get_locked(self, key: Any) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, size, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            self._counters["expirations"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Возвращает значение из кэша или None"""
+        with self._lock:
+            found, value = self._get_locked(key)
+            self._counters["hits" if found else "misses"] += 1
+            return value
+
+    def put(self, key: Any, value: Any, size: int) -> None:
+        """Сохраняет значение; size - оценка занимаемой памяти в байтах"""
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._counters["evictions"] += 1
+
+    def get_or_load(self, key: Any, loader: Callable[[], Tuple[Any, int]]) -> Any:
+        """
+        Возвращает значение из кэша, а при промахе вызывает loader, который
+        возвращает (значение, размер). Значение None не кэшируется.
+        """
+        while True:
+            with self._lock:
+                found, value = self._get_locked(key)
+                if found:
+                    self._counters["hits"] += 1
+                    return value
+                event = self._inflight.get(key)
+                if event is None:
+                    # Этот поток выполняет загрузку, остальные ждут ее результат
+                    self._counters["misses"] += 1
+                    event = self._inflight[key] = threading.Event()
+                    break
+                self._counters["coalesced"] += 1
+            event.wait()
+            with self._lock:
+                found, value = self._get_locked(key)
+            if found:
+                return value
+            # Загрузка не удалась или результат не кэшируется - загружаем сами
+        
+        try:
+            value, size = loader()
+            if value is not None:
+                self.put(key, value, size)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий, промахов и вытеснений, а также текущий размер кэша"""
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes, ttl=self.ttl)
+
+
+class FeedbackMirrors:
+    """
+    Оценки скорости и доступности зеркал feedbacks*.wb.ru.
+    Хранит скользящее среднее времени ответа каждого зеркала; неудачный ответ
+    учитывается как штрафная задержка. Зеркала опрашиваются от быстрого к медленному.
+    """
+    
+    # Вес нового замера в скользящем среднем
+    EWMA_ALPHA = 0.3
+    # Задержка (в секундах), которой считается неудачный ответ
+    FAILURE_PENALTY = 5.0
+    
+    _latency: Dict[int, float] = {}
+    _counters: Dict[int, Dict[str, int]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def record(cls, index: int, latency: float, ok: bool) -> None:
+        """Учитывает результат запроса к зеркалу с номером index"""
+        sample = latency if ok else max(latency, cls.FAILURE_PENALTY)
+        with cls._lock:
+            previous = cls._latency.get(index)
+            cls._latency[index] = sample if previous is None else previous + cls.EWMA_ALPHA * (sample - previous)
+            counters = cls._counters.setdefault(index, {"requests": 0, "failures": 0, "wins": 0})
+            counters["requests"] += 1
+            if not ok:
+                counters["failures"] += 1
+
+    @classmethod
+    def record_win(cls, index: int) -> None:
+        """Учитывает, что ответ зеркала был использован"""
+        with cls._lock:
+            cls._counters.setdefault(index, {"requests": 0, "failures": 0, "wins": 0})["wins"] += 1
+
+    @classmethod
+    def ordered(cls, count: int) -> List[int]:
+        """Номера зеркал, упорядоченные по оценке; неопрошенные идут после опрошенных в исходном порядке"""
+        with cls._lock:
+            return sorted(range(count), key=lambda i: (i not in cls._latency, cls._latency.get(i, 0.0), i))
+
+    @classmethod
+    def stats(cls) -> Dict[int, Dict[str, Any]]:
+        """Текущие оценки зеркал"""
+        with cls._lock:
+            return {
+                index: dict(cls._counters.get(index, {}), latency_ms=round(latency * 1000, 1))
+                for index, latency in cls._latency.items()
+            }
+
+
+class CardBatcher:
+    """
+    Объединяет запросы карточек товаров к card.wb.ru: артикулы, запрошенные разными
+    потоками в течение короткого окна, загружаются одним запросом с nm=a;b;c.
+    Первый поток окна ждет остальных и выполняет запрос, ответ раскладывается по артикулам.
+    """
+    
+    def __init__(self, fetch: Callable[[List[str]], Tuple[Dict[str, Dict[str, Any]], int]], window: float, max_batch: int):
+        """
+        Args:
+            fetch: Загружает карточки списка артикулов, возвращает ({артикул: карточка}, размер ответа)
+            window: Сколько секунд собирать артикулы перед запросом (0 - без объединения)
+            max_batch: Максимум артикулов в одном запросе
+        """
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "requests": 0}
+    
+    def lookup(self, sku: str) -> Tuple[Dict[str, Any], int]:
+        """Возвращает (карточка товара, оценка ее размера в байтах)"""
+        if self.window <= 0:
+            with self._lock:
+                self._counters["lookups"] += 1
+            batch = self._new_batch()
+            batch["skus"].append(sku)
+            self._run(batch)
+            return self._result(batch, sku)
+        
+        with self._lock:
+            self._counters["lookups"] += 1
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = self._new_batch()
+            if sku not in batch["skus"]:
+                batch["skus"].append(sku)
+            if len(batch["skus"]) >= self.max_batch:
+                # Окно заполнено - следующие артикулы попадут в новый запрос
+                self._pending = None
+                batch["full"].set()
+        
+        if leader:
+            batch["full"].wait(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            self._run(batch)
+        else:
+            batch["done"].wait()
+        return self._result(batch, sku)
+    
+    @staticmethod
+    def _new_batch() -> Dict[str, Any]:
+        return {"skus": [], "full": threading.Event(), "done": threading.Event(),
+                "products": {}, "size": 0, "error": None}
+    
+    def _run(self, batch: Dict[str, Any]) -> None:
+        """Выполняет запрос окна и будит ожидающие потоки"""
+        with self._lock:
+            self._counters["requests"] += 1
+        metrics.CARD_BATCH_SIZE.observe(len(batch["skus"]))
+        try:
+            batch["products"], batch["size"] = self.fetch(batch["skus"])
+        except Exception as e:
+            batch["error"] = e
+        finally:
+            batch["done"].set()
+    
+    @staticmethod
+    def _result(batch: Dict[str, Any], sku: str) -> Tuple[Dict[str, Any], int]:
+        if batch["error"] is not None:
+            raise batch["error"]
+        product_data = batch["products"].get(sku)
+        if product_data is None:
+            raise Exception("Не удалось получить данные товара через API")
+        return product_data, batch["size"] // max(1, len(batch["products"]))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Число запрошенных карточек и выполненных запросов"""
+        with self._lock:
+            counters = dict(self._counters)
+        counters["avg_batch_size"] = round(counters["lookups"] / counters["requests"], 2) if counters["requests"] else 0.0
+        return counters
+
 
 class WbReview:
     def __init__(self, string: str):
         self.sku = self.get_sku(string=string)
         self.product_name = ""
         self.color = ""
+        # Ошибка получения карточки товара; root_id в этом случае равен артикулу
+        self.card_error: Optional[str] = None
         # Получаем root_id и заодно инициализируем product_name 
         self.root_id = self.get_product_info()
         
@@ -15,6 +428,54 @@ class WbReview:
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36',
     }
 
+    PRODUCT_PAGE_URL = "https://www.wildberries.ru/catalog/{sku}/detail.aspx"
+    
+    # Источник названия товара:
+    #   "card" - название из card.wb.ru, страница товара загружается только если его там нет;
+    #   "page" - сначала название со страницы товара, затем из card.wb.ru (прежнее поведение)
+    NAME_SOURCE = os.environ.get("WB_NAME_SOURCE", "card")
+    
+    # Страница товара читается частями и не дальше этого размера
+    PAGE_CHUNK_SIZE = 16 * 1024
+    PAGE_MAX_BYTES = 2 * 1024 * 1024
+    CARD_API_URL = "https://card.wb.ru/cards/v2/detail?appType=1&curr=byn&dest=-8144334&spp=30&nm={sku}"
+    
+    # Окно (в секундах) и максимальный размер объединенного запроса карточек
+    CARD_BATCH_WINDOW = float(os.environ.get("WB_CARD_BATCH_WINDOW", "0.01"))
+    CARD_BATCH_MAX = int(os.environ.get("WB_CARD_BATCH_MAX", "50"))
+    # Пул соединений, через который выполняются запросы
+    HTTP = WbHttpPool
+    
+    FEEDBACKS_URLS = (
+        "https://feedbacks1.wb.ru/feedbacks/v1/{root_id}",
+        "https://feedbacks2.wb.ru/feedbacks/v1/{root_id}",
+    )
+    
+    # Через сколько секунд без полезного ответа запрашивать следующее зеркало отзывов
+    # (0 - опрашивать все зеркала сразу)
+    FEEDBACKS_HEDGE_DELAY = float(os.environ.get("WB_FEEDBACKS_HEDGE_DELAY", "0.3"))
+    # Потоки для запасных запросов к зеркалам; основной запрос выполняется в вызывающем потоке
+    FEEDBACKS_HEDGE_WORKERS = int(os.environ.get("WB_FEEDBACKS_HEDGE_WORKERS", str(WbHttpPool.POOL_MAXSIZE)))
+    
+    _hedge_executor = None
+    _hedge_executor_lock = threading.Lock()
+    
+    # Кэш карточек товаров (по артикулу) и ответов feedbacks API (по root_id).
+    # Размер записи оценивается по размеру ответа сервера.
+    CARD_CACHE = TtlLruCache(
+        "cards",
+        ttl=float(os.environ.get("WB_CARD_CACHE_TTL", "600")),
+        max_bytes=int(os.environ.get("WB_CARD_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    )
+    FEEDBACKS_CACHE = TtlLruCache(
+        "feedbacks",
+        ttl=float(os.environ.get("WB_FEEDBACKS_CACHE_TTL", "300")),
+        max_bytes=int(os.environ.get("WB_FEEDBACKS_CACHE_MAX_BYTES", str(128 * 1024 * 1024))),
+    )
+    
+    # Запросы карточек из разных потоков объединяются в один запрос к card.wb.ru
+    CARD_BATCHER = CardBatcher(lambda skus: WbReview._fetch_cards(skus), CARD_BATCH_WINDOW, CARD_BATCH_MAX)
+
     @staticmethod
     def get_sku(string: str) -> str:
         """Получение артикула"""
@@ -27,98 +488,303 @@ class WbReview:
                 raise Exception("Не удалось найти артикул")
         return string
 
+    @staticmethod
+    def _extract_title_from_html(html: str) -> Optional[str]:
+        """Извлекает название товара из HTML страницы товара"""
+        # Ищем название товара в HTML с помощью регулярного выражения
+        title_pattern = r'<h1\s+class="product-page__title"[^>]*>(.*?)</h1>'
+        title_match = re.search(title_pattern, html, re.DOTALL)
+        
+        if title_match:
+            # Очищаем название от HTML-тегов и лишних пробелов
+            title = re.sub(r'<[^>]+>', '', title_match.group(1))
+            return title.strip()
+        
+        # Альтернативный поиск - для новой верстки
+        title_pattern2 = r'<span\s+data-link="text{:selectedNomenclature.naming}"[^>]*>(.*?)</span>'
+        title_match2 = re.search(title_pattern2, html, re.DOTALL)
+        
+        if title_match2:
+            title = re.sub(r'<[^>]+>', '', title_match2.group(1))
+            return title.strip()
+        
+        return None
+
+    @staticmethod
+    def _html_title_complete(buffer: bytearray) -> bool:
+        """Проверяет, что в загруженной части страницы уже есть закрытый заголовок товара"""
+        title_start = buffer.find(b'class="product-page__title"')
+        return title_start != -1 and buffer.find(b'</h1>', title_start) != -1
+
+    @staticmethod
+    def _decode_html(buffer: bytearray, encoding: Optional[str]) -> str:
+        return bytes(buffer).decode(encoding or "utf-8", errors="replace")
+
     def get_product_name_from_page(self) -> Optional[str]:
-        """Получает название товара непосредственно со страницы товара"""
+        """
+        Получает название товара непосредственно со страницы товара.
+        Страница читается потоком и загрузка прекращается, как только закрылся заголовок.
+        """
         try:
-            url = f"https://www.wildberries.ru/catalog/{self.sku}/detail.aspx"
-            response = requests.get(url, headers=self.HEADERS)
-            
-            if response.status_code != 200:
-                return None
-            
-            # Ищем название товара в HTML с помощью регулярного выражения
-            title_pattern = r'<h1\s+class="product-page__title"[^>]*>(.*?)</h1>'
-            title_match = re.search(title_pattern, response.text, re.DOTALL)
-            
-            if title_match:
-                # Очищаем название от HTML-тегов и лишних пробелов
-                title = re.sub(r'<[^>]+>', '', title_match.group(1))
-                return title.strip()
+            url = self.PRODUCT_PAGE_URL.format(sku=self.sku)
+            with metrics.stage("product_page"), self.HTTP.get(url, headers=self.HEADERS, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                
+                buffer = bytearray()
+                for chunk in response.iter_content(chunk_size=self.PAGE_CHUNK_SIZE):
+                    buffer.extend(chunk)
+                    if self._html_title_complete(buffer) or len(buffer) >= self.PAGE_MAX_BYTES:
+                        break
+                html = self._decode_html(buffer, response.encoding)
             
-            # Альтернативный поиск - для новой верстки
-            title_pattern2 = r'<span\s+data-link="text{:selectedNomenclature.naming}"[^>]*>(.*?)</span>'
-            title_match2 = re.search(title_pattern2, response.text, re.DOTALL)
-            
-            if title_match2:
-                title = re.sub(r'<[^>]+>', '', title_match2.group(1))
-                return title.strip()
-            
-            return None
+            return self._extract_title_from_html(html)
         except Exception:
             return None
 
+    def _apply_product_data(self, product_data: Dict[str, Any]) -> str:
+        """
+        Заполняет название и цвет из ответа card.wb.ru
+        Возвращает root_id товара
+        """
+        root_id = product_data["root"]
+        
+        # Если название не было получено со страницы, берем из API
+        if not self.product_name and product_data.get("name"):
+            self.product_name = product_data["name"]
+            # Добавляем бренд к названию
+            if "brand" in product_data and product_data["brand"]:
+                brand = product_data["brand"]
+                if brand not in self.product_name:
+                    self.product_name = f"{brand} - {self.product_name}"
+        
+        # Получаем информацию о цвете/варианте товара если она есть
+        if "colors" in product_data and len(product_data["colors"]) > 0:
+            self.color = product_data["colors"][0]["name"]
+        
+        return root_id
+
+    def _product_info_fallback(self, error: Exception) -> str:
+        """Значения по умолчанию, если данные товара получить не удалось"""
+        print(f"Ошибка при получении root_id: {error}")
+        self.card_error = str(error) or type(error).__name__
+        
+        # Если не удалось получить название и root_id, используем артикул
+        if not self.product_name:
+            self.product_name = f"Товар {self.sku}"
+        
+        return self.sku
+
+    @staticmethod
+    def _card_products_by_sku(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Раскладывает массив products ответа card.wb.ru по артикулам, оставляя нужные поля"""
+        products = {}
+        for product in data["data"]["products"]:
+            products[str(product.get("id"))] = {
+                "root": product["root"],
+                "name": product.get("name"),
+                "brand": product.get("brand"),
+                "colors": product.get("colors") or [],
+            }
+        return products
+
+    @classmethod
+    def _fetch_cards(cls, skus: List[str]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """Запрашивает карточки нескольких товаров одним запросом к card.wb.ru"""
+        response = cls.HTTP.get(
+            cls.CARD_API_URL.format(sku=";".join(skus)),
+            headers=cls.HEADERS,
+        )
+        
+        if response.status_code != 200:
+            raise Exception("Не удалось получить данные товара через API")
+        
+        return cls._card_products_by_sku(response.json()), len(response.content)
+
+    def _load_card_product_data(self) -> Tuple[Dict[str, Any], int]:
+        """Запрашивает данные товара из card.wb.ru, возвращает (данные, размер ответа)"""
+        with metrics.stage("card_api"):
+            return self.CARD_BATCHER.lookup(self.sku)
+
     def get_product_info(self) -> str:
         """
         Получение информации о товаре включая root_id, название, бренд и цвет
         Возвращает root_id товара
         """
         try:
-            # Сначала пытаемся получить название со страницы
-            page_title = self.get_product_name_from_page()
-            if page_title:
-                self.product_name = page_title
+            if self.NAME_SOURCE == "page":
+                # Сначала пытаемся получить название со страницы
+                page_title = self.get_product_name_from_page()
+                if page_title:
+                    self.product_name = page_title
             
             # Пробуем получить данные через API для получения root_id
-            response = requests.get(
-                f'https://card.wb.ru/cards/v2/detail?appType=1&curr=byn&dest=-8144334&spp=30&nm={self.sku}',
-                headers=self.HEADERS,
-            )
+            product_data = self.CARD_CACHE.get_or_load(self.sku, self._load_card_product_data)
+            root_id = self._apply_product_data(product_data)
             
-            if response.status_code != 200:
-                raise Exception("Не удалось получить данные товара через API")
-            
-            product_data = response.json()["data"]["products"][0]
-            root_id = product_data["root"]
-            
-            # Если название не было получено со страницы, берем из API
+            # В карточке нет названия - берем его со страницы товара
             if not self.product_name:
-                self.product_name = product_data.get("name", f"Товар {self.sku}")
-                # Добавляем бренд к названию
-                if "brand" in product_data and product_data["brand"]:
-                    brand = product_data["brand"]
-                    if brand not in self.product_name:
-                        self.product_name = f"{brand} - {self.product_name}"
-            
-            # Получаем информацию о цвете/варианте товара если она есть
-            if "colors" in product_data and len(product_data["colors"]) > 0:
-                self.color = product_data["colors"][0]["name"]
+                self.product_name = self.get_product_name_from_page() or f"Товар {self.sku}"
             
             return root_id
         except Exception as e:
-            print(f"Ошибка при получении root_id: {e}")
+            if not self.product_name and self.NAME_SOURCE != "page":
+                self.product_name = self.get_product_name_from_page() or ""
+            return self._product_info_fallback(e)
+
+    @classmethod
+    def _get_hedge_executor(cls) -> ThreadPoolExecutor:
+        """Общий пул потоков для запасных запросов к зеркалам"""
+        if cls._hedge_executor is None:
+            with cls._hedge_executor_lock:
+                if cls._hedge_executor is None:
+                    cls._hedge_executor = ThreadPoolExecutor(max_workers=max(1, cls.FEEDBACKS_HEDGE_WORKERS),
+                                                             thread_name_prefix="wb-feedbacks-hedge")
+        return cls._hedge_executor
+
+    @staticmethod
+    def iter_feedbacks(payload: str) -> Iterator[Dict[str, Any]]:
+        """
+        Последовательно разбирает элементы массива "feedbacks" из текста ответа feedbacks API.
+        Остальные поля документа и еще не запрошенные отзывы не разбираются, поэтому
+        чтение первых отзывов большого ответа не требует построения всего документа.
+        При ошибке в документе выбрасывает ValueError.
+        """
+        decoder = _JSON_DECODER
+        position = _skip_whitespace(payload, 0)
+        if payload[position:position + 1] != "{":
+            raise ValueError("Ответ feedbacks API не является объектом JSON")
+        position = _skip_whitespace(payload, position + 1)
+        
+        while payload[position:position + 1] != "}":
+            key, position = decoder.raw_decode(payload, position)
+            position = _skip_whitespace(payload, position)
+            if payload[position:position + 1] != ":":
+                raise ValueError(f"Ожидалось ':' в позиции {position}")
+            position = _skip_whitespace(payload, position + 1)
             
-            # Если не удалось получить название и root_id, используем артикул
-            if not self.product_name:
-                self.product_name = f"Товар {self.sku}"
+            if key == "feedbacks" and payload[position:position + 1] == "[":
+                position = _skip_whitespace(payload, position + 1)
+                while payload[position:position + 1] != "]":
+                    feedback, position = decoder.raw_decode(payload, position)
+                    yield feedback
+                    position = _skip_whitespace(payload, position)
+                    if payload[position:position + 1] == ",":
+                        position = _skip_whitespace(payload, position + 1)
+                    elif payload[position:position + 1] != "]":
+                        raise ValueError(f"Ожидалось ',' или ']' в позиции {position}")
+                return
             
-            return self.sku
+            # Прочие поля документа пропускаем
+            _, position = decoder.raw_decode(payload, position)
+            position = _skip_whitespace(payload, position)
+            if payload[position:position + 1] == ",":
+                position = _skip_whitespace(payload, position + 1)
+            elif payload[position:position + 1] != "}":
+                raise ValueError(f"Ожидалось ',' или '}}' в позиции {position}")
 
-    def get_review_data(self) -> Optional[Dict[str, Any]]:
-        """Получение данных отзывов"""
+    @staticmethod
+    def _has_feedbacks(payload: Optional[str]) -> bool:
+        """Проверяет, что в ответе feedbacks API есть хотя бы один отзыв"""
+        if not payload:
+            return False
+        try:
+            return next(WbReview.iter_feedbacks(payload), None) is not None
+        except ValueError:
+            return False
+
+    def _fetch_feedbacks(self, index: int) -> Tuple[Optional[str], int]:
+        """
+        Запрашивает отзывы у зеркала с номером index и обновляет его оценку
+        Возвращает (текст ответа или None, размер ответа)
+        """
+        started = time.perf_counter()
+        payload = None
         try:
-            response = requests.get(f'https://feedbacks1.wb.ru/feedbacks/v1/{self.root_id}', headers=self.HEADERS)
+            response = self.HTTP.get(self.FEEDBACKS_URLS[index].format(root_id=self.root_id), headers=self.HEADERS)
             if response.status_code == 200:
-                data = response.json()
-                if data.get("feedbacks"):
-                    return data
-                raise Exception("Сервер 1 не подошел")
+                payload = response.content.decode("utf-8", errors="replace")
+            return payload, len(response.content)
+        finally:
+            FeedbackMirrors.record(index, time.perf_counter() - started, self._has_feedbacks(payload))
+
+    def get_review_payload(self) -> Optional[str]:
+        """
+        Текст ответа feedbacks API (с кэшированием по root_id).
+        В кэше хранится текст, а не разобранный документ: он занимает в несколько раз меньше
+        памяти, а отзывы из него разбираются по мере надобности через iter_feedbacks.
+        """
+        with metrics.stage("feedbacks"):
+            return self.FEEDBACKS_CACHE.get_or_load(self.root_id, self._load_review_data)
+
+    def get_review_data(self) -> Optional[Dict[str, Any]]:
+        """Полный разобранный ответ feedbacks API (для анализа отзывов достаточно parse)"""
+        payload = self.get_review_payload()
+        return json.loads(payload) if payload else None
+
+    def _hedge_feedbacks(self, index: int, start_at: float, primary: Dict[str, Any]) -> Optional[Tuple[Optional[str], int]]:
+        """
+        Запасной запрос к зеркалу index. Выполняется, если к моменту start_at (time.perf_counter)
+        основной запрос не вернул отзывы, или сразу, как только основной запрос завершился неудачей.
+        Возвращает None, если запрос не понадобился.
+        """
+        finished = primary["done"].wait(max(0.0, start_at - time.perf_counter()))
+        if finished and primary["ok"]:
+            return None
+        return self._fetch_feedbacks(index)
+
+    def _load_review_data(self) -> Tuple[Optional[str], int]:
+        """
+        Загрузка текста ответа feedbacks API, возвращает (текст, размер ответа).
+        Зеркало с лучшей оценкой запрашивается в вызывающем потоке. Следующие зеркала
+        запрашиваются в пуле запасных запросов, если первое не ответило за FEEDBACKS_HEDGE_DELAY
+        с начала запроса (каждое следующее - еще через FEEDBACKS_HEDGE_DELAY), или сразу после
+        его неудачного ответа. Используется ответ первого зеркала со списком отзывов, затем
+        первый полученный запасной ответ со списком отзывов, иначе - любой успешный ответ.
+        """
+        mirrors = FeedbackMirrors.ordered(len(self.FEEDBACKS_URLS))
+        first_mirror = mirrors[0]
+        primary = {"done": threading.Event(), "ok": False}
+        started = time.perf_counter()
+        # Задержка отсчитывается от начала основного запроса, поэтому ожидание свободного
+        # потока в пуле не приводит к лишнему запасному запросу
+        hedges = {
+            self._get_hedge_executor().submit(
+                self._hedge_feedbacks, index, started + self.FEEDBACKS_HEDGE_DELAY * position, primary
+            ): index
+            for position, index in enumerate(mirrors[1:], start=1)
+        }
+        
+        try:
+            payload, size = self._fetch_feedbacks(first_mirror)
         except Exception:
-            response = requests.get(f'https://feedbacks2.wb.ru/feedbacks/v1/{self.root_id}', headers=self.HEADERS)
-            if response.status_code == 200:
-                return response.json()
-        return None
+            payload, size = None, 0
+        primary["ok"] = self._has_feedbacks(payload)
+        primary["done"].set()
+        if primary["ok"]:
+            FeedbackMirrors.record_win(first_mirror)
+            return payload, size
+        
+        fallback = (payload, size) if payload is not None else (None, 0)
+        for future in as_completed(hedges):
+            index = hedges[future]
+            try:
+                result = future.result()
+            except Exception:
+                continue
+            if result is None:
+                continue
+            payload, size = result
+            if self._has_feedbacks(payload):
+                FeedbackMirrors.record_win(index)
+                metrics.FEEDBACKS_MIRROR_FALLBACKS.inc()
+                return payload, size
+            if payload is not None and fallback[0] is None:
+                fallback = (payload, size)
+        
+        return fallback
 
-    def parse(self, only_this_variation=True, limit=300) -> List[Dict[str, str]]:
+    def parse(self, only_this_variation=True, limit=300, exclude_ids=None, newer_than=None) -> List[Review]:
         """
         Парсинг отзывов
         
@@ -126,37 +792,288 @@ class WbReview:
             only_this_variation: Если True, возвращает отзывы только для этого варианта товара,
                                Если False, возвращает все отзывы для всех вариантов товара
             limit: Максимальное количество отзывов для возврата
+            exclude_ids: Идентификаторы уже обработанных отзывов, которые нужно пропустить
+            newer_than: Дата (createdDate) самого нового уже обработанного отзыва:
+                        возвращаются только отзывы, оставленные позже
             
         Returns:
-            List[Dict[str, str]]: Список словарей с полями 'text', 'pros', 'cons' для каждого отзыва
+            List[Review]: Список отзывов с полями id, nm_id, date, text, pros, cons, rating
+        """
+        payload = self.get_review_payload()
+        with metrics.stage("parse"):
+            return self._select_feedbacks(payload, only_this_variation, limit, exclude_ids, newer_than)
+
+    def latest_review_date(self, only_this_variation=True) -> str:
+        """Дата (createdDate) самого нового отзыва в ответе feedbacks API; пустая строка, если отзывов нет"""
+        payload = self.get_review_payload()
+        latest = ""
+        if not payload:
+            return latest
+        try:
+            for feedback in WbReview.iter_feedbacks(payload):
+                if only_this_variation and str(feedback.get("nmId")) != self.sku:
+                    continue
+                latest = max(latest, feedback.get("createdDate") or "")
+        except ValueError as e:
+            print(f"Ошибка при разборе отзывов: {e}")
+        return latest
+
+    def _select_feedbacks(self, payload: Optional[str], only_this_variation: bool, limit: int,
+                          exclude_ids=None, newer_than=None) -> List[Review]:
         """
-        json_feedbacks = self.get_review_data()
-        if not json_feedbacks:
+        Отбирает отзывы из текста ответа feedbacks API.
+        Разбор прекращается, как только набрано limit подходящих отзывов.
+        """
+        if not payload or limit <= 0:
             return []
         
-        if only_this_variation:
-            # Возвращаем отзывы только для конкретного варианта товара (по артикулу)
-            feedbacks = [
-                {
-                    "text": feedback.get("text", ""),
-                    "pros": feedback.get("pros", ""),
-                    "cons": feedback.get("cons", "")
-                } 
-                for feedback in json_feedbacks["feedbacks"]
-                if str(feedback.get("nmId")) == self.sku
-            ]
+        feedbacks = []
+        try:
+            for feedback in WbReview.iter_feedbacks(payload):
+                # Если only_this_variation, возвращаем отзывы только для конкретного варианта товара (по артикулу)
+                if only_this_variation and str(feedback.get("nmId")) != self.sku:
+                    continue
+                if exclude_ids and feedback.get("id") in exclude_ids:
+                    continue
+                # Даты в формате ISO 8601 сравниваются как строки
+                if newer_than and (feedback.get("createdDate") or "") <= newer_than:
+                    continue
+                feedbacks.append(Review.from_feedback(feedback))
+                if len(feedbacks) >= limit:
+                    break
+        except ValueError as e:
+            print(f"Ошибка при разборе отзывов: {e}")
+        
+        return feedbacks
+
+
+class AsyncWbReview:
+    """
+    Асинхронный вариант WbReview на aiohttp.
+    Экземпляры внутри блока session_scope используют общий пул соединений (ClientSession);
+    в режиме NAME_SOURCE = "page" страница товара и card.wb.ru запрашиваются одновременно.
+    
+    Экземпляр создается через ``await AsyncWbReview.create(string)`` внутри session_scope;
+    parse_many загружает несколько товаров сразу.
+    """
+    
+    # Сессия текущего блока session_scope; задачи asyncio наследуют ее вместе с контекстом
+    _session_var: "contextvars.ContextVar[Optional[aiohttp.ClientSession]]" = contextvars.ContextVar(
+        "wb_aiohttp_session", default=None
+    )
+    
+    # Ограничения пула соединений общей сессии
+    CONNECTION_LIMIT = 100
+    CONNECTION_LIMIT_PER_HOST = 20
+    
+    def __init__(self, string: str):
+        self.sku = WbReview.get_sku(string=string)
+        self.product_name = ""
+        self.color = ""
+        self.card_error: Optional[str] = None
+        self.root_id = self.sku
+
+    @classmethod
+    async def create(cls, string: str) -> "AsyncWbReview":
+        """Создает экземпляр и получает root_id, название и цвет товара"""
+        instance = cls(string)
+        instance.root_id = await instance.get_product_info()
+        return instance
+
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def session_scope(cls):
+        """
+        Открывает сессию aiohttp, общую для всех запросов внутри блока, и закрывает ее при выходе.
+        Сессия привязана к циклу событий, поэтому живет не дольше блока:
+        
+            async with AsyncWbReview.session_scope():
+                product = await AsyncWbReview.create(sku)
+        """
+        # aiohttp нужен только асинхронному клиенту, поэтому импортируется при первом обращении
+        import aiohttp
+        
+        connector = aiohttp.TCPConnector(
+            limit=cls.CONNECTION_LIMIT,
+            limit_per_host=cls.CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=WbHttpPool.CONNECT_TIMEOUT,
+            sock_read=WbHttpPool.READ_TIMEOUT,
+        )
+        async with aiohttp.ClientSession(headers=WbReview.HEADERS, connector=connector, timeout=timeout) as session:
+            token = cls._session_var.set(session)
+            try:
+                yield session
+            finally:
+                cls._session_var.reset(token)
+
+    @classmethod
+    def get_session(cls) -> "aiohttp.ClientSession":
+        """Возвращает сессию текущего блока session_scope"""
+        session = cls._session_var.get()
+        if session is None:
+            raise RuntimeError("Запросы AsyncWbReview выполняются внутри блока async with AsyncWbReview.session_scope()")
+        return session
+
+    @classmethod
+    async def parse_many(cls, strings: List[str], only_this_variation=True, limit=300) -> List[Tuple["AsyncWbReview", List[Review]]]:
+        """
+        Загружает данные и отзывы нескольких товаров одновременно в одной сессии, без потока на товар.
+        Возвращает (экземпляр, отзывы) в порядке strings
+        """
+        async def load(string: str) -> Tuple["AsyncWbReview", List[Review]]:
+            instance = await cls.create(string)
+            return instance, await instance.parse(only_this_variation=only_this_variation, limit=limit)
+        
+        async with cls.session_scope():
+            return list(await asyncio.gather(*(load(string) for string in strings)))
+
+    async def get_product_name_from_page(self) -> Optional[str]:
+        """Получает название товара со страницы товара, читая ее до закрытия заголовка"""
+        try:
+            url = WbReview.PRODUCT_PAGE_URL.format(sku=self.sku)
+            with metrics.stage("product_page"):
+                async with self.get_session().get(url) as response:
+                    if response.status != 200:
+                        return None
+                    
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(WbReview.PAGE_CHUNK_SIZE):
+                        buffer.extend(chunk)
+                        if WbReview._html_title_complete(buffer) or len(buffer) >= WbReview.PAGE_MAX_BYTES:
+                            break
+                    html = WbReview._decode_html(buffer, response.charset)
+            return WbReview._extract_title_from_html(html)
+        except Exception:
+            return None
+
+    async def _get_card_product_data(self) -> Dict[str, Any]:
+        """Получает данные товара из card.wb.ru (через общий с WbReview кэш)"""
+        product_data = WbReview.CARD_CACHE.get(self.sku)
+        if product_data is not None:
+            return product_data
+        with metrics.stage("card_api"):
+            async with self.get_session().get(WbReview.CARD_API_URL.format(sku=self.sku)) as response:
+                if response.status != 200:
+                    raise Exception("Не удалось получить данные товара через API")
+                body = await response.read()
+        product_data = WbReview._card_products_by_sku(json.loads(body)).get(self.sku)
+        if product_data is None:
+            raise Exception("Не удалось получить данные товара через API")
+        WbReview.CARD_CACHE.put(self.sku, product_data, len(body))
+        return product_data
+
+    async def get_product_info(self) -> str:
+        """
+        Получение информации о товаре включая root_id, название, бренд и цвет
+        Возвращает root_id товара
+        """
+        if WbReview.NAME_SOURCE == "page":
+            # Страница товара и карточка запрашиваются одновременно
+            page_title, product_data = await asyncio.gather(
+                self.get_product_name_from_page(),
+                self._get_card_product_data(),
+                return_exceptions=True,
+            )
+            if isinstance(page_title, str) and page_title:
+                self.product_name = page_title
         else:
-            # Возвращаем все отзывы для всех вариантов товара
-            feedbacks = [
-                {
-                    "text": feedback.get("text", ""),
-                    "pros": feedback.get("pros", ""),
-                    "cons": feedback.get("cons", "")
-                }
-                for feedback in json_feedbacks["feedbacks"]
-            ]
-        
-        if len(feedbacks) > limit:
-            feedbacks = feedbacks[:limit]
-        
-        return feedbacks
\ No newline at end of file
+            try:
+                product_data = await self._get_card_product_data()
+            except Exception as e:
+                product_data = e
+        
+        try:
+            if isinstance(product_data, BaseException):
+                raise product_data
+            root_id = WbReview._apply_product_data(self, product_data)
+            
+            # В карточке нет названия - берем его со страницы товара
+            if not self.product_name:
+                self.product_name = await self.get_product_name_from_page() or f"Товар {self.sku}"
+            
+            return root_id
+        except Exception as e:
+            if not self.product_name and WbReview.NAME_SOURCE != "page":
+                self.product_name = await self.get_product_name_from_page() or ""
+            return WbReview._product_info_fallback(self, e)
+
+    async def _fetch_feedbacks(self, index: int) -> Tuple[Optional[str], int]:
+        """Запрашивает отзывы у зеркала с номером index и обновляет его оценку"""
+        started = time.perf_counter()
+        payload = None
+        cancelled = False
+        try:
+            url = WbReview.FEEDBACKS_URLS[index].format(root_id=self.root_id)
+            async with self.get_session().get(url) as response:
+                body = await response.read()
+                if response.status == 200:
+                    payload = body.decode("utf-8", errors="replace")
+            return payload, len(body)
+        except asyncio.CancelledError:
+            # Проигравший запрос отменен - это не говорит о качестве зеркала
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                FeedbackMirrors.record(index, time.perf_counter() - started, WbReview._has_feedbacks(payload))
+
+    async def get_review_payload(self) -> Optional[str]:
+        """Текст ответа feedbacks API с опросом зеркал по схеме WbReview.get_review_payload"""
+        cached = WbReview.FEEDBACKS_CACHE.get(self.root_id)
+        if cached is not None:
+            return cached
+        
+        with metrics.stage("feedbacks"):
+            payload, size = await self._load_review_data()
+        if payload is not None:
+            WbReview.FEEDBACKS_CACHE.put(self.root_id, payload, size)
+        return payload
+
+    async def get_review_data(self) -> Optional[Dict[str, Any]]:
+        """Полный разобранный ответ feedbacks API"""
+        payload = await self.get_review_payload()
+        return json.loads(payload) if payload else None
+
+    async def _load_review_data(self) -> Tuple[Optional[str], int]:
+        """Загрузка текста ответа feedbacks API, возвращает (текст, размер ответа)"""
+        pending_mirrors = FeedbackMirrors.ordered(len(WbReview.FEEDBACKS_URLS))
+        first_mirror = pending_mirrors[0]
+        running = {}
+        fallback = (None, 0)
+        
+        try:
+            while pending_mirrors or running:
+                if pending_mirrors:
+                    index = pending_mirrors.pop(0)
+                    running[asyncio.ensure_future(self._fetch_feedbacks(index))] = index
+                    timeout = WbReview.FEEDBACKS_HEDGE_DELAY if pending_mirrors else None
+                else:
+                    timeout = None
+                
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = running.pop(task)
+                    if task.exception() is not None:
+                        continue
+                    payload, size = task.result()
+                    if WbReview._has_feedbacks(payload):
+                        FeedbackMirrors.record_win(index)
+                        if index != first_mirror:
+                            metrics.FEEDBACKS_MIRROR_FALLBACKS.inc()
+                        return payload, size
+                    if payload is not None and fallback[0] is None:
+                        fallback = (payload, size)
+        finally:
+            for task in running:
+                task.cancel()
+        
+        return fallback
+
+    async def parse(self, only_this_variation=True, limit=300, exclude_ids=None, newer_than=None) -> List[Review]:
+        """Парсинг отзывов, аналогичен WbReview.parse"""
+        payload = await self.get_review_payload()
+        with metrics.stage("parse"):
+            return WbReview._select_feedbacks(self, payload, only_this_variation, limit, exclude_ids, newer_than)